@@ -0,0 +1,256 @@
+import logging
+
+import torch
+import torch.nn.functional as F
+from transformers import (
+    DynamicCache,
+    LogitsProcessorList,
+    RepetitionPenaltyLogitsProcessor,
+    TemperatureLogitsWarper,
+    TopKLogitsWarper,
+    TopPLogitsWarper,
+)
+
+logger = logging.getLogger(__name__)
+
+# the generation parameters the batcher applies, the others of the `gen_kwargs` are ignored
+SUPPORTED_GEN_KWARGS = (
+    "max_new_tokens",
+    "min_new_tokens",
+    "do_sample",
+    "temperature",
+    "top_k",
+    "top_p",
+    "repetition_penalty",
+)
+
+
+class Sequence:
+    """
+    A prompt being decoded by the `ContinuousBatcher`.
+    """
+
+    def __init__(self, input_ids, max_new_tokens, min_new_tokens=0, context=None):
+        self.input_ids = input_ids
+        self.max_new_tokens = max_new_tokens
+        self.min_new_tokens = min_new_tokens
+        # anything the caller needs to route the generated text (session, language, ...)
+        self.context = context
+        # legacy format, batch size of 1: the cache of the prefill, until the sequence joins the batched cache
+        self.past_key_values = None
+        self.length = input_ids.shape[1]
+        self.next_token = None
+        self.generated_ids = []
+        self.text = ""
+        # the generated tokens from `prefix_offset` are decoded together, those before `read_offset` are in `text`
+        self.prefix_offset = 0
+        self.read_offset = 0
+        self.finished = False
+
+
+class ContinuousBatcher:
+    """
+    Decodes several sequences together, one token per step. New sequences are prefilled on their own and join
+    the running batch at the next decode step; finished ones leave it right away, so that a long answer never
+    holds back a short one.
+    The running batch shares one KV cache, left-padded to its longest sequence with the padding masked out,
+    which works with any causal LM using position ids. It is only rebuilt when sequences join or leave: between
+    two such steps the cache returned by the model is fed back as it is.
+    Sampling follows `generate`: a temperature of 0 decodes greedily, and `top_k` and `top_p` default to the
+    model's generation config.
+    """
+
+    def __init__(
+        self,
+        model,
+        tokenizer,
+        device,
+        max_batch_size=8,
+        temperature=0.0,
+        do_sample=False,
+        top_k=None,
+        top_p=None,
+        repetition_penalty=1.0,
+    ):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = device
+        self.max_batch_size = max_batch_size
+        self.do_sample = do_sample and temperature > 0
+        self.warpers = LogitsProcessorList()
+        if self.do_sample:
+            top_k = model.generation_config.top_k if top_k is None else top_k
+            top_p = model.generation_config.top_p if top_p is None else top_p
+            if temperature != 1.0:
+                self.warpers.append(TemperatureLogitsWarper(temperature))
+            if top_k:
+                self.warpers.append(TopKLogitsWarper(top_k))
+            if top_p is not None and top_p < 1.0:
+                self.warpers.append(TopPLogitsWarper(top_p))
+        self.repetition_penalty = None
+        if repetition_penalty is not None and repetition_penalty != 1.0:
+            self.repetition_penalty = RepetitionPenaltyLogitsProcessor(repetition_penalty)
+        eos_token_id = model.generation_config.eos_token_id
+        if eos_token_id is None:
+            eos_token_id = tokenizer.eos_token_id
+        self.eos_token_ids = set(eos_token_id if isinstance(eos_token_id, list) else [eos_token_id])
+        self.active = []
+        # the batched cache, its sequences in row order and its length, padding included
+        self.cache = None
+        self.rows = []
+        self.cache_length = 0
+
+    def has_room(self):
+        return len(self.active) < self.max_batch_size
+
+    @torch.no_grad()
+    def add(self, sequence):
+        """
+        Prefills the prompt of `sequence` and schedules it for the next decode step.
+        """
+        sequence.input_ids = sequence.input_ids.to(self.device)
+        outputs = self.model(input_ids=sequence.input_ids, use_cache=True)
+        sequence.past_key_values = self._to_legacy(outputs.past_key_values)
+        sequence.next_token = self._sample(outputs.logits[:, -1, :], [sequence])[0]
+        self.active.append(sequence)
+
+    @torch.no_grad()
+    def step(self):
+        """
+        Appends the pending token of each active sequence and computes the next one in a single forward pass.
+        Returns the `(sequence, new_text)` pairs of this step; finished sequences are retired from the batch.
+        """
+        updates = []
+        for sequence in self.active:
+            updates.append((sequence, self._append(sequence, sequence.next_token)))
+        self.active = [sequence for sequence in self.active if not sequence.finished]
+        if not self.active:
+            self._drop_cache()
+            return updates
+        if self.rows != self.active:
+            self._repack()
+
+        # the left padding of each row stays the same: every row gets one more token per step
+        attention_mask = torch.zeros(
+            (len(self.active), self.cache_length + 1), dtype=torch.long, device=self.device
+        )
+        for i, sequence in enumerate(self.active):
+            attention_mask[i, self.cache_length - sequence.length :] = 1
+        input_ids = torch.tensor(
+            [[sequence.next_token] for sequence in self.active], device=self.device
+        )
+        position_ids = torch.tensor(
+            [[sequence.length] for sequence in self.active], device=self.device
+        )
+
+        outputs = self.model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            past_key_values=self.cache,
+            use_cache=True,
+        )
+        self.cache = outputs.past_key_values
+        if isinstance(self.cache, tuple):
+            self.cache = DynamicCache.from_legacy_cache(self.cache)
+        self.cache_length += 1
+        next_tokens = self._sample(outputs.logits[:, -1, :], self.active)
+        for sequence, next_token in zip(self.active, next_tokens):
+            sequence.length += 1
+            sequence.next_token = next_token
+        return updates
+
+    def cancel(self, predicate):
+        """
+        Retires the active sequences matching `predicate` without decoding them any further.
+        """
+        cancelled = [sequence for sequence in self.active if predicate(sequence)]
+        for sequence in cancelled:
+            sequence.finished = True
+        self.active = [sequence for sequence in self.active if not sequence.finished]
+        if not self.active:
+            self._drop_cache()
+        return cancelled
+
+    def _repack(self):
+        """
+        Rebuilds the batched cache for the active sequences, from the rows of the current one and the prefill
+        caches of the sequences joining it, trimmed to the longest sequence.
+        """
+        batched = self._to_legacy(self.cache) if self.cache is not None else None
+        caches = []
+        for sequence in self.active:
+            if sequence.past_key_values is not None:
+                caches.append(sequence.past_key_values)
+                sequence.past_key_values = None
+                continue
+            row = self.rows.index(sequence)
+            start = self.cache_length - sequence.length
+            caches.append(
+                tuple((key[row : row + 1, :, start:], value[row : row + 1, :, start:]) for key, value in batched)
+            )
+        self.cache_length = max(sequence.length for sequence in self.active)
+        self.cache = DynamicCache.from_legacy_cache(
+            self._pad_and_stack(caches, [self.cache_length - sequence.length for sequence in self.active])
+        )
+        self.rows = list(self.active)
+
+    def _drop_cache(self):
+        self.cache = None
+        self.rows = []
+        self.cache_length = 0
+
+    def _append(self, sequence, token):
+        if token in self.eos_token_ids:
+            sequence.finished = True
+            return ""
+        sequence.generated_ids.append(token)
+        if len(sequence.generated_ids) >= sequence.max_new_tokens:
+            sequence.finished = True
+        # only the last tokens are decoded, along with the ones before them to get the spaces right
+        prefix_text = self.tokenizer.decode(
+            sequence.generated_ids[sequence.prefix_offset : sequence.read_offset], skip_special_tokens=True
+        )
+        text = self.tokenizer.decode(
+            sequence.generated_ids[sequence.prefix_offset :], skip_special_tokens=True
+        )
+        if len(text) <= len(prefix_text) or (text.endswith("\ufffd") and not sequence.finished):
+            # nothing printable yet, e.g. an incomplete multi-bytes character: wait for the next token
+            return ""
+        new_text = text[len(prefix_text) :]
+        sequence.prefix_offset = sequence.read_offset
+        sequence.read_offset = len(sequence.generated_ids)
+        sequence.text += new_text
+        return new_text
+
+    def _sample(self, logits, sequences):
+        logits = logits.float()
+        for i, sequence in enumerate(sequences):
+            if self.repetition_penalty is not None:
+                ids = torch.tensor(sequence.generated_ids, dtype=torch.long, device=logits.device)
+                ids = torch.cat([sequence.input_ids[0].to(logits.device), ids])[None]
+                logits[i : i + 1] = self.repetition_penalty(ids, logits[i : i + 1])
+            if len(sequence.generated_ids) < sequence.min_new_tokens:
+                logits[i, list(self.eos_token_ids)] = -float("inf")
+        if self.do_sample:
+            # the warpers only read the scores
+            probs = torch.softmax(self.warpers(None, logits), dim=-1)
+            next_tokens = torch.multinomial(probs, num_samples=1).squeeze(-1)
+        else:
+            next_tokens = logits.argmax(dim=-1)
+        return next_tokens.tolist()
+
+    @staticmethod
+    def _to_legacy(past_key_values):
+        if hasattr(past_key_values, "to_legacy_cache"):
+            return past_key_values.to_legacy_cache()
+        return past_key_values
+
+    @staticmethod
+    def _pad_and_stack(caches, paddings):
+        stacked = []
+        for layer in zip(*caches):
+            keys = [F.pad(key, (0, 0, padding, 0)) for (key, _), padding in zip(layer, paddings)]
+            values = [F.pad(value, (0, 0, padding, 0)) for (_, value), padding in zip(layer, paddings)]
+            stacked.append((torch.cat(keys), torch.cat(values)))
+        return tuple(stacked)
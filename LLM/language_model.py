@@ -1,4 +1,7 @@
+from functools import partial
+from queue import Empty
 from threading import Thread
+from time import perf_counter
 from transformers import (
     AutoModelForCausalLM,
     AutoTokenizer,
@@ -8,7 +11,12 @@ from transformers import (
 import torch
 
 from LLM.chat import Chat
+from LLM.continuous_batching import SUPPORTED_GEN_KWARGS, ContinuousBatcher, Sequence
 from baseHandler import BaseHandler
+from utils.cancellation import cancellation_criteria
+from utils.envelope import END, Control, is_end
+from utils.pipeline_queue import Handoff
+from utils.utils import ensure_nltk_data
 from rich.console import Console
 import logging
 from nltk import sent_tokenize
@@ -49,10 +57,13 @@ class LanguageModelHandler(BaseHandler):
         chat_size=1,
         init_chat_role=None,
         init_chat_prompt="You are a helpful AI assistant.",
+        max_batch_size=1,
     ):
         # 使用局部logger变量
         log = logging.getLogger(__name__)
         log.info(f"Setting up LanguageModelHandler with model {model_name}")
+        # the answers are split in sentences with NLTK
+        ensure_nltk_data("tokenizers/punkt_tab")
         
         self.device = device
         self.torch_dtype = getattr(torch, torch_dtype)
@@ -75,17 +86,49 @@ class LanguageModelHandler(BaseHandler):
             **gen_kwargs,
         }
 
-        self.chat = Chat(chat_size)
-        if init_chat_role:
-            if not init_chat_prompt:
-                raise ValueError(
-                    "An initial promt needs to be specified when setting init_chat_role."
-                )
-            self.chat.init_chat({"role": init_chat_role, "content": init_chat_prompt})
+        if init_chat_role and not init_chat_prompt:
+            raise ValueError(
+                "An initial promt needs to be specified when setting init_chat_role."
+            )
+        self.chat_size = chat_size
+        self.init_chat_role = init_chat_role
+        self.init_chat_prompt = init_chat_prompt
         self.user_role = user_role
 
+        self.max_batch_size = max_batch_size
+        self.batcher = None
+        if max_batch_size > 1:
+            ignored = sorted(set(gen_kwargs) - set(SUPPORTED_GEN_KWARGS))
+            if ignored:
+                log.warning(
+                    f"Continuous batching only supports the generation parameters {SUPPORTED_GEN_KWARGS}, "
+                    f"ignoring {ignored}"
+                )
+            self.batcher = ContinuousBatcher(
+                self.model,
+                self.tokenizer,
+                device,
+                max_batch_size=max_batch_size,
+                temperature=gen_kwargs.get("temperature", 0.0),
+                do_sample=gen_kwargs.get("do_sample", False),
+                top_k=gen_kwargs.get("top_k"),
+                top_p=gen_kwargs.get("top_p"),
+                repetition_penalty=gen_kwargs.get("repetition_penalty", 1.0),
+            )
+
         self.warmup()
 
+    def new_chat(self):
+        chat = Chat(self.chat_size)
+        if self.init_chat_role:
+            chat.init_chat({"role": self.init_chat_role, "content": self.init_chat_prompt})
+        return chat
+
+    @property
+    def chat(self):
+        # the chat history is kept per session, the model is shared
+        return self.session_state("chat", self.new_chat)
+
     def warmup(self):
         # 使用局部logger变量
         log = logging.getLogger(__name__)
@@ -123,11 +166,10 @@ class LanguageModelHandler(BaseHandler):
                 f"{self.__class__.__name__}:  warmed up! time: {start_event.elapsed_time(end_event) * 1e-3:.3f} s"
             )
 
-    def process(self, prompt):
-        # 使用局部logger变量
-        log = logging.getLogger(__name__)
-        log.debug("infering language model...")
-        
+    def prepare_prompt(self, prompt):
+        """
+        Appends the user prompt to the chat of the current session and returns the language of the answer.
+        """
         language_code = None
         if isinstance(prompt, tuple):
             prompt, language_code = prompt
@@ -136,27 +178,216 @@ class LanguageModelHandler(BaseHandler):
                 prompt = f"Please reply to my message in {WHISPER_LANGUAGE_TO_LLM_LANGUAGE[language_code]}. " + prompt
 
         self.chat.append({"role": self.user_role, "content": prompt})
+        return language_code
+
+    def process(self, prompt):
+        # 使用局部logger变量
+        log = logging.getLogger(__name__)
+        log.debug("infering language model...")
+        
+        language_code = self.prepare_prompt(prompt)
+        # stops the generation as soon as the user barges in
+        is_cancelled = self.cancellation()
+        gen_kwargs = {
+            **self.gen_kwargs,
+            "stopping_criteria": cancellation_criteria(is_cancelled),
+        }
         thread = Thread(
-            target=self.pipe, args=(self.chat.to_list(),), kwargs=self.gen_kwargs
+            target=self.pipe, args=(self.chat.to_list(),), kwargs=gen_kwargs
         )
         thread.start()
-        if self.device == "mps":
-            generated_text = ""
-            for new_text in self.streamer:
-                generated_text += new_text
-            printable_text = generated_text
-            torch.mps.empty_cache()
-        else:
-            generated_text, printable_text = "", ""
-            for new_text in self.streamer:
+        generated_text, printable_text = "", ""
+        streamed = False
+        try:
+            if self.device == "mps":
+                for new_text in self.streamer:
+                    if new_text and not generated_text:
+                        self.notify("first_token")
+                    generated_text += new_text
+                printable_text = generated_text
+                torch.mps.empty_cache()
+            else:
+                for new_text in self.streamer:
+                    if new_text and not generated_text:
+                        self.notify("first_token")
+                    generated_text += new_text
+                    printable_text += new_text
+                    sentences = sent_tokenize(printable_text)
+                    if len(sentences) > 1:
+                        yield (sentences[0], language_code)
+                        printable_text = new_text
+            streamed = True
+        finally:
+            if not streamed and is_cancelled():
+                # interrupted turn: the streamer is shared by all the calls, let the cancelled generation
+                # flush it so that its end does not leak into the next answer
+                for _ in self.streamer:
+                    pass
+                self.chat.append({"role": "assistant", "content": generated_text})
+
+        self.chat.append({"role": "assistant", "content": generated_text})
+
+        # don't forget last sentence
+        yield (printable_text, language_code)
+
+    async def process_async(self, prompt):
+        """
+        `process` for the asyncio execution (see AsyncBaseHandler): the generation runs in the executor of the
+        handler and streams its text to the event loop through its own AsyncTextIteratorStreamer.
+        """
+        from transformers import AsyncTextIteratorStreamer
+
+        language_code = self.prepare_prompt(prompt)
+        chat = self.chat
+        streamer = AsyncTextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        gen_kwargs = {
+            **self.gen_kwargs,
+            "streamer": streamer,
+            # stops the generation as soon as the user barges in
+            "stopping_criteria": cancellation_criteria(self.cancellation()),
+        }
+        generated_text, printable_text = "", ""
+        try:
+            async for new_text in self.stream(partial(self.pipe, chat.to_list(), **gen_kwargs), streamer):
+                if new_text and not generated_text:
+                    self.notify("first_token")
                 generated_text += new_text
                 printable_text += new_text
                 sentences = sent_tokenize(printable_text)
                 if len(sentences) > 1:
                     yield (sentences[0], language_code)
                     printable_text = new_text
-
-        self.chat.append({"role": "assistant", "content": generated_text})
+        finally:
+            # also when interrupted, to keep the chat consistent with what the user heard before barging in
+            chat.append({"role": "assistant", "content": generated_text})
 
         # don't forget last sentence
         yield (printable_text, language_code)
+
+    def run(self):
+        if self.batcher is None:
+            return super().run()
+
+        # `AsyncBaseHandler.run_async` does not go through this loop: with --execution asyncio, prompts are
+        # generated one at a time
+        # continuous batching: prompts are admitted between two decode steps and every sequence streams its
+        # sentences as soon as they are complete
+        end = False
+        while not self.stop_event.is_set():
+            while not end and self.batcher.has_room():
+                try:
+                    # only block when there is nothing to decode
+                    input = self.queue_in.get(block=not self.batcher.active)
+                except Empty:
+                    break
+                if is_end(input) or isinstance(input, Handoff):
+                    # the sequences already admitted are finished first
+                    end = input
+                    break
+                if isinstance(input, Control):
+                    if self.control(input):
+                        self.put_output(input)
+                    continue
+                self.metrics.observe_input(self.queue_wait())
+                # `active` is the list the batcher appends to: whether it was empty is read before admitting
+                was_idle = not self.batcher.active
+                if self.admit(input) and was_idle:
+                    self.notify("batch_start")
+
+            if not self.batcher.active:
+                if isinstance(end, Handoff):
+                    return self.hand_over(end)
+                if end:
+                    break
+                continue
+
+            for sequence in self.batcher.cancel(self.interrupted):
+                # keep the chat consistent with what the user heard before barging in
+                self.session = sequence.context["session"]
+                self.chat.append({"role": "assistant", "content": sequence.text})
+                if self.deadlines.expired(sequence.context["envelope"]):
+                    self.expire(self.session)
+            if not self.batcher.active:
+                self.notify("batch_end")
+                continue
+
+            start_time = perf_counter()
+            for sequence, new_text in self.batcher.step():
+                for output in self.stream_sentences(sequence, new_text):
+                    self.record_time(perf_counter() - start_time)
+                    if self.interrupted(sequence):
+                        start_time = perf_counter()
+                        continue
+                    output = self.wrap_output(
+                        output, sequence.context["envelope"], sequence.context["session_id"]
+                    )
+                    self.put_output(output)
+                    start_time = perf_counter()
+            if not self.batcher.active:
+                self.notify("batch_end")
+
+        # the pipeline stopped: the unfinished sequences are dropped, so that the handler can be reused
+        self.batcher.cancel(lambda sequence: True)
+        self.cleanup()
+        self.queue_out.put(END)
+
+    def admit(self, input):
+        """
+        Adds the prompt to the batch, unless its turn was interrupted or its deadline has passed. Returns whether
+        it was added.
+        """
+        session_ids, inputs = self.unpack_batch([input])
+        if not inputs:
+            return False
+        session_id, input = session_ids[0], inputs[0]
+        self.session = self.batch_sessions[0]
+        envelope = self.batch_envelopes[0]
+        logging.getLogger(__name__).debug("infering language model...")
+
+        language_code = self.prepare_prompt(input)
+        input_ids = self.tokenizer.apply_chat_template(
+            self.chat.to_list(), add_generation_prompt=True, return_tensors="pt"
+        )
+        self.batcher.add(
+            Sequence(
+                input_ids,
+                max_new_tokens=self.gen_kwargs["max_new_tokens"],
+                min_new_tokens=self.gen_kwargs.get("min_new_tokens", 0),
+                context={
+                    "session_id": session_id,
+                    "session": self.session,
+                    "turn": self.session.turn,
+                    "language_code": language_code,
+                    "printable_text": "",
+                    "first_token": False,
+                    "envelope": envelope,
+                },
+            )
+        )
+        return True
+
+    def interrupted(self, sequence):
+        context = sequence.context
+        return context["session"].turn != context["turn"] or self.deadlines.expired(context["envelope"])
+
+    def stream_sentences(self, sequence, new_text):
+        """
+        Same sentence splitting as `process`, applied to the text streamed by one sequence of the batch.
+        """
+        context = sequence.context
+        language_code = context["language_code"]
+        if new_text:
+            if not context["first_token"]:
+                context["first_token"] = True
+                self.notify("first_token")
+            context["printable_text"] += new_text
+            sentences = sent_tokenize(context["printable_text"])
+            if len(sentences) > 1:
+                yield (sentences[0], language_code)
+                context["printable_text"] = new_text
+
+        if sequence.finished:
+            self.session = context["session"]
+            self.chat.append({"role": "assistant", "content": sequence.text})
+            # don't forget last sentence
+            yield (context["printable_text"], language_code)
@@ -44,17 +44,28 @@ class MLXLanguageModelHandler(BaseHandler):
         self.model, self.tokenizer = load(self.model_name)
         self.gen_kwargs = gen_kwargs
 
-        self.chat = Chat(chat_size)
-        if init_chat_role:
-            if not init_chat_prompt:
-                raise ValueError(
-                    "An initial promt needs to be specified when setting init_chat_role."
-                )
-            self.chat.init_chat({"role": init_chat_role, "content": init_chat_prompt})
+        if init_chat_role and not init_chat_prompt:
+            raise ValueError(
+                "An initial promt needs to be specified when setting init_chat_role."
+            )
+        self.chat_size = chat_size
+        self.init_chat_role = init_chat_role
+        self.init_chat_prompt = init_chat_prompt
         self.user_role = user_role
 
         self.warmup()
 
+    def new_chat(self):
+        chat = Chat(self.chat_size)
+        if self.init_chat_role:
+            chat.init_chat({"role": self.init_chat_role, "content": self.init_chat_prompt})
+        return chat
+
+    @property
+    def chat(self):
+        # the chat history is kept per session, the model is shared
+        return self.session_state("chat", self.new_chat)
+
     def warmup(self):
         logger.info(f"Warming up {self.__class__.__name__}")
 
@@ -104,6 +115,8 @@ class MLXLanguageModelHandler(BaseHandler):
             prompt,
             max_tokens=self.gen_kwargs["max_new_tokens"],
         ):
+            if t.text and not output:
+                self.notify("first_token")
             output += t.text
             curr_output += t.text
             if curr_output.endswith((".", "?", "!", "<|end|>")):
@@ -7,6 +7,7 @@ from openai import OpenAI
 
 from baseHandler import BaseHandler
 from LLM.chat import Chat
+from utils.utils import ensure_nltk_data
 
 logger = logging.getLogger(__name__)
 
@@ -38,19 +39,32 @@ class OpenApiModelHandler(BaseHandler):
         init_chat_role="system",
         init_chat_prompt="You are a helpful AI assistant.",
     ):
+        # the streamed answers are split in sentences with NLTK
+        ensure_nltk_data("tokenizers/punkt_tab")
         self.model_name = model_name
         self.stream = stream
-        self.chat = Chat(chat_size)
-        if init_chat_role:
-            if not init_chat_prompt:
-                raise ValueError(
-                    "An initial promt needs to be specified when setting init_chat_role."
-                )
-            self.chat.init_chat({"role": init_chat_role, "content": init_chat_prompt})
+        if init_chat_role and not init_chat_prompt:
+            raise ValueError(
+                "An initial promt needs to be specified when setting init_chat_role."
+            )
+        self.chat_size = chat_size
+        self.init_chat_role = init_chat_role
+        self.init_chat_prompt = init_chat_prompt
         self.user_role = user_role
         self.client = OpenAI(api_key=api_key, base_url=base_url)
         self.warmup()
 
+    def new_chat(self):
+        chat = Chat(self.chat_size)
+        if self.init_chat_role:
+            chat.init_chat({"role": self.init_chat_role, "content": self.init_chat_prompt})
+        return chat
+
+    @property
+    def chat(self):
+        # the chat history is kept per session, the model is shared
+        return self.session_state("chat", self.new_chat)
+
     def warmup(self):
         logger.info(f"Warming up {self.__class__.__name__}")
         start = time.time()
@@ -88,6 +102,8 @@ class OpenApiModelHandler(BaseHandler):
                 generated_text, printable_text = "", ""
                 for chunk in response:
                     new_text = chunk.choices[0].delta.content or ""
+                    if new_text and not generated_text:
+                        self.notify("first_token")
                     generated_text += new_text
                     printable_text += new_text
                     sentences = sent_tokenize(printable_text)
@@ -99,6 +115,7 @@ class OpenApiModelHandler(BaseHandler):
                 yield printable_text, language_code
             else:
                 generated_text = response.choices[0].message.content
+                self.notify("first_token")
                 self.chat.append({"role": "assistant", "content": generated_text})
                 yield generated_text, language_code
 
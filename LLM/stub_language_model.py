@@ -0,0 +1,51 @@
+import logging
+import time
+
+from baseHandler import BaseHandler
+
+logger = logging.getLogger(__name__)
+
+
+class StubLanguageModelHandler(BaseHandler):
+    """
+    Stands in for a language model, to measure the pipeline without loading one: "streams" the words of
+    `response` as tokens, the first after `first_token_ms` and the next ones at `tokens_per_s`, and yields each
+    sentence once its last word is out, as the streaming handlers do. Deterministic, no model needed.
+    """
+
+    def setup(
+        self,
+        first_token_ms=100,
+        tokens_per_s=50.0,
+        response="It is sunny and warm today. A light breeze comes from the west. Enjoy your day!",
+        language="en",
+        gen_kwargs={},  # Unused
+    ):
+        self.first_token_ms = first_token_ms
+        self.tokens_per_s = tokens_per_s
+        self.tokens = response.split()
+        self.language = language
+
+    def process(self, prompt):
+        language_code = self.language
+        if isinstance(prompt, tuple):
+            prompt, language_code = prompt
+            language_code = language_code.removesuffix("-auto")
+        logger.debug(f"USER: {prompt}")
+
+        is_cancelled = self.cancellation()
+        token_time = self.first_token_ms / 1000
+        next_time = time.perf_counter()
+        sentence = []
+        for index, token in enumerate(self.tokens):
+            next_time += token_time
+            time.sleep(max(0.0, next_time - time.perf_counter()))
+            if is_cancelled():
+                return
+            if index == 0:
+                self.notify("first_token")
+            token_time = 1 / self.tokens_per_s if self.tokens_per_s > 0 else 0
+            sentence.append(token)
+            if token.endswith((".", "!", "?")) or index == len(self.tokens) - 1:
+                yield (" ".join(sentence), language_code)
+                sentence = []
@@ -1,6 +1,5 @@
 import logging
 import os
-from time import perf_counter
 
 from faster_whisper import WhisperModel
 from rich.console import Console
@@ -17,13 +16,21 @@ class FasterWhisperSTTHandler(BaseHandler):
     Handles the Speech To Text generation using a Whisper model.
     """
 
+    audio_side = "input"
+
     def setup(
         self,
         model_name: str = "tiny.en",
         device: str = "auto",
         compute_type: str = "auto",
+        max_batch_size: int = 1,
+        max_batch_wait_ms: int = 0,
         gen_kwargs={},
     ):
+        # CTranslate2 transcribes one utterance per call: batches collected across sessions are processed
+        # back to back, which still saves the queue round trips between them
+        self.max_batch_size = max_batch_size
+        self.max_batch_wait_ms = max_batch_wait_ms
         self.gen_kwargs = self.adapt_gen_kwargs(gen_kwargs)
 
         os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
@@ -32,9 +39,6 @@ class FasterWhisperSTTHandler(BaseHandler):
     def process(self, audio):
         logger.debug("infering faster whisper...")
 
-        global pipeline_start
-        pipeline_start = perf_counter()
-
         segments, info = self.model.transcribe(audio, **self.gen_kwargs)
         output_text = []
 
@@ -54,11 +58,12 @@ class FasterWhisperSTTHandler(BaseHandler):
         else:
             logger.debug("no text detected. skipping...")
 
-    def cleanup(self):
-        print("Stopping FasterWhisperSTTHandler")
+    def release(self):
+        logger.info("Releasing FasterWhisperSTTHandler")
         del self.model
 
     def adapt_gen_kwargs(self, gen_kwargs: dict):
+        gen_kwargs = dict(gen_kwargs)
         gen_kwargs["without_timestamps"] = not gen_kwargs.pop("return_timestamps", True)
 
         return gen_kwargs
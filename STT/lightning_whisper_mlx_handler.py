@@ -1,5 +1,4 @@
 import logging
-from time import perf_counter
 from baseHandler import BaseHandler
 from lightning_whisper_mlx import LightningWhisperMLX
 import numpy as np
@@ -32,6 +31,8 @@ class LightningWhisperSTTHandler(BaseHandler):
     Handles the Speech To Text generation using a Whisper model.
     """
 
+    audio_side = "input"
+
     def setup(
         self,
         model_name="distil-large-v3",
@@ -39,11 +40,15 @@ class LightningWhisperSTTHandler(BaseHandler):
         torch_dtype="float16",
         compile_mode=None,
         language=None,
+        max_batch_size=1,
+        max_batch_wait_ms=0,
         gen_kwargs={},
     ):
         if len(model_name.split("/")) > 1:
             model_name = model_name.split("/")[-1]
         self.device = device
+        self.max_batch_size = max_batch_size
+        self.max_batch_wait_ms = max_batch_wait_ms
         self.model = LightningWhisperMLX(model=model_name, batch_size=6, quant=None)
         self.start_language = language
         self.last_language = language
@@ -63,9 +68,6 @@ class LightningWhisperSTTHandler(BaseHandler):
     def process(self, spoken_prompt):
         logger.debug("infering whisper...")
 
-        global pipeline_start
-        pipeline_start = perf_counter()
-
         if self.start_language != 'auto':
             transcription_dict = self.model.transcribe(spoken_prompt, language=self.start_language)
         else:
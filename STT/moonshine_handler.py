@@ -1,7 +1,6 @@
 import os
 os.environ['KERAS_BACKEND'] = 'torch'
 
-from time import perf_counter
 import moonshine
 import torch
 from baseHandler import BaseHandler
@@ -17,6 +16,8 @@ class MoonshineSTTHandler(BaseHandler):
     Handles the Speech To Text generation using a Moonshine model.
     """
 
+    audio_side = "input"
+
     def setup(
         self,
         model_name="moonshine/base",
@@ -60,9 +61,6 @@ class MoonshineSTTHandler(BaseHandler):
     def process(self, spoken_prompt):
         logger.debug("infering moonshine...")
 
-        global pipeline_start
-        pipeline_start = perf_counter()
-
         pred_ids = self.model.generate(spoken_prompt[None, :])
         pred_text = self.tokenizer.decode_batch(pred_ids)[0]
 
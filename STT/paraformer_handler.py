@@ -1,5 +1,4 @@
 import logging
-from time import perf_counter
 
 from baseHandler import BaseHandler
 from funasr import AutoModel
@@ -22,16 +21,22 @@ class ParaformerSTTHandler(BaseHandler):
     This model was contributed by @wuhongsheng.
     """
 
+    audio_side = "input"
+
     def setup(
         self,
         model_name="paraformer-zh",
         device="cuda",
+        max_batch_size=1,
+        max_batch_wait_ms=0,
         gen_kwargs={},
     ):
         print(model_name)
         if len(model_name.split("/")) > 1:
             model_name = model_name.split("/")[-1]
         self.device = device
+        self.max_batch_size = max_batch_size
+        self.max_batch_wait_ms = max_batch_wait_ms
         self.model = AutoModel(model=model_name, device=device)
         self.warmup()
 
@@ -47,9 +52,6 @@ class ParaformerSTTHandler(BaseHandler):
     def process(self, spoken_prompt):
         logger.debug("infering paraformer...")
 
-        global pipeline_start
-        pipeline_start = perf_counter()
-
         pred_text = (
             self.model.generate(spoken_prompt)[0]["text"].strip().replace(" ", "")
         )
@@ -59,3 +61,25 @@ class ParaformerSTTHandler(BaseHandler):
         console.print(f"[yellow]USER: {pred_text}")
 
         yield pred_text
+
+    def process_batch(self, spoken_prompts):
+        """
+        Transcribes the utterances of several sessions with a single call to `generate`.
+        """
+        if len(spoken_prompts) == 1:
+            for output in self.process(spoken_prompts[0]):
+                yield 0, output
+            return
+
+        logger.debug(f"infering paraformer on a batch of {len(spoken_prompts)}...")
+
+        results = self.model.generate(
+            input=list(spoken_prompts), batch_size=len(spoken_prompts)
+        )
+        torch.mps.empty_cache()
+
+        logger.debug("finished paraformer inference")
+        for index, result in enumerate(results):
+            pred_text = result["text"].strip().replace(" ", "")
+            console.print(f"[yellow]USER: {pred_text}")
+            yield index, pred_text
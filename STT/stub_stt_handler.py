@@ -0,0 +1,36 @@
+import logging
+import time
+
+from baseHandler import BaseHandler
+from utils.utils import audio_duration
+
+logger = logging.getLogger(__name__)
+
+
+class StubSTTHandler(BaseHandler):
+    """
+    Stands in for a Speech To Text model, to measure the pipeline without loading one: waits `latency_ms` plus
+    `ms_per_audio_second` for each second of the utterance, then returns `text`. Deterministic, no model needed.
+    """
+
+    audio_side = "input"
+
+    def setup(
+        self,
+        latency_ms=50,
+        ms_per_audio_second=10,
+        text="What is the weather like today?",
+        language="en",
+        gen_kwargs={},  # Unused
+    ):
+        self.latency_ms = latency_ms
+        self.ms_per_audio_second = ms_per_audio_second
+        self.text = text
+        self.language = language
+
+    def process(self, spoken_prompt):
+        delay_ms = self.latency_ms + self.ms_per_audio_second * audio_duration(spoken_prompt)
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000)
+        logger.debug(f"USER: {self.text}")
+        yield (self.text, self.language)
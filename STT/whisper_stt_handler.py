@@ -1,4 +1,3 @@
-from time import perf_counter
 from transformers import (
     AutoProcessor,
     AutoModelForSpeechSeq2Seq
@@ -6,6 +5,9 @@ from transformers import (
 import torch
 from copy import copy
 from baseHandler import BaseHandler
+from utils.cancellation import step_limit_criteria
+from utils.compile_cache import CompileCache
+from utils.utils import batch_bucket, batch_buckets
 from rich.console import Console
 import logging
 
@@ -34,6 +36,8 @@ class WhisperSTTHandler(BaseHandler):
     Handles the Speech To Text generation using a Whisper model.
     """
 
+    audio_side = "input"
+
     def setup(
         self,
         model_name="distil-whisper/distil-large-v3",
@@ -41,6 +45,8 @@ class WhisperSTTHandler(BaseHandler):
         torch_dtype="float16",
         compile_mode=None,
         language=None,
+        max_batch_size=1,
+        max_batch_wait_ms=0,
         gen_kwargs={},
     ):
         # 使用类变量而非全局变量
@@ -50,7 +56,10 @@ class WhisperSTTHandler(BaseHandler):
         self.device = device
         self.torch_dtype = getattr(torch, torch_dtype)
         self.compile_mode = compile_mode
-        self.gen_kwargs = gen_kwargs
+        self.max_batch_size = max_batch_size
+        self.max_batch_wait_ms = max_batch_wait_ms
+        # a copy: the language is added to it below
+        self.gen_kwargs = dict(gen_kwargs)
         self.start_language = language
         self.last_language = language if language != "auto" else None
         if self.last_language is not None:
@@ -64,6 +73,15 @@ class WhisperSTTHandler(BaseHandler):
 
         # compile
         if self.compile_mode:
+            self.compile_cache = CompileCache(
+                "whisper",
+                model_name=model_name,
+                torch_dtype=torch_dtype,
+                compile_mode=compile_mode,
+                device=device,
+                gen_kwargs=self.gen_kwargs,
+            )
+            self.compile_cache.load()
             self.model.generation_config.cache_implementation = "static"
             self.model.forward = torch.compile(
                 self.model.forward, mode=self.compile_mode, fullgraph=True
@@ -91,16 +109,17 @@ class WhisperSTTHandler(BaseHandler):
 
         # 2 warmup steps for no compile or compile mode with CUDA graphs capture
         n_steps = 1 if self.compile_mode == "default" else 2
-        dummy_input = torch.randn(
-            (1, self.model.config.num_mel_bins, 3000),
-            dtype=self.torch_dtype,
-            device=self.device,
-        )
-        dummy_attention_mask = torch.ones(
-            1, 3000, dtype=torch.long, device=self.device
-        )
-        
-        if self.compile_mode not in (None, "default"):
+        # compiled, batches are padded to one of the `batch_buckets`, each warmed up
+        batch_sizes = batch_buckets(self.max_batch_size) if self.compile_mode else [1]
+        shapes = [f"{batch_size}x3000" for batch_size in batch_sizes]
+        cached = bool(self.compile_mode) and self.compile_cache.valid(shapes)
+        # the compiled graphs are loaded from the cache by a generation stopped after the first decoding step,
+        # unless CUDA graphs have to be captured
+        short = cached and self.compile_cache.short_warmup(shapes)
+        if short:
+            n_steps = 1
+            warmup_gen_kwargs = self.gen_kwargs
+        elif self.compile_mode not in (None, "default"):
             # generating more tokens than previously will trigger CUDA graphs capture
             # one should warmup with a number of generated tokens above max tokens targeted for subsequent generation
             # hence, having min_new_tokens < max_new_tokens in the future doesn't make sense
@@ -120,12 +139,24 @@ class WhisperSTTHandler(BaseHandler):
             torch.cuda.synchronize()
             start_event.record()
 
-        for _ in range(n_steps):
-            _ = self.model.generate(
-                input_features=dummy_input, 
-                attention_mask=dummy_attention_mask,
-                **warmup_gen_kwargs
+        for batch_size in batch_sizes:
+            dummy_input = torch.randn(
+                (batch_size, self.model.config.num_mel_bins, 3000),
+                dtype=self.torch_dtype,
+                device=self.device,
             )
+            dummy_attention_mask = torch.ones(
+                batch_size, 3000, dtype=torch.long, device=self.device
+            )
+            for _ in range(n_steps):
+                _ = self.model.generate(
+                    input_features=dummy_input,
+                    attention_mask=dummy_attention_mask,
+                    stopping_criteria=step_limit_criteria(2) if short else None,
+                    **warmup_gen_kwargs
+                )
+        if self.compile_mode and not cached:
+            self.compile_cache.save(shapes)
 
         if self.device == "cuda":
             end_event.record()
@@ -140,9 +171,6 @@ class WhisperSTTHandler(BaseHandler):
         log = logging.getLogger(__name__)
         log.debug("infering whisper...")
 
-        global pipeline_start
-        pipeline_start = perf_counter()
-
         model_inputs = self.prepare_model_inputs(spoken_prompt)
         pred_ids = self.model.generate(**model_inputs, **self.gen_kwargs)
         language_code = self.processor.tokenizer.decode(pred_ids[0, 1])[2:-2]  # remove "<|" and "|>"
@@ -155,11 +183,46 @@ class WhisperSTTHandler(BaseHandler):
             pred_ids = self.model.generate(**model_inputs, **gen_kwargs)
         else:
             self.last_language = language_code
-        
-        pred_text = self.processor.batch_decode(
+
+        yield self.decode(pred_ids[0])
+
+    def process_batch(self, spoken_prompts):
+        """
+        Transcribes the utterances of several sessions with a single call to `generate`.
+        """
+        if len(spoken_prompts) == 1:
+            for output in self.process(spoken_prompts[0]):
+                yield 0, output
+            return
+
+        log = logging.getLogger(__name__)
+        log.debug(f"infering whisper on a batch of {len(spoken_prompts)}...")
+
+        spoken_prompts = list(spoken_prompts)
+        batch = spoken_prompts
+        if self.compile_mode:
+            # only the warmed up batch sizes are run: the extra rows repeat the last utterance
+            batch = batch + batch[-1:] * (batch_bucket(len(batch), self.max_batch_size) - len(batch))
+        model_inputs = self.prepare_model_inputs(batch)
+        pred_ids = self.model.generate(**model_inputs, **self.gen_kwargs)
+
+        for index, spoken_prompt in enumerate(spoken_prompts):
+            language_code = self.processor.tokenizer.decode(pred_ids[index, 1])[2:-2]  # remove "<|" and "|>"
+            if language_code not in SUPPORTED_LANGUAGES:
+                # rare enough to be reprocessed on its own, with the last language
+                for output in self.process(spoken_prompt):
+                    yield index, output
+                continue
+            self.last_language = language_code
+            yield index, self.decode(pred_ids[index])
+
+    def decode(self, pred_ids):
+        log = logging.getLogger(__name__)
+
+        pred_text = self.processor.tokenizer.decode(
             pred_ids, skip_special_tokens=True, decode_with_timestamps=False
-        )[0]
-        language_code = self.processor.tokenizer.decode(pred_ids[0, 1])[2:-2] # remove "<|" and "|>"
+        )
+        language_code = self.processor.tokenizer.decode(pred_ids[1])[2:-2] # remove "<|" and "|>"
 
         log.debug("finished whisper inference")
         console.print(f"[yellow]USER: {pred_text}")
@@ -167,5 +230,5 @@ class WhisperSTTHandler(BaseHandler):
 
         if self.start_language == "auto":
             language_code += "-auto"
-            
-        yield (pred_text, language_code)
+
+        return (pred_text, language_code)
@@ -15,6 +15,8 @@ console = Console()
 
 
 class ChatTTSHandler(BaseHandler):
+    audio_side = "output"
+
     def setup(
         self,
         should_listen,
@@ -23,7 +25,7 @@ class ChatTTSHandler(BaseHandler):
         stream=True,
         chunk_size=512,
     ):
-        self.should_listen = should_listen
+        self.bind_should_listen(should_listen)
         self.device = device
         self.model = ChatTTS.Chat()
         self.model.load(compile=False)  # Doesn't work for me with True
@@ -59,7 +61,7 @@ class ChatTTSHandler(BaseHandler):
             wavs = [np.array([])]
             for gen in wavs_gen:
                 if gen[0] is None or len(gen[0]) == 0:
-                    self.should_listen.set()
+                    self.session.should_listen.set()
                     return
                 audio_chunk = librosa.resample(gen[0], orig_sr=24000, target_sr=16000)
                 audio_chunk = (audio_chunk * 32768).astype(np.int16)[0]
@@ -70,7 +72,7 @@ class ChatTTSHandler(BaseHandler):
         else:
             wavs = wavs_gen
             if len(wavs[0]) == 0:
-                self.should_listen.set()
+                self.session.should_listen.set()
                 return
             audio_chunk = librosa.resample(wavs[0], orig_sr=24000, target_sr=16000)
             audio_chunk = (audio_chunk * 32768).astype(np.int16)
@@ -79,4 +81,4 @@ class ChatTTSHandler(BaseHandler):
                     audio_chunk[i : i + self.chunk_size],
                     (0, self.chunk_size - len(audio_chunk[i : i + self.chunk_size])),
                 )
-        self.should_listen.set()
+        self.session.should_listen.set()
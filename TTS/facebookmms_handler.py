@@ -57,6 +57,8 @@ WHISPER_LANGUAGE_TO_FACEBOOK_LANGUAGE = {
 }
 
 class FacebookMMSTTSHandler(BaseHandler):
+    audio_side = "output"
+
     def setup(
         self,
         should_listen,
@@ -69,7 +71,7 @@ class FacebookMMSTTSHandler(BaseHandler):
     ):
         log = logging.getLogger(__name__)
         
-        self.should_listen = should_listen
+        self.bind_should_listen(should_listen)
         self.device = device
         self.torch_dtype = getattr(torch, torch_dtype)
         self.stream = stream
@@ -154,7 +156,7 @@ class FacebookMMSTTSHandler(BaseHandler):
         
         if audio_output is None or audio_output.numel() == 0:
             log.warning("No audio output generated")
-            self.should_listen.set()
+            self.session.should_listen.set()
             return
 
         audio_numpy = audio_output.cpu().numpy().squeeze()
@@ -177,4 +179,4 @@ class FacebookMMSTTSHandler(BaseHandler):
                     (0, self.chunk_size - len(audio_int16[i : i + self.chunk_size])),
                 )
 
-        self.should_listen.set()
\ No newline at end of file
+        self.session.should_listen.set()
\ No newline at end of file
@@ -1,6 +1,7 @@
 from melo.api import TTS
 import logging
 from baseHandler import BaseHandler
+from utils.utils import ensure_nltk_data
 import librosa
 import numpy as np
 from rich.console import Console
@@ -30,6 +31,8 @@ WHISPER_LANGUAGE_TO_MELO_SPEAKER = {
 
 
 class MeloTTSHandler(BaseHandler):
+    audio_side = "output"
+
     def setup(
         self,
         should_listen,
@@ -39,7 +42,9 @@ class MeloTTSHandler(BaseHandler):
         gen_kwargs={},  # Unused
         blocksize=512,
     ):
-        self.should_listen = should_listen
+        self.bind_should_listen(should_listen)
+        # the English G2P of Melo tags parts of speech with NLTK
+        ensure_nltk_data("taggers/averaged_perceptron_tagger_eng")
         self.device = device
         self.language = language
         self.model = TTS(
@@ -96,7 +101,7 @@ class MeloTTSHandler(BaseHandler):
             logger.error(f"Error in MeloTTSHandler: {e}")
             audio_chunk = np.array([])
         if len(audio_chunk) == 0:
-            self.should_listen.set()
+            self.session.should_listen.set()
             return
         audio_chunk = librosa.resample(audio_chunk, orig_sr=44100, target_sr=16000)
         audio_chunk = (audio_chunk * 32768).astype(np.int16)
@@ -106,4 +111,4 @@ class MeloTTSHandler(BaseHandler):
                 (0, self.blocksize - len(audio_chunk[i : i + self.blocksize])),
             )
 
-        self.should_listen.set()
+        self.session.should_listen.set()
@@ -1,8 +1,10 @@
+import asyncio
+from functools import partial
 from threading import Thread
-from time import perf_counter
 from baseHandler import BaseHandler
 import numpy as np
 import torch
+import torch.nn.functional as F
 from transformers import (
     AutoTokenizer,
 )
@@ -10,7 +12,9 @@ from parler_tts import ParlerTTSForConditionalGeneration, ParlerTTSStreamer
 import librosa
 import logging
 from rich.console import Console
-from utils.utils import next_power_of_2
+from utils.cancellation import cancellation_criteria, step_limit_criteria
+from utils.compile_cache import CompileCache
+from utils.utils import batch_bucket, batch_buckets, next_power_of_2
 from transformers.utils.import_utils import (
     is_flash_attn_2_available,
 )
@@ -46,7 +50,35 @@ WHISPER_LANGUAGE_TO_PARLER_SPEAKER = {
 }
 
 
+class AsyncParlerTTSStreamer(ParlerTTSStreamer):
+    """
+    ParlerTTSStreamer read with `async for` from the event loop it was created in, while the generation feeds it
+    from another thread.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.loop = asyncio.get_running_loop()
+        self.audio_queue = asyncio.Queue()
+
+    def on_finalized_audio(self, audio, stream_end=False):
+        self.loop.call_soon_threadsafe(self.audio_queue.put_nowait, audio)
+        if stream_end:
+            self.loop.call_soon_threadsafe(self.audio_queue.put_nowait, self.stop_signal)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        value = await self.audio_queue.get()
+        if value is self.stop_signal:
+            raise StopAsyncIteration
+        return value
+
+
 class ParlerTTSHandler(BaseHandler):
+    audio_side = "output"
+
     def setup(
         self,
         should_listen,
@@ -58,6 +90,8 @@ class ParlerTTSHandler(BaseHandler):
         play_steps=10,
         chunk_size=512,
         stream=True,
+        max_batch_size=1,
+        max_batch_wait_ms=0,
         gen_kwargs={},
         **kwargs,  # 添加**kwargs以接收并忽略额外的参数，如description
     ):
@@ -65,7 +99,7 @@ class ParlerTTSHandler(BaseHandler):
         log = logging.getLogger(__name__)
         
         self.play_steps = play_steps
-        self.should_listen = should_listen
+        self.bind_should_listen(should_listen)
         self.device = device
         self.torch_dtype = getattr(torch, torch_dtype)
         self.compile_mode = compile_mode
@@ -73,6 +107,8 @@ class ParlerTTSHandler(BaseHandler):
         self.stream = stream
         self.blocksize = chunk_size
         self.max_prompt_pad_length = max_prompt_pad_length
+        self.max_batch_size = max_batch_size
+        self.max_batch_wait_ms = max_batch_wait_ms
 
         self.tokenizer = AutoTokenizer.from_pretrained("parler-tts/parler-tts-mini")
         self.prompt_tokenizer = AutoTokenizer.from_pretrained("google/flan-t5-large")
@@ -84,41 +120,58 @@ class ParlerTTSHandler(BaseHandler):
 
         # compile
         if self.compile_mode:
+            # one graph per batch size and padded prompt length (see `warmup`), twice for the CUDA graphs
+            n_buckets = len(batch_buckets(max_batch_size)) * len(range(2, max_prompt_pad_length))
+            torch._dynamo.config.cache_size_limit = max(torch._dynamo.config.cache_size_limit, 2 * n_buckets)
+            self.compile_cache = CompileCache(
+                "parler",
+                model_name="parler-tts/parler-mini-v1-jenny",
+                torch_dtype=torch_dtype,
+                compile_mode=compile_mode,
+                device=device,
+                gen_kwargs=gen_kwargs,
+            )
+            self.compile_cache.load()
             self.model.forward = torch.compile(
                 self.model.forward, mode=self.compile_mode, fullgraph=True
             )
         self.warmup()
 
-    def prepare_model_inputs(self, text, max_length_prompt=None, pad=False):
-        input_ids = self.tokenizer(
-            text,
-            return_tensors="pt",
-        ).input_ids.to(self.device)
+    def prepare_model_inputs(self, text, max_length_prompt=None, pad=False, speaker=None):
+        """
+        `text` is either a sentence or a list of sentences synthesized as one batch, in which case the prompts
+        are padded to the same length.
+        """
+        batched = not isinstance(text, str)
+        texts = list(text) if batched else [text]
+
+        description = self.tokenizer(texts, return_tensors="pt", padding=True)
+        input_ids = description.input_ids.to(self.device)
 
-        prompt_ids = self.prompt_tokenizer(
-            text,
-            return_tensors="pt",
-        ).input_ids.to(self.device)
+        prompt = self.prompt_tokenizer(texts, return_tensors="pt", padding=True)
+        prompt_ids = prompt.input_ids.to(self.device)
+        prompt_attention_mask = prompt.attention_mask.to(self.device)
         if pad and max_length_prompt is not None:
-            # TODO: pad to max_length_prompt
-            padded_prompt_ids = torch.zeros(
-                (1, max_length_prompt), dtype=torch.long, device=self.device
-            )
-            padded_prompt_ids[0, : prompt_ids.shape[1]] = prompt_ids
-            prompt_ids = padded_prompt_ids
+            # the padding is masked out; a prompt longer than `max_length_prompt` is kept whole, in a shape
+            # that was not warmed up
+            padding = max(0, max_length_prompt - prompt_ids.shape[1])
+            prompt_ids = F.pad(prompt_ids, (0, padding), value=self.prompt_tokenizer.pad_token_id)
+            prompt_attention_mask = F.pad(prompt_attention_mask, (0, padding), value=0)
 
         # pad attention_mask
         padded_attention_mask = torch.zeros(
-            (1, 1024), dtype=torch.long, device=self.device
+            (len(texts), 1024), dtype=torch.long, device=self.device
         )
-        padded_attention_mask[0, : input_ids.shape[1]] = 1
+        padded_attention_mask[:, : input_ids.shape[1]] = description.attention_mask
         
         result_dict = {
             "input_ids": input_ids,
             "prompt_ids": prompt_ids,
             "attention_mask": padded_attention_mask,
-            "speaker": self.speaker
+            "speaker": speaker or self.speaker
         }
+        if batched or pad:
+            result_dict["prompt_attention_mask"] = prompt_attention_mask
         
         return result_dict
 
@@ -139,14 +192,35 @@ class ParlerTTSHandler(BaseHandler):
             torch.cuda.synchronize()
             start_event.record()
         if self.compile_mode:
+            # one shape bucket per padded prompt length
             pad_lengths = [2**i for i in range(2, self.max_prompt_pad_length)]
-            for pad_length in pad_lengths[::-1]:
-                model_kwargs = self.prepare_model_inputs(
-                    "dummy prompt", max_length_prompt=pad_length, pad=True
-                )
-                for _ in range(n_steps):
-                    _ = self.model.generate(**model_kwargs)
-                log.info(f"Warmed up length {pad_length} tokens!")
+            shapes = [
+                f"{batch_size}x{pad_length}"
+                for batch_size in batch_buckets(self.max_batch_size)
+                for pad_length in pad_lengths
+            ]
+            cached = self.compile_cache.valid(shapes)
+            # the compiled graphs are loaded from the cache by a short generation, unless CUDA graphs have to be
+            # captured: enough steps for one audio frame, the codebooks being delayed by one step each
+            short = cached and self.compile_cache.short_warmup(shapes)
+            if short:
+                n_steps = 1
+            # and per batch size, batches being padded to one of the `batch_buckets`
+            for batch_size in batch_buckets(self.max_batch_size):
+                text = "dummy prompt" if batch_size == 1 else ["dummy prompt"] * batch_size
+                for pad_length in pad_lengths[::-1]:
+                    model_kwargs = self.prepare_model_inputs(
+                        text, max_length_prompt=pad_length, pad=True
+                    )
+                    if short:
+                        model_kwargs["stopping_criteria"] = step_limit_criteria(
+                            self.model.decoder.config.num_codebooks + 1
+                        )
+                    for _ in range(n_steps):
+                        _ = self.model.generate(**model_kwargs)
+                    log.info(f"Warmed up length {pad_length} tokens, batch size {batch_size}!")
+            if not cached:
+                self.compile_cache.save(shapes)
         else:
             model_kwargs = self.prepare_model_inputs("dummy prompt")
             for _ in range(n_steps):
@@ -159,14 +233,20 @@ class ParlerTTSHandler(BaseHandler):
                 f"{self.__class__.__name__}:  warmed up! time: {start_event.elapsed_time(end_event) * 1e-3:.3f} s"
             )
 
-    def process(self, llm_sentence):
+    def prepare_generation(self, llm_sentence):
+        """
+        The `generate` arguments synthesizing `llm_sentence` with the speaker of the current session.
+        """
         # 使用局部日志对象
         log = logging.getLogger(__name__)
-        
+
+        self.first_of_turn()
+        # each session keeps the speaker matching the language of its last answer
+        speaker = self.session_state("speaker", lambda: {"name": self.speaker})
         if isinstance(llm_sentence, tuple):
             llm_sentence, language_code = llm_sentence
-            self.speaker = WHISPER_LANGUAGE_TO_PARLER_SPEAKER.get(language_code, "Jason")
-            
+            speaker["name"] = WHISPER_LANGUAGE_TO_PARLER_SPEAKER.get(language_code, "Jason")
+
         console.print(f"[green]ASSISTANT: {llm_sentence}")
         nb_tokens = len(self.prompt_tokenizer(llm_sentence).input_ids)
 
@@ -180,29 +260,157 @@ class ParlerTTSHandler(BaseHandler):
 
         tts_gen_kwargs = self.prepare_model_inputs(
             llm_sentence,
+            speaker=speaker["name"],
             **pad_args,
         )
+        return {
+            # stops the generation as soon as the user barges in
+            "stopping_criteria": cancellation_criteria(self.cancellation()),
+            **tts_gen_kwargs,
+        }
 
+    def process(self, llm_sentence):
+        tts_gen_kwargs = self.prepare_generation(llm_sentence)
         streamer = ParlerTTSStreamer(
             self.model, device=self.device, play_steps=self.play_steps
         )
-        tts_gen_kwargs = {"streamer": streamer, **tts_gen_kwargs}
         torch.manual_seed(0)
-        thread = Thread(target=self.model.generate, kwargs=tts_gen_kwargs)
+        thread = Thread(target=self.model.generate, kwargs={"streamer": streamer, **tts_gen_kwargs})
         thread.start()
 
-        for i, audio_chunk in enumerate(streamer):
-            global pipeline_start
-            if i == 0 and "pipeline_start" in globals():
-                log.info(
-                    f"Time to first audio: {perf_counter() - pipeline_start:.3f}"
-                )
-            audio_chunk = librosa.resample(audio_chunk, orig_sr=44100, target_sr=16000)
-            audio_chunk = (audio_chunk * 32768).astype(np.int16)
-            for i in range(0, len(audio_chunk), self.blocksize):
-                yield np.pad(
-                    audio_chunk[i : i + self.blocksize],
-                    (0, self.blocksize - len(audio_chunk[i : i + self.blocksize])),
-                )
-
-        self.should_listen.set()
+        for audio_chunk in streamer:
+            yield from self.to_chunks(audio_chunk)
+
+        self.session.should_listen.set()
+
+    async def process_async(self, llm_sentence):
+        """
+        `process` for the asyncio execution (see AsyncBaseHandler): the generation runs in the executor of the
+        handler and hands its audio to the event loop through an `AsyncParlerTTSStreamer`.
+        """
+        session = self.session
+        tts_gen_kwargs = self.prepare_generation(llm_sentence)
+        streamer = AsyncParlerTTSStreamer(
+            self.model, device=self.device, play_steps=self.play_steps
+        )
+        torch.manual_seed(0)
+        async for audio_chunk in self.stream(partial(self.model.generate, streamer=streamer, **tts_gen_kwargs), streamer):
+            for chunk in self.to_chunks(audio_chunk):
+                yield chunk
+
+        session.should_listen.set()
+
+    def first_of_turn(self):
+        """
+        Whether the sentence being processed is the first one of its turn to be synthesized for its session.
+        Records that it has been.
+        """
+        state = self.session_state("synthesized", lambda: {"turn": None})
+        first = state["turn"] != self.turn
+        state["turn"] = self.turn
+        return first
+
+    def process_batch(self, llm_sentences):
+        """
+        Synthesizes the pending sentences, from one long answer or from several sessions. The first sentence of
+        each turn is streamed on its own, as by `process`, so that batching never delays the first audio of an
+        answer. The following ones are only played once the sentences before them are, so they are synthesized
+        together, with one `generate` call per speaker. Batches are not streamed: `ParlerTTSStreamer` only
+        follows the first sequence of a batch.
+        """
+        if len(llm_sentences) == 1:
+            yield from super().process_batch(llm_sentences)
+            return
+
+        # consecutive sentences that are not the first of their turn, synthesized as one batch
+        run = []
+        for index in range(len(llm_sentences)):
+            self.select(index)
+            if self.first_of_turn():
+                yield from self.generate_batch(llm_sentences, run)
+                run = []
+                yield from self.stream_sentence(llm_sentences, index)
+            else:
+                run.append(index)
+        yield from self.generate_batch(llm_sentences, run)
+
+    def stream_sentence(self, llm_sentences, index):
+        self.select(index)
+        for output in self.process(llm_sentences[index]):
+            if self.cancelled():
+                break
+            yield index, output
+
+    def generate_batch(self, llm_sentences, indices):
+        """
+        Synthesizes `llm_sentences[index]` for each of the `indices` and hands their audio back in that order.
+        """
+        if len(indices) <= 1:
+            for index in indices:
+                yield from self.stream_sentence(llm_sentences, index)
+            return
+
+        log = logging.getLogger(__name__)
+
+        groups = {}
+        for index in indices:
+            self.select(index)
+            llm_sentence = llm_sentences[index]
+            speaker = self.session_state("speaker", lambda: {"name": self.speaker})
+            if isinstance(llm_sentence, tuple):
+                llm_sentence, language_code = llm_sentence
+                speaker["name"] = WHISPER_LANGUAGE_TO_PARLER_SPEAKER.get(language_code, "Jason")
+            console.print(f"[green]ASSISTANT: {llm_sentence}")
+            groups.setdefault(speaker["name"], []).append((index, llm_sentence))
+
+        # audio of the sentences synthesized but not handed back yet, because an earlier one is not
+        audios = {}
+        position = 0
+        for speaker, sentences in groups.items():
+            group_indices = [index for index, _ in sentences]
+            texts = [text for _, text in sentences]
+            pad_args = {}
+            if self.compile_mode:
+                # only the warmed up batch sizes are run: the extra rows repeat the last sentence
+                batch_size = batch_bucket(len(texts), self.max_batch_size)
+                texts += texts[-1:] * (batch_size - len(texts))
+                # pad to closest upper power of two of the longest prompt
+                nb_tokens = max(len(ids) for ids in self.prompt_tokenizer(texts).input_ids)
+                pad_length = next_power_of_2(nb_tokens)
+                log.debug(f"padding batch of {len(texts)} to {pad_length}")
+                pad_args["pad"] = True
+                pad_args["max_length_prompt"] = pad_length
+
+            # a single sentence takes the inputs of `process`, which the batch size 1 was warmed up with
+            text = texts if len(texts) > 1 else texts[0]
+            tts_gen_kwargs = self.prepare_model_inputs(text, speaker=speaker, **pad_args)
+            # only worth stopping once every session of the group has barged in
+            cancellations = [self.cancellation(index) for index in group_indices]
+            torch.manual_seed(0)
+            generation = self.model.generate(
+                **tts_gen_kwargs,
+                stopping_criteria=cancellation_criteria(lambda: all(cancelled() for cancelled in cancellations)),
+                return_dict_in_generate=True,
+            )
+
+            for row, index in enumerate(group_indices):
+                audio = generation.sequences[row, : generation.audios_length[row]]
+                audios[index] = audio.to(torch.float32).cpu().numpy().squeeze()
+            while position < len(indices) and indices[position] in audios:
+                index = indices[position]
+                audio = audios.pop(index)
+                position += 1
+                if self.cancelled(index):
+                    continue
+                for audio_chunk in self.to_chunks(audio):
+                    yield index, audio_chunk
+                self.batch_sessions[index].should_listen.set()
+
+    def to_chunks(self, audio_chunk):
+        audio_chunk = librosa.resample(audio_chunk, orig_sr=44100, target_sr=16000)
+        audio_chunk = (audio_chunk * 32768).astype(np.int16)
+        for i in range(0, len(audio_chunk), self.blocksize):
+            yield np.pad(
+                audio_chunk[i : i + self.blocksize],
+                (0, self.blocksize - len(audio_chunk[i : i + self.blocksize])),
+            )
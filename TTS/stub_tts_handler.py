@@ -0,0 +1,52 @@
+import logging
+import time
+
+import numpy as np
+
+from baseHandler import BaseHandler
+
+logger = logging.getLogger(__name__)
+
+
+class StubTTSHandler(BaseHandler):
+    """
+    Stands in for a Text To Speech model, to measure the pipeline without loading one: each sentence becomes
+    `ms_per_char` of a 250 Hz tone per character, cut in `blocksize` chunks. The first chunk comes out after
+    `latency_ms` and the next ones at `realtime_factor` times their duration. Deterministic, no model needed.
+    """
+
+    audio_side = "output"
+
+    def setup(
+        self,
+        should_listen,
+        latency_ms=50,
+        realtime_factor=0.1,
+        ms_per_char=60,
+        blocksize=512,
+        gen_kwargs={},  # Unused
+    ):
+        self.bind_should_listen(should_listen)
+        self.latency_ms = latency_ms
+        self.realtime_factor = realtime_factor
+        self.ms_per_char = ms_per_char
+        self.blocksize = blocksize
+        # 250 Hz has a period of 64 samples at 16 kHz: the same chunk repeats seamlessly, no need to compute more
+        t = np.arange(blocksize) / 16000
+        self.chunk = (0.1 * 32767 * np.sin(2 * np.pi * 250 * t)).astype(np.int16)
+        self.chunk.flags.writeable = False
+
+    def process(self, llm_sentence):
+        if isinstance(llm_sentence, tuple):
+            llm_sentence, _ = llm_sentence
+        logger.debug(f"ASSISTANT: {llm_sentence}")
+
+        n_chunks = int(np.ceil(len(llm_sentence) * self.ms_per_char * 16 / self.blocksize))
+        chunk_time = self.realtime_factor * self.blocksize / 16000
+        next_time = time.perf_counter() + self.latency_ms / 1000
+        for _ in range(n_chunks):
+            time.sleep(max(0.0, next_time - time.perf_counter()))
+            yield self.chunk
+            next_time += chunk_time
+
+        self.session.should_listen.set()
@@ -0,0 +1,94 @@
+import importlib.util
+import logging
+import os
+
+import numpy as np
+
+from VAD.vad_handler import VADHandler
+
+logger = logging.getLogger(__name__)
+
+STATE_SIZE = 128
+
+
+def default_model_path():
+    """
+    The ONNX model shipped with the silero-vad package, if it is installed.
+    """
+    # found without importing the package, which imports torch
+    spec = importlib.util.find_spec("silero_vad")
+    if spec is None or not spec.submodule_search_locations:
+        return None
+    path = os.path.join(list(spec.submodule_search_locations)[0], "data", "silero_vad.onnx")
+    return path if os.path.isfile(path) else None
+
+
+class BatchedSileroOnnx:
+    """
+    The Silero VAD (v5) ONNX model run with onnxruntime on the windows of several streams in one call, for
+    `MultiStreamVADIterator`. The recurrent state and the audio context of every stream slot live in arrays
+    allocated up front, and the model input is assembled in a preallocated buffer, so a call allocates next to
+    nothing whatever the number of streams.
+    """
+
+    def __init__(self, model_path, sampling_rate=16000, capacity=16, threads=1):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        # a window is a few thousand operations: more threads only add synchronization
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(
+            model_path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        inputs = {input.name for input in self.session.get_inputs()}
+        if inputs != {"input", "state", "sr"}:
+            raise ValueError(f"{model_path} is not a Silero VAD v5 ONNX model (inputs: {', '.join(sorted(inputs))})")
+        self.sampling_rate = sampling_rate
+        self.sr = np.array(sampling_rate, dtype=np.int64)
+        self.window_size = 512 if sampling_rate == 16000 else 256
+        # the model sees the end of the previous window in front of each window
+        self.context_size = 64 if sampling_rate == 16000 else 32
+        self.state = np.zeros((2, 0, STATE_SIZE), dtype=np.float32)
+        self.context = np.zeros((0, self.context_size), dtype=np.float32)
+        self.input = np.zeros((0, self.context_size + self.window_size), dtype=np.float32)
+        self.grow(capacity)
+
+    def grow(self, capacity):
+        self.state = np.concatenate([self.state, np.zeros((2, capacity, STATE_SIZE), dtype=np.float32)], axis=1)
+        self.context = np.concatenate([self.context, np.zeros((capacity, self.context_size), dtype=np.float32)])
+        self.input = np.zeros((len(self.context), self.context_size + self.window_size), dtype=np.float32)
+
+    def reset(self, slot):
+        if slot >= len(self.context):
+            self.grow(max(slot + 1 - len(self.context), len(self.context)))
+        self.state[:, slot] = 0
+        self.context[slot] = 0
+
+    def __call__(self, slots, windows):
+        slots = np.asarray(slots)
+        input = self.input[: len(slots)]
+        input[:, : self.context_size] = self.context[slots]
+        input[:, self.context_size :] = windows
+        speech_prob, state = self.session.run(
+            None, {"input": input, "state": self.state[:, slots], "sr": self.sr}
+        )
+        self.state[:, slots] = state
+        self.context[slots] = input[:, -self.context_size :]
+        return speech_prob.reshape(-1)
+
+
+class SileroOnnxVADHandler(VADHandler):
+    """
+    VADHandler running the ONNX Silero model with onnxruntime, loaded from `vad_model_path` (by default the file
+    shipped with the silero-vad package), so that the pipeline starts without network access or torch hub cache.
+    """
+
+    def load_model(self):
+        model_path = self.model_path or default_model_path()
+        if model_path is None:
+            raise ValueError(
+                "The ONNX VAD needs the path of silero_vad.onnx (--vad_model_path) or the silero-vad package installed"
+            )
+        logger.info(f"Loading the ONNX Silero VAD from {model_path}")
+        return BatchedSileroOnnx(model_path, self.sample_rate)
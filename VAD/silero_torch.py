@@ -0,0 +1,74 @@
+from copy import deepcopy
+
+import numpy as np
+import torch
+
+
+class BatchedSilero:
+    """
+    The Silero VAD JIT model run on the windows of several streams in one call. The model keeps the recurrent
+    state and the audio context of the last batch it ran; they are kept here for each stream slot and swapped in
+    and out around each call, so the streams of a batch can change from one call to the next.
+    """
+
+    def __init__(self, model, sampling_rate=16000):
+        self.model = model
+        self.sampling_rate = sampling_rate
+        self.states = {}
+
+    @staticmethod
+    def supports(model):
+        # Silero v5 keeps them in `_state` and `_context`, older versions in other attributes
+        model.reset_states()
+        return all(hasattr(model, name) for name in ("_state", "_context", "_last_sr", "_last_batch_size"))
+
+    def reset(self, slot):
+        self.states.pop(slot, None)
+
+    @torch.no_grad()
+    def __call__(self, slots, windows):
+        states = [self.states.get(slot) for slot in slots]
+        known = [state for state in states if state is not None]
+        if not known:
+            self.model.reset_states()
+        else:
+            state_zeros, context_zeros = torch.zeros_like(known[0][0]), torch.zeros_like(known[0][1])
+            self.model._state = torch.cat(
+                [state[0] if state is not None else state_zeros for state in states], dim=1
+            )
+            self.model._context = torch.cat(
+                [state[1] if state is not None else context_zeros for state in states], dim=0
+            )
+            self.model._last_sr = self.sampling_rate
+            self.model._last_batch_size = len(slots)
+        speech_prob = self.model(torch.from_numpy(windows), self.sampling_rate)
+        state, context = self.model._state, self.model._context
+        for position, slot in enumerate(slots):
+            self.states[slot] = (state[:, position : position + 1], context[position : position + 1])
+        return speech_prob.reshape(-1).cpu().numpy()
+
+
+class PerStreamSilero:
+    """
+    Fallback of `BatchedSilero` for the model versions whose state cannot be swapped: one copy of the model per
+    stream slot, called once per window.
+    """
+
+    def __init__(self, model, sampling_rate=16000):
+        self.model = model
+        self.sampling_rate = sampling_rate
+        self.models = {}
+
+    def reset(self, slot):
+        self.models.pop(slot, None)
+
+    @torch.no_grad()
+    def __call__(self, slots, windows):
+        speech_prob = np.empty(len(slots), dtype=np.float32)
+        for position, slot in enumerate(slots):
+            if slot not in self.models:
+                self.models[slot] = deepcopy(self.model)
+                self.models[slot].reset_states()
+            window = torch.from_numpy(windows[position : position + 1])
+            speech_prob[position] = self.models[slot](window, self.sampling_rate).item()
+        return speech_prob
@@ -1,12 +1,13 @@
-import torchaudio
-from VAD.vad_iterator import VADIterator
+import weakref
+from collections import deque
+
+from VAD.vad_iterator import MultiStreamVADIterator
 from baseHandler import BaseHandler
 import numpy as np
-import torch
 from rich.console import Console
 
-from utils.utils import int2float
-from df.enhance import enhance, init_df
+from utils.audio_reframer import AudioReframer
+from utils.envelope import Control, Envelope
 import logging
 
 logger = logging.getLogger(__name__)
@@ -14,10 +15,22 @@ logger = logging.getLogger(__name__)
 console = Console()
 
 
+class VADStream:
+    """
+    Per-session state of the VAD: the slot of the session in the `MultiStreamVADIterator`, and the reframer
+    cutting its audio chunks, whatever their size, into model windows.
+    """
+
+    def __init__(self, slot, window_size):
+        self.slot = slot
+        self.reframer = AudioReframer(window_size)
+
+
 class VADHandler(BaseHandler):
     """
     Handles voice activity detection. When voice activity is detected, audio will be accumulated until the end of speech is detected and then passed
-    to the following part.
+    to the following part, in an `Envelope` of the current turn of the session.
+    On barge-in, the session is interrupted and a `Control` "cancel" message tells the following parts about the new turn.
     """
 
     def setup(
@@ -30,62 +43,174 @@ class VADHandler(BaseHandler):
         max_speech_ms=float("inf"),
         speech_pad_ms=30,
         audio_enhancement=False,
+        barge_in=False,
+        deadline_s=0.0,
+        vad_max_batch_size=32,
+        vad_max_batch_wait_ms=0,
+        vad_model_path=None,
+        vad_pre_roll_ms=None,
     ):
-        self.should_listen = should_listen
+        self.bind_should_listen(should_listen)
+        self.max_batch_size = vad_max_batch_size
+        self.max_batch_wait_ms = vad_max_batch_wait_ms
+        self.barge_in = barge_in
+        self.deadline_s = deadline_s
+        self.thresh = thresh
         self.sample_rate = sample_rate
         self.min_silence_ms = min_silence_ms
         self.min_speech_ms = min_speech_ms
         self.max_speech_ms = max_speech_ms
-        self.model, _ = torch.hub.load("snakers4/silero-vad", "silero_vad")
-        self.iterator = VADIterator(
-            self.model,
-            threshold=thresh,
-            sampling_rate=sample_rate,
-            min_silence_duration_ms=min_silence_ms,
-            speech_pad_ms=speech_pad_ms,
+        self.speech_pad_ms = speech_pad_ms
+        self.model_path = vad_model_path
+        # Silero v5 takes windows of 512 samples at 16 kHz, 256 at 8 kHz
+        self.window_size = 512 if sample_rate == 16000 else 256
+        self.iterator = MultiStreamVADIterator(
+            self.load_model(),
+            threshold=self.thresh,
+            sampling_rate=self.sample_rate,
+            min_silence_duration_ms=self.min_silence_ms,
+            speech_pad_ms=self.speech_pad_ms,
+            pre_roll_ms=vad_pre_roll_ms,
         )
+        # slots of the sessions gone, freed by the handler thread
+        self.released = deque()
         self.audio_enhancement = audio_enhancement
         if audio_enhancement:
+            # DeepFilterNet is only imported when the enhancement is used
+            from df.enhance import init_df
+
             self.enhanced_model, self.df_state, _ = init_df()
 
+    def load_model(self):
+        """
+        Loads the model and returns it wrapped for `MultiStreamVADIterator`. With `model_path`, the TorchScript model
+        is loaded from that local clone of the silero-vad repository instead of being fetched from GitHub.
+        """
+        # torch is only imported by the TorchScript model, the ONNX one (see `VAD/silero_onnx.py`) runs without it
+        import torch
+
+        from VAD.silero_torch import BatchedSilero, PerStreamSilero
+
+        if self.model_path:
+            self.model, _ = torch.hub.load(self.model_path, "silero_vad", source="local")
+        else:
+            self.model, _ = torch.hub.load("snakers4/silero-vad", "silero_vad")
+        if BatchedSilero.supports(self.model):
+            return BatchedSilero(self.model, self.sample_rate)
+        logger.warning("This Silero VAD version cannot be batched, each session runs its own copy of the model")
+        return PerStreamSilero(self.model, self.sample_rate)
+
+    def new_stream(self):
+        stream = VADStream(self.iterator.open(), self.window_size)
+        # the session state is dropped when the session is closed
+        weakref.finalize(stream, self.released.append, stream.slot)
+        return stream
+
+    def stream_of(self, session):
+        return self.session_state("stream", self.new_stream, session)
+
     def process(self, audio_chunk):
-        audio_int16 = np.frombuffer(audio_chunk, dtype=np.int16)
-        audio_float32 = int2float(audio_int16)
-        vad_output = self.iterator(torch.from_numpy(audio_float32))
-        if vad_output is not None and len(vad_output) != 0:
-            logger.debug("VAD: end of speech detected")
-            array = torch.cat(vad_output).cpu().numpy()
-            duration_ms = len(array) / self.sample_rate * 1000
-            if duration_ms < self.min_speech_ms or duration_ms > self.max_speech_ms:
-                logger.debug(
-                    f"audio input of duration: {len(array) / self.sample_rate}s, skipping"
-                )
-            else:
-                self.should_listen.clear()
-                logger.debug("Stop listening")
-                if self.audio_enhancement:
-                    if self.sample_rate != self.df_state.sr():
-                        audio_float32 = torchaudio.functional.resample(
-                            torch.from_numpy(array),
-                            orig_freq=self.sample_rate,
-                            new_freq=self.df_state.sr(),
-                        )
-                        enhanced = enhance(
-                            self.enhanced_model,
-                            self.df_state,
-                            audio_float32.unsqueeze(0),
-                        )
-                        enhanced = torchaudio.functional.resample(
-                            enhanced,
-                            orig_freq=self.df_state.sr(),
-                            new_freq=self.sample_rate,
-                        )
-                    else:
-                        enhanced = enhance(
-                            self.enhanced_model, self.df_state, audio_float32
-                        )
-                    array = enhanced.numpy().squeeze()
-                yield array
+        for _, output in self.detect([(None, self.session, audio_chunk)]):
+            yield output
+
+    def process_batch(self, inputs):
+        """
+        The chunks of all the sessions of the batch go through the model together, one window per session and
+        per call.
+        """
+        items = []
+        for index, audio_chunk in enumerate(inputs):
+            self.select(index)
+            items.append((index, self.session, audio_chunk))
+        yield from self.detect(items)
+
+    def detect(self, items):
+        """
+        Runs the VAD on the (key, session, audio chunk) `items` and yields the (key, output) of the speech
+        starts (barge-in) and ends.
+        """
+        while self.released:
+            self.iterator.close(self.released.popleft())
+        # windows of each item, in order: the windows of a session are scored one call after the other
+        queued = []
+        for key, session, audio_chunk in items:
+            stream = self.stream_of(session)
+            for index, windows in enumerate(queued):
+                if windows and windows[0][2] is stream:
+                    # the windows of its previous chunk are a view of the reframer buffer, which `push` reuses
+                    queued[index] = deque((*item[:3], item[3].copy()) for item in windows)
+            windows = stream.reframer.push(audio_chunk)
+            queued.append(deque((key, session, stream, window) for window in windows))
+        while any(queued):
+            batch, slots = [], set()
+            for windows in queued:
+                if windows and windows[0][2].slot not in slots:
+                    batch.append(windows.popleft())
+                    slots.add(batch[-1][2].slot)
+            started, utterances = self.iterator(
+                [stream.slot for _, _, stream, _ in batch], np.stack([window for _, _, _, window in batch])
+            )
+            for position in np.flatnonzero(started):
+                key, session, _, _ = batch[position]
+                if self.barge_in and not session.should_listen.is_set():
+                    # the user speaks over the answer (or while it is being prepared): cancel it right away
+                    logger.debug("VAD: barge-in detected")
+                    self.sessions.interrupt(session.session_id)
+                    session.should_listen.set()
+                    yield key, Control.cancel(session.session_id, session.turn)
+            for position, vad_output in utterances:
+                key, session, _, _ = batch[position]
+                logger.debug("VAD: end of speech detected")
+                utterance = self.utterance(session, vad_output)
+                if utterance is not None:
+                    yield key, utterance
+
+    def utterance(self, session, vad_output):
+        """
+        The envelope of a spoken utterance, or None when it is too short or too long.
+        """
+        array = vad_output
+        duration_ms = len(array) / self.sample_rate * 1000
+        if duration_ms < self.min_speech_ms or duration_ms > self.max_speech_ms:
+            logger.debug(
+                f"audio input of duration: {len(array) / self.sample_rate}s, skipping"
+            )
+            return None
+        session.should_listen.clear()
+        logger.debug("Stop listening")
+        if self.audio_enhancement:
+            array = self.enhance(array)
+        envelope = Envelope(array, turn=session.turn)
+        if self.deadline_s:
+            envelope.deadline = envelope.created + self.deadline_s
+        return envelope
+
+    def enhance(self, array):
+        import torch
+        import torchaudio
+        from df.enhance import enhance
+
+        if self.sample_rate != self.df_state.sr():
+            audio_float32 = torchaudio.functional.resample(
+                torch.from_numpy(array),
+                orig_freq=self.sample_rate,
+                new_freq=self.df_state.sr(),
+            )
+            enhanced = enhance(
+                self.enhanced_model,
+                self.df_state,
+                audio_float32.unsqueeze(0),
+            )
+            enhanced = torchaudio.functional.resample(
+                enhanced,
+                orig_freq=self.df_state.sr(),
+                new_freq=self.sample_rate,
+            )
+        else:
+            enhanced = enhance(
+                self.enhanced_model, self.df_state, torch.from_numpy(array)
+            )
+        return enhanced.numpy().squeeze()
 
     @property
     def min_time_to_debug(self):
@@ -1,4 +1,77 @@
-import torch
+import numpy as np
+
+
+class SpeechBuffer:
+    """
+    Audio of one stream around its speech, in NumPy arrays allocated once and reused from one utterance to the
+    next: until the speech starts, a ring keeping the last `pre_roll` samples, so that the onset before the
+    trigger window is not lost; then the utterance, starting with that pre-roll, grown by doubling when a long
+    utterance does not fit. `emit` trims the silence after the last speech window to `pad` samples.
+    """
+
+    def __init__(self, pre_roll, capacity=16000 * 5):
+        self.ring = np.zeros(int(pre_roll), dtype=np.float32)
+        self.written = 0
+        self.capacity = capacity
+        self.speech = None
+        self.length = 0
+        self.speech_end = 0
+
+    def listen(self, window):
+        """
+        Keeps `window`, heard before the speech, in the pre-roll.
+        """
+        size = len(self.ring)
+        if not size:
+            return
+        window = window[-size:]
+        start = self.written % size
+        first = min(len(window), size - start)
+        self.ring[start : start + first] = window[:first]
+        self.ring[: len(window) - first] = window[first:]
+        self.written += len(window)
+
+    def start(self, window):
+        """
+        Starts the utterance with the pre-roll and the window that triggered it.
+        """
+        if self.speech is None:
+            self.speech = np.empty(max(self.capacity, len(self.ring)), dtype=np.float32)
+        size = len(self.ring)
+        if not size:
+            self.length = 0
+        elif self.written < size:
+            self.speech[: self.written] = self.ring[: self.written]
+            self.length = self.written
+        else:
+            start = self.written % size
+            self.speech[: size - start] = self.ring[start:]
+            self.speech[size - start : size] = self.ring[:start]
+            self.length = size
+        self.append(window, speech=True)
+
+    def append(self, window, speech):
+        if self.length + len(window) > len(self.speech):
+            grown = np.empty(max(2 * len(self.speech), self.length + len(window)), dtype=np.float32)
+            grown[: self.length] = self.speech[: self.length]
+            self.speech = grown
+        self.speech[self.length : self.length + len(window)] = window
+        self.length += len(window)
+        if speech:
+            self.speech_end = self.length
+
+    def emit(self, pad):
+        """
+        Returns the utterance, up to `pad` samples after its last speech window, and starts listening again.
+        """
+        utterance = self.speech[: min(self.length, self.speech_end + int(pad))].copy()
+        self.reset()
+        return utterance
+
+    def reset(self):
+        self.written = 0
+        self.length = 0
+        self.speech_end = 0
 
 
 class VADIterator:
@@ -9,14 +82,15 @@ class VADIterator:
         sampling_rate: int = 16000,
         min_silence_duration_ms: int = 100,
         speech_pad_ms: int = 30,
+        pre_roll_ms: int = None,
     ):
         """
         Mainly taken from https://github.com/snakers4/silero-vad
-        Class for stream imitation
+        Class for stream imitation: a single stream of `MultiStreamVADIterator`
 
         Parameters
         ----------
-        model: preloaded .jit/.onnx silero VAD model
+        model: preloaded .jit silero VAD model, or a batched model (see `BatchedSilero`, `BatchedSileroOnnx`)
 
         threshold: float (default - 0.5)
             Speech threshold. Silero VAD outputs speech probabilities for each audio chunk, probabilities ABOVE this value are considered as SPEECH.
@@ -29,72 +103,155 @@ class VADIterator:
             In the end of each speech chunk wait for min_silence_duration_ms before separating it
 
         speech_pad_ms: int (default - 30 milliseconds)
-            Final speech chunks are padded by speech_pad_ms each side
+            Final speech chunks are padded by speech_pad_ms each side: the silence after the speech is trimmed to it
+
+        pre_roll_ms: int (default - speech_pad_ms)
+            Audio kept before the chunk that triggers the speech, so that its onset is not lost
+
+        Returns the spoken utterance as a float32 NumPy array at the end of speech, None otherwise.
         """
+        if not hasattr(model, "reset"):
+            from VAD.silero_torch import BatchedSilero, PerStreamSilero
 
-        self.model = model
-        self.threshold = threshold
-        self.sampling_rate = sampling_rate
-        self.is_speaking = False
-        self.buffer = []
+            wrapper = BatchedSilero if BatchedSilero.supports(model) else PerStreamSilero
+            model = wrapper(model, sampling_rate)
+        self.iterator = MultiStreamVADIterator(
+            model,
+            threshold=threshold,
+            sampling_rate=sampling_rate,
+            min_silence_duration_ms=min_silence_duration_ms,
+            speech_pad_ms=speech_pad_ms,
+            pre_roll_ms=pre_roll_ms,
+            capacity=1,
+        )
+        self.slot = self.iterator.open()
+
+    def reset_states(self):
+        self.iterator.close(self.slot)
+        self.slot = self.iterator.open()
 
+    def __call__(self, x):
+        """
+        x: np.ndarray or torch.Tensor
+            audio chunk of the model window size (see examples in repo)
+        """
+        window = np.asarray(x, dtype=np.float32).reshape(1, -1)
+        _, utterances = self.iterator([self.slot], window)
+        return utterances[0][1] if utterances else None
+
+
+class MultiStreamVADIterator:
+    def __init__(
+        self,
+        model,
+        threshold: float = 0.5,
+        sampling_rate: int = 16000,
+        min_silence_duration_ms: int = 100,
+        speech_pad_ms: int = 30,
+        pre_roll_ms: int = None,
+        capacity: int = 16,
+    ):
+        """
+        The VAD of many audio streams at once: the current window of every stream is scored by a single batched
+        call of `model`, and the trigger/silence state machine runs on NumPy arrays indexed by stream slot.
+
+        Parameters
+        ----------
+        model: batched model (see `BatchedSilero`), called with the slots and the windows (batch x samples) and
+            returning the speech probability of each window, keeping the recurrent state of each slot
+
+        capacity: int (default - 16)
+            Number of slots allocated up front, doubled when more streams are open
+
+        See VADIterator for the other parameters.
+        """
         if sampling_rate not in [8000, 16000]:
             raise ValueError(
                 "VADIterator does not support sampling rates other than [8000, 16000]"
             )
-
+        self.model = model
+        self.threshold = threshold
+        self.sampling_rate = sampling_rate
         self.min_silence_samples = sampling_rate * min_silence_duration_ms / 1000
         self.speech_pad_samples = sampling_rate * speech_pad_ms / 1000
-        self.reset_states()
+        pre_roll_ms = speech_pad_ms if pre_roll_ms is None else pre_roll_ms
+        self.pre_roll_samples = sampling_rate * pre_roll_ms / 1000
+        self.triggered = np.zeros(0, dtype=bool)
+        self.temp_end = np.zeros(0, dtype=np.int64)
+        self.current_sample = np.zeros(0, dtype=np.int64)
+        self.buffers = []
+        self.free = []
+        self.grow(capacity)
 
-    def reset_states(self):
-        self.model.reset_states()
-        self.triggered = False
-        self.temp_end = 0
-        self.current_sample = 0
+    def grow(self, capacity):
+        size = len(self.triggered)
+        self.triggered = np.concatenate([self.triggered, np.zeros(capacity, dtype=bool)])
+        self.temp_end = np.concatenate([self.temp_end, np.zeros(capacity, dtype=np.int64)])
+        self.current_sample = np.concatenate([self.current_sample, np.zeros(capacity, dtype=np.int64)])
+        self.buffers.extend(SpeechBuffer(self.pre_roll_samples) for _ in range(capacity))
+        self.free.extend(range(size + capacity - 1, size - 1, -1))
 
-    @torch.no_grad()
-    def __call__(self, x):
+    def open(self):
         """
-        x: torch.Tensor
-            audio chunk (see examples in repo)
-
-        return_seconds: bool (default - False)
-            whether return timestamps in seconds (default - samples)
+        Allocates the slot of a new stream and returns it.
         """
+        if not self.free:
+            self.grow(len(self.triggered))
+        slot = self.free.pop()
+        self.triggered[slot] = False
+        self.temp_end[slot] = 0
+        self.current_sample[slot] = 0
+        self.buffers[slot].reset()
+        self.model.reset(slot)
+        return slot
 
-        if not torch.is_tensor(x):
-            try:
-                x = torch.Tensor(x)
-            except Exception:
-                raise TypeError("Audio cannot be casted to tensor. Cast it manually")
-
-        window_size_samples = len(x[0]) if x.dim() == 2 else len(x)
-        self.current_sample += window_size_samples
+    def close(self, slot):
+        self.buffers[slot].reset()
+        self.model.reset(slot)
+        self.free.append(slot)
 
-        speech_prob = self.model(x, self.sampling_rate).item()
+    def __call__(self, slots, windows):
+        """
+        slots: list of int
+            slots of the streams, each at most once
 
-        if (speech_prob >= self.threshold) and self.temp_end:
-            self.temp_end = 0
+        windows: np.ndarray
+            the next window of each stream (len(slots) x window size), float32
 
-        if (speech_prob >= self.threshold) and not self.triggered:
-            self.triggered = True
-            return None
+        Returns a boolean array telling which streams started speaking with this window, and the list of
+        (position in `slots`, spoken utterance as a float32 array) of the streams whose speech ended.
+        """
+        slots = np.asarray(slots)
+        self.current_sample[slots] += windows.shape[-1]
+        speech_prob = self.model(slots, windows)
 
-        if (speech_prob < self.threshold - 0.15) and self.triggered:
-            if not self.temp_end:
-                self.temp_end = self.current_sample
-            if self.current_sample - self.temp_end < self.min_silence_samples:
-                return None
-            else:
-                # end of speak
-                self.temp_end = 0
-                self.triggered = False
-                spoken_utterance = self.buffer
-                self.buffer = []
-                return spoken_utterance
+        speech = speech_prob >= self.threshold
+        silence = speech_prob < self.threshold - 0.15
+        triggered = self.triggered[slots]
+        temp_end = self.temp_end[slots]
+        current_sample = self.current_sample[slots]
 
-        if self.triggered:
-            self.buffer.append(x)
+        temp_end[speech] = 0
+        started = speech & ~triggered
+        triggered |= started
+        ending = silence & triggered
+        temp_end = np.where(ending & (temp_end == 0), current_sample, temp_end)
+        ended = ending & (current_sample - temp_end >= self.min_silence_samples)
+        # end of speak
+        temp_end[ended] = 0
+        triggered[ended] = False
+        self.triggered[slots] = triggered
+        self.temp_end[slots] = temp_end
 
-        return None
+        utterances = []
+        for position, slot in enumerate(slots):
+            buffer = self.buffers[slot]
+            if started[position]:
+                buffer.start(windows[position])
+            elif ended[position]:
+                utterances.append((position, buffer.emit(self.speech_pad_samples)))
+            elif triggered[position]:
+                buffer.append(windows[position], speech=not ending[position])
+            else:
+                buffer.listen(windows[position])
+        return started, utterances
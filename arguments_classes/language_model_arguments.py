@@ -69,3 +69,9 @@ class LanguageModelHandlerArguments:
             "help": "Number of interactions assitant-user to keep for the chat. None for no limitations."
         },
     )
+    lm_max_batch_size: int = field(
+        default=1,
+        metadata={
+            "help": "Maximum number of prompts, from different sessions, decoded together with continuous batching. Default is 1 (no batching, one `generate` call per prompt)."
+        },
+    )
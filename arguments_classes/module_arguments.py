@@ -11,7 +11,7 @@ class ModuleArguments:
     mode: Optional[str] = field(
         default="socket",
         metadata={
-            "help": "The mode to run the pipeline in. Either 'local' or 'socket'. Default is 'socket'."
+            "help": "The mode to run the pipeline in. Either 'local', 'socket' or 'replay' (WAV files in, WAV files and a latency report out, see --replay_files). Default is 'socket'."
         },
     )
     local_mac_optimal_settings: bool = field(
@@ -20,22 +20,52 @@ class ModuleArguments:
             "help": "If specified, sets the optimal settings for Mac OS. Hence whisper-mlx, MLX LM and MeloTTS will be used."
         },
     )
+    vad: str = field(
+        default="silero",
+        metadata={
+            "help": "The VAD to use. Either 'silero' (TorchScript model from torch hub) or 'silero-onnx' (ONNX model run with onnxruntime, loaded from --vad_model_path, works offline). Default is 'silero'."
+        },
+    )
     stt: Optional[str] = field(
         default="whisper",
         metadata={
-            "help": "The STT to use. Either 'whisper', 'whisper-mlx', 'faster-whisper', and 'paraformer'. Default is 'whisper'."
+            "help": "The STT to use. Either 'whisper', 'whisper-mlx', 'faster-whisper', 'paraformer' or 'stub' (no model, fixed latency, for benchmarks). Default is 'whisper'."
         },
     )
     llm: Optional[str] = field(
         default="transformers",
         metadata={
-            "help": "The LLM to use. Either 'transformers' or 'mlx-lm'. Default is 'transformers'"
+            "help": "The LLM to use. Either 'transformers', 'mlx-lm' or 'stub' (no model, fixed latency and token rate, for benchmarks). Default is 'transformers'"
         },
     )
     tts: Optional[str] = field(
         default="parler",
         metadata={
-            "help": "The TTS to use. Either 'parler', 'melo', 'chatTTS' or 'facebookMMS'. Default is 'parler'"
+            "help": "The TTS to use. Either 'parler', 'melo', 'chatTTS', 'facebookMMS' or 'stub' (no model, fixed latency and tone, for benchmarks). Default is 'parler'"
+        },
+    )
+    execution: str = field(
+        default="thread",
+        metadata={
+            "help": "How the handlers are run: 'thread' (one interpreter), 'process' (one process per handler, to use all the cores) or 'asyncio' (the stages as tasks of one event loop, model calls in one executor thread per stage). The process mode serves the default session only, without barge-in. Default is 'thread'."
+        },
+    )
+    parallel_startup: bool = field(
+        default=True,
+        metadata={
+            "help": "Loads and warms up the VAD, STT, LM and TTS models concurrently, in threads, instead of one after the other, and logs a per-stage startup timeline. Pass --parallel_startup False if a model does not support it (e.g. concurrent torch.compile). Default is True."
+        },
+    )
+    precompile: bool = field(
+        default=False,
+        metadata={
+            "help": "Compiles and warms up every shape bucket of the STT and TTS models with the given --stt_compile_mode / --tts_compile_mode and stores them in the compile cache (tmp/), then exits. The next starts with the same models and settings load the compiled graphs instead of building them and skip the redundant warmup steps. Default is False."
+        },
+    )
+    cpu_budget: Optional[str] = field(
+        default=None,
+        metadata={
+            "help": "Intra-op threads and CPU cores of each stage, so that the stages running at the same time do not oversubscribe the cores: 'auto' splits the available cores (one for the VAD, the rest shared 1:2:1 between STT, LM and TTS), or give '<stage>=<threads>[@<cpus>]' per stage, e.g. 'vad=1@0,stt=3@1-3,lm=8@4-11,tts=4@12-15' ('+' joins CPU ranges). Default is None (torch defaults: every stage uses all the cores)."
         },
     )
     log_level: str = field(
@@ -44,3 +74,15 @@ class ModuleArguments:
             "help": "Provide logging level. Example --log_level debug, default=info."
         },
     )
+    metrics_port: Optional[int] = field(
+        default=None,
+        metadata={
+            "help": "If specified, serves queue depths, stage latencies, real-time factors and readiness in the Prometheus text format on http://<metrics_host>:<metrics_port>/metrics. Default is None (disabled)."
+        },
+    )
+    metrics_host: str = field(
+        default="0.0.0.0",
+        metadata={
+            "help": "The host IP address of the metrics endpoint. Default is '0.0.0.0'."
+        },
+    )
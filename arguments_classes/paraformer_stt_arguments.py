@@ -15,3 +15,15 @@ class ParaformerSTTHandlerArguments:
             "help": "The device type on which the model will run. Default is 'cuda' for GPU acceleration."
         },
     )
+    paraformer_stt_max_batch_size: int = field(
+        default=1,
+        metadata={
+            "help": "Maximum number of utterances, possibly from different sessions, transcribed together. Default is 1 (no batching)."
+        },
+    )
+    paraformer_stt_max_batch_wait_ms: int = field(
+        default=0,
+        metadata={
+            "help": "How long to wait for more utterances to fill a batch when several sessions are open. Measured in milliseconds. Default is 0 ms."
+        },
+    )
@@ -59,6 +59,18 @@ class ParlerTTSHandlerArguments:
             "help": "When using compilation, the prompt as to be padded to closest power of 2. This parameters sets the maximun power of 2 possible."
         },
     )
+    tts_max_batch_size: int = field(
+        default=1,
+        metadata={
+            "help": "Maximum number of pending sentences, from one answer or from several sessions, synthesized together. Batches are not streamed. Default is 1 (no batching)."
+        },
+    )
+    tts_max_batch_wait_ms: int = field(
+        default=0,
+        metadata={
+            "help": "How long to wait for more sentences to fill a batch when several sessions are open. Measured in milliseconds. Default is 0 ms."
+        },
+    )
     use_default_speakers_list: bool = field(
         default=False,
         metadata={
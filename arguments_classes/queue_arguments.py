@@ -0,0 +1,71 @@
+from dataclasses import dataclass, field
+
+
+@dataclass
+class QueueArguments:
+    recv_audio_chunks_queue_size: int = field(
+        default=512,
+        metadata={
+            "help": "Capacity of the queue of raw audio chunks between the receiver and the VAD, 0 for unbounded. Default is 512 chunks (~16 s of 512-sample chunks)."
+        },
+    )
+    recv_audio_chunks_queue_policy: str = field(
+        default="drop_oldest",
+        metadata={
+            "help": "What to do when the raw audio queue is full: 'block', 'drop_oldest' or 'coalesce'. Default is 'drop_oldest', live audio that cannot be processed in time is stale anyway."
+        },
+    )
+    spoken_prompt_queue_size: int = field(
+        default=16,
+        metadata={
+            "help": "Capacity of the queue of utterances between the VAD and the STT, 0 for unbounded. Default is 16."
+        },
+    )
+    spoken_prompt_queue_policy: str = field(
+        default="block",
+        metadata={
+            "help": "What to do when the utterance queue is full: 'block', 'drop_oldest' or 'coalesce'. Default is 'block'."
+        },
+    )
+    text_prompt_queue_size: int = field(
+        default=16,
+        metadata={
+            "help": "Capacity of the queue of transcriptions between the STT and the LLM, 0 for unbounded. Default is 16."
+        },
+    )
+    text_prompt_queue_policy: str = field(
+        default="block",
+        metadata={
+            "help": "What to do when the transcription queue is full: 'block', 'drop_oldest' or 'coalesce'. Default is 'block'."
+        },
+    )
+    lm_response_queue_size: int = field(
+        default=64,
+        metadata={
+            "help": "Capacity of the queue of sentences between the LLM and the TTS, 0 for unbounded. Default is 64."
+        },
+    )
+    lm_response_queue_policy: str = field(
+        default="coalesce",
+        metadata={
+            "help": "What to do when the sentence queue is full: 'block', 'drop_oldest' or 'coalesce'. Default is 'coalesce', which merges the new sentence into the last queued one so that the TTS catches up with fewer calls."
+        },
+    )
+    send_audio_chunks_queue_size: int = field(
+        default=2048,
+        metadata={
+            "help": "Capacity of the queue of synthesized audio chunks between the TTS and the sender, 0 for unbounded. Default is 2048 chunks."
+        },
+    )
+    send_audio_chunks_queue_policy: str = field(
+        default="block",
+        metadata={
+            "help": "What to do when the synthesized audio queue is full: 'block', 'drop_oldest' or 'coalesce'. Default is 'block', which slows the TTS down to the pace of the client."
+        },
+    )
+    shared_audio_buffers: bool = field(
+        default=False,
+        metadata={
+            "help": "If specified, the raw audio in and out goes through preallocated shared-memory ring buffers of 512-sample slots instead of queues, with the sizes and policies ('block' or 'drop_oldest') above. Serves the default session only. Default is False."
+        },
+    )
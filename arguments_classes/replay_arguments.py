@@ -0,0 +1,36 @@
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+
+@dataclass
+class ReplayArguments:
+    replay_files: List[str] = field(
+        default_factory=list,
+        metadata={
+            "help": "The 16-bit PCM WAV files played into the pipeline in 'replay' mode, one user turn each, in order."
+        },
+    )
+    replay_speed: float = field(
+        default=1.0,
+        metadata={
+            "help": "Pace of the replay relative to real time, e.g. 2.0 feeds the audio twice as fast, 0 as fast as possible. Default is 1.0."
+        },
+    )
+    replay_silence_ms: int = field(
+        default=1500,
+        metadata={
+            "help": "Silence appended to each file so that the VAD detects the end of speech, in milliseconds. Should exceed --min_silence_ms. Default is 1500."
+        },
+    )
+    replay_output_dir: str = field(
+        default="replay_output",
+        metadata={
+            "help": "Directory the synthesized answers are written to, as <file stem>_answer.wav. Default is 'replay_output'."
+        },
+    )
+    replay_report: Optional[str] = field(
+        default=None,
+        metadata={
+            "help": "Path of the JSON latency report. Default is <replay_output_dir>/latency_report.json."
+        },
+    )
@@ -19,6 +19,6 @@ class SocketReceiverArguments:
     chunk_size: int = field(
         default=1024,
         metadata={
-            "help": "The size of each data chunk to be sent or received over the socket. Default is 1024 bytes."
+            "help": "The size of each data chunk to be sent or received over the socket. Any even size works, the VAD cuts the audio into model windows: larger chunks mean fewer reads. Default is 1024 bytes."
         },
     )
@@ -0,0 +1,29 @@
+from dataclasses import dataclass, field
+
+
+@dataclass
+class StubLanguageModelHandlerArguments:
+    stub_lm_first_token_ms: float = field(
+        default=100,
+        metadata={
+            "help": "Time to the first token of the stub LLM, in milliseconds. Default is 100."
+        },
+    )
+    stub_lm_tokens_per_s: float = field(
+        default=50.0,
+        metadata={
+            "help": "Rate of the next tokens of the stub LLM, one word being one token, 0 for no delay. Default is 50."
+        },
+    )
+    stub_lm_response: str = field(
+        default="It is sunny and warm today. A light breeze comes from the west. Enjoy your day!",
+        metadata={
+            "help": "The answer of the stub LLM to every prompt, yielded sentence by sentence."
+        },
+    )
+    stub_lm_language: str = field(
+        default="en",
+        metadata={
+            "help": "The language code of the answers, when the prompt does not come with one. Default is 'en'."
+        },
+    )
@@ -0,0 +1,29 @@
+from dataclasses import dataclass, field
+
+
+@dataclass
+class StubSTTHandlerArguments:
+    stub_stt_latency_ms: float = field(
+        default=50,
+        metadata={
+            "help": "Time the stub STT takes for each utterance, in milliseconds. Default is 50."
+        },
+    )
+    stub_stt_ms_per_audio_second: float = field(
+        default=10,
+        metadata={
+            "help": "Time the stub STT takes for each second of audio, on top of the latency, in milliseconds. Default is 10."
+        },
+    )
+    stub_stt_text: str = field(
+        default="What is the weather like today?",
+        metadata={
+            "help": "The transcription returned by the stub STT for every utterance."
+        },
+    )
+    stub_stt_language: str = field(
+        default="en",
+        metadata={
+            "help": "The language code returned along with the transcription. Default is 'en'."
+        },
+    )
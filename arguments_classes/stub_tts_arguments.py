@@ -0,0 +1,29 @@
+from dataclasses import dataclass, field
+
+
+@dataclass
+class StubTTSHandlerArguments:
+    stub_tts_latency_ms: float = field(
+        default=50,
+        metadata={
+            "help": "Time to the first audio chunk of each sentence of the stub TTS, in milliseconds. Default is 50."
+        },
+    )
+    stub_tts_realtime_factor: float = field(
+        default=0.1,
+        metadata={
+            "help": "Time the stub TTS takes to produce the next chunks, relative to their duration, 0 for no delay. Default is 0.1."
+        },
+    )
+    stub_tts_ms_per_char: float = field(
+        default=60,
+        metadata={
+            "help": "Duration of the audio produced by the stub TTS per character of the sentence, in milliseconds. Default is 60."
+        },
+    )
+    stub_tts_blocksize: int = field(
+        default=512,
+        metadata={
+            "help": "Size of the audio chunks of the stub TTS, in samples. Default is 512."
+        },
+    )
@@ -1,4 +1,5 @@
 from dataclasses import dataclass, field
+from typing import Optional
 
 
 @dataclass
@@ -45,3 +46,39 @@ class VADHandlerArguments:
             "help": "improves sound quality by applying techniques like noise reduction, equalization, and echo cancellation. Default is False."
         },
     )
+    deadline_s: float = field(
+        default=0.0,
+        metadata={
+            "help": "Time budget, in seconds from the end of an utterance, for the first audio of its answer. Utterances that a stage cannot start on before their deadline are dropped by that stage instead of being answered late, which bounds the latency when the pipeline falls behind. 0 disables the deadlines. Default is 0."
+        },
+    )
+    barge_in: bool = field(
+        default=False,
+        metadata={
+            "help": "Lets the user interrupt the answer: the audio keeps being analysed while the answer is played, and detected speech cancels the running generations and the queued audio. Use with echo cancellation on the client side. Default is False."
+        },
+    )
+    vad_max_batch_size: int = field(
+        default=32,
+        metadata={
+            "help": "Maximum number of queued audio chunks, from all the sessions, scored by the VAD model together: the current window of every session goes through a single batched forward call. Default is 32."
+        },
+    )
+    vad_max_batch_wait_ms: int = field(
+        default=0,
+        metadata={
+            "help": "How long the VAD waits for the chunks of other sessions before running a batch, only when several sessions are open. Default is 0 (only the chunks already queued are batched)."
+        },
+    )
+    vad_pre_roll_ms: Optional[int] = field(
+        default=None,
+        metadata={
+            "help": "Audio kept before the chunk where speech is detected, so that the start of the speech is not cut. Measured in milliseconds. Default is None, i.e. speech_pad_ms."
+        },
+    )
+    vad_model_path: Optional[str] = field(
+        default=None,
+        metadata={
+            "help": "Local VAD model, so that no network access is needed: the silero_vad.onnx file with --vad silero-onnx (default: the one of the silero-vad package, if installed), a clone of the silero-vad repository with --vad silero. Default is None."
+        },
+    )
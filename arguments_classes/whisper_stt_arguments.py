@@ -52,6 +52,18 @@ class WhisperSTTHandlerArguments:
             "help": "The task to perform, typically 'transcribe' for transcription. Default is 'transcribe'."
         },
     )
+    stt_max_batch_size: int = field(
+        default=1,
+        metadata={
+            "help": "Maximum number of utterances, possibly from different sessions, transcribed together. Default is 1 (no batching)."
+        },
+    )
+    stt_max_batch_wait_ms: int = field(
+        default=0,
+        metadata={
+            "help": "How long to wait for more utterances to fill a batch when several sessions are open. Measured in milliseconds. Default is 0 ms."
+        },
+    )
     language: Optional[str] = field(
         default='en',
         metadata={
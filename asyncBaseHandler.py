@@ -0,0 +1,227 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
+from time import perf_counter
+import logging
+
+from baseHandler import BaseHandler
+from utils.envelope import END, Control, is_end
+from utils.pipeline_queue import Handoff
+from utils.utils import audio_duration
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class AsyncBaseHandler(BaseHandler):
+    """
+    Asyncio counterpart of BaseHandler, run as a task of the pipeline event loop by `AsyncPipelineManager` and
+    connected to the other stages by `AsyncPipelineQueue`s.
+    `run_async` awaits its inputs instead of blocking on `queue_in`, and the model calls run in the handler's
+    `executor`, a single thread, so that they never block the loop and always run one at a time in the same thread.
+    `process_async` is an async generator. By default it runs the blocking `process` generator one step at a time
+    in the executor, so that any handler runs unchanged (see `asyncify`); handlers streaming a generation override
+    it with `stream`, which yields what the generation streams without a helper thread.
+    """
+
+    executor = None
+
+    async def run_async(self):
+        while not self.stop_event.is_set():
+            input = await self.queue_in.get()
+            if is_end(input):
+                # sentinelle signal to avoid queue deadlock
+                logger.debug("Stopping task")
+                break
+            if isinstance(input, Handoff):
+                return self.hand_over(input)
+            if isinstance(input, Control):
+                if self.control(input):
+                    await self.put_output_async(input)
+                continue
+            self.metrics.observe_input(self.queue_wait())
+            batch, end = await self.get_batch_async(input)
+            self.notify("batch_start")
+            await self.run_batch_async(batch)
+            self.notify("batch_end")
+            if isinstance(end, Handoff):
+                return self.hand_over(end)
+            if end:
+                logger.debug("Stopping task")
+                break
+
+        self.cleanup()
+        await self.queue_out.put(END)
+
+    async def get_batch_async(self, first):
+        """
+        Same as `get_batch`, awaiting the queue.
+        """
+        batch = [first]
+        wait = self.max_batch_wait_ms / 1000 if len(self.sessions) > 1 else 0
+        deadline = perf_counter() + wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - perf_counter()
+            try:
+                if remaining > 0:
+                    input = await asyncio.wait_for(self.queue_in.get(), remaining)
+                else:
+                    input = self.queue_in.get_nowait()
+            except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                break
+            if is_end(input) or isinstance(input, Handoff):
+                return batch, input
+            if isinstance(input, Control):
+                if self.control(input):
+                    await self.put_output_async(input)
+                continue
+            self.metrics.observe_input(self.queue_wait())
+            batch.append(input)
+        return batch, None
+
+    async def run_batch_async(self, batch):
+        session_ids, inputs = self.unpack_batch(batch)
+        if not inputs:
+            return
+        if len(inputs) > 1:
+            logger.debug(f"{self.__class__.__name__}: processing a batch of {len(inputs)}")
+        batch_start = start_time = perf_counter()
+        process_time, audio_seconds = 0.0, 0.0
+        async with aclosing(self.process_batch_async(inputs)) as outputs:
+            async for index, output in outputs:
+                elapsed = perf_counter() - start_time
+                process_time += elapsed
+                self.record_time(elapsed)
+                if self.audio_side == "output":
+                    audio_seconds += audio_duration(output)
+                output = self.pack_output(index, output, session_ids[index])
+                if output is None:
+                    start_time = perf_counter()
+                    continue
+                await self.put_output_async(output)
+                start_time = perf_counter()
+        self.expire_unstarted()
+        if self.audio_side == "input":
+            # the batch is done once the generator is exhausted, even if nothing was yielded
+            process_time = perf_counter() - batch_start
+            audio_seconds = sum(audio_duration(input) for input in inputs)
+        if audio_seconds:
+            self.metrics.observe_audio(audio_seconds, process_time)
+
+    async def process_batch_async(self, inputs):
+        """
+        Default implementation, processing the batch one object at a time with `process_async`, unless the
+        handler batches in `process_batch` (e.g. one `generate` call for the whole batch), which then runs in
+        the executor.
+        """
+        if len(inputs) > 1 and type(self).process_batch is not BaseHandler.process_batch:
+            async with aclosing(self.iterate(self.process_batch(inputs))) as outputs:
+                async for index, output in outputs:
+                    yield index, output
+            return
+        for index, input in enumerate(inputs):
+            self.select(index)
+            async with aclosing(self.process_async(input)) as outputs:
+                async for output in outputs:
+                    if self.cancelled() and not isinstance(output, Control):
+                        logger.debug(f"{self.__class__.__name__}: turn interrupted")
+                        break
+                    yield index, output
+
+    async def process_async(self, input):
+        async with aclosing(self.iterate(self.process(input))) as outputs:
+            async for output in outputs:
+                yield output
+
+    async def put_output_async(self, output):
+        """
+        Same as `put_output`: waits for room in a bounded `queue_out`, unless the pipeline is stopping.
+        """
+        try:
+            self.queue_out.put_nowait(output)
+        except asyncio.QueueFull:
+            while True:
+                try:
+                    await asyncio.wait_for(self.queue_out.put(output), 0.1)
+                    break
+                except asyncio.TimeoutError:
+                    if self.stop_event.is_set():
+                        logger.debug(f"{self.__class__.__name__}: output dropped while stopping")
+                        return False
+        self.notify("output", output)
+        return True
+
+    def offload(self, function, *args):
+        """
+        Runs `function(*args)` in the executor of the handler, and returns the future of its result.
+        """
+        if self.executor is None:
+            name = self.__class__.__name__
+            self.executor = ThreadPoolExecutor(
+                max_workers=1,
+                thread_name_prefix=name,
+                initializer=self.cpu_budget.apply if self.cpu_budget is not None else None,
+                initargs=(name,) if self.cpu_budget is not None else (),
+            )
+        return asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    async def iterate(self, outputs):
+        """
+        Runs the blocking generator `outputs` one step at a time in the executor.
+        """
+        try:
+            while True:
+                output = await self.offload(next, outputs, _DONE)
+                if output is _DONE:
+                    return
+                yield output
+        finally:
+            # after the step in progress, if any: the executor runs one call at a time
+            await self.offload(outputs.close)
+
+    async def stream(self, generate, streamer):
+        """
+        Runs `generate()` in the executor and yields what it puts in `streamer`, an async iterator fed from the
+        generation thread (e.g. `AsyncTextIteratorStreamer`). An exception of the generation is raised here.
+        """
+        generation = self.offload(generate)
+        try:
+            while True:
+                item = asyncio.ensure_future(streamer.__anext__())
+                await asyncio.wait({item, generation}, return_when=asyncio.FIRST_COMPLETED)
+                if generation.done() and generation.exception() is not None:
+                    # the generation failed before ending the stream
+                    item.cancel()
+                    break
+                try:
+                    yield await item
+                except StopAsyncIteration:
+                    break
+        finally:
+            await generation
+
+    def release(self):
+        super().release()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+
+_async_classes = {}
+
+
+def asyncify(handler_class):
+    """
+    The AsyncBaseHandler version of the BaseHandler subclass `handler_class`, with the same name. Its own
+    `process_async`, if any, takes precedence over the default one.
+    """
+    if issubclass(handler_class, AsyncBaseHandler):
+        return handler_class
+    if handler_class not in _async_classes:
+        _async_classes[handler_class] = type(
+            handler_class.__name__,
+            (handler_class, AsyncBaseHandler),
+            {"__module__": handler_class.__module__, "__qualname__": handler_class.__qualname__},
+        )
+    return _async_classes[handler_class]
@@ -1,6 +1,14 @@
+from queue import Empty, Full
 from time import perf_counter
 import logging
 
+from utils.deadline import DeadlineTracker
+from utils.envelope import END, Control, Envelope, is_end, to_client
+from utils.metrics import HandlerMetrics
+from utils.pipeline_queue import Handoff
+from utils.session import SessionManager, SessionMessage, session_id_of
+from utils.utils import audio_duration
+
 logger = logging.getLogger(__name__)
 
 
@@ -8,17 +16,39 @@ class BaseHandler:
     """
     Base class for pipeline parts. Each part of the pipeline has an input and an output queue.
     The `setup` method along with `setup_args` and `setup_kwargs` can be used to address the specific requirements of the implemented pipeline part.
-    To stop a handler properly, set the stop_event and, to avoid queue deadlocks, place b"END" in the input queue.
+    To stop a handler properly, set the stop_event and, to avoid queue deadlocks, place `END` in the input queue.
     Objects placed in the input queue will be processed by the `process` method, and the yielded results will be placed in the output queue.
-    The cleanup method handles stopping the handler, and b"END" is placed in the output queue.
+    The cleanup method handles stopping the handler, and `END` is placed in the output queue.
+    The stages pass their objects in an `Envelope` (created by the VAD), processed on behalf of its session and turn:
+    `self.session` points to the session while `process` runs and the results are put in an envelope derived from
+    the input's (see `wrap_output`).
+    Handlers setting `max_batch_size` > 1 get the objects queued within `max_batch_wait_ms` in a single call to
+    `process_batch`, which yields `(index, output)` pairs so that each output is routed back to its session.
+    Each handler keeps bounded latency histograms of its inputs' time in queue and of its processing time in `metrics`.
     """
 
-    def __init__(self, stop_event, queue_in, queue_out, setup_args=(), setup_kwargs={}):
+    max_batch_size = 1
+    max_batch_wait_ms = 0
+    # "input" for handlers consuming audio (STT), "output" for handlers producing it (TTS): used to compute
+    # the real-time factor of the handler
+    audio_side = None
+    # `CpuBudget` applied by the thread running the handler, if any
+    cpu_budget = None
+
+    def __init__(self, stop_event, queue_in, queue_out, setup_args=(), setup_kwargs={}, sessions=None):
         self.stop_event = stop_event
         self.queue_in = queue_in
         self.queue_out = queue_out
+        self.sessions = sessions if sessions is not None else SessionManager()
+        self.session = self.sessions.default
+        self.turn = self.session.turn
+        self.envelope = None
+        self.deadlines = DeadlineTracker()
+        self.metrics = HandlerMetrics()
+        self._last_time = 0.0
+        self.listeners = []
+        self.busy = False
         self.setup(*setup_args, **setup_kwargs)
-        self._times = []
 
     def setup(self):
         pass
@@ -29,28 +59,330 @@ class BaseHandler:
     def run(self):
         while not self.stop_event.is_set():
             input = self.queue_in.get()
-            if isinstance(input, bytes) and input == b"END":
+            if is_end(input):
                 # sentinelle signal to avoid queue deadlock
                 logger.debug("Stopping thread")
                 break
+            if isinstance(input, Handoff):
+                return self.hand_over(input)
+            if isinstance(input, Control):
+                if self.control(input):
+                    self.put_output(input)
+                continue
+            self.metrics.observe_input(self.queue_wait())
+            batch, end = self.get_batch(input)
+            self.notify("batch_start")
+            self.run_batch(batch)
+            self.notify("batch_end")
+            if isinstance(end, Handoff):
+                return self.hand_over(end)
+            if end:
+                logger.debug("Stopping thread")
+                break
+
+        self.cleanup()
+        self.queue_out.put(END)
+
+    def control(self, message):
+        """
+        Applies a "cancel" or "flush" `Control` message to the handler, and returns whether to pass it on: the
+        TTS keeps it, its output goes to the clients. "cancel" makes the handler catch up with the turn of its
+        session when the stages do not share a `SessionManager`; the envelopes of an older turn than their
+        session's are then dropped as soon as they are got (see `unpack_batch`).
+        """
+        session = self.sessions.get(message.session_id)
+        if message.kind == "cancel" and message.turn > session.turn:
+            # the stages do not share the session (process execution): catch up with the turn of the VAD
+            session.turn = message.turn
+        elif message.kind == "flush" and hasattr(self.queue_in, "flush"):
+            session_id = session_id_of(message)
+            flushed = self.queue_in.flush(lambda item: session_id_of(item) == session_id)
+            logger.debug(f"{self.__class__.__name__}: {flushed} items flushed")
+        if message.kind == "flush":
+            self.deadlines.forget(message.session_id)
+        return self.audio_side != "output"
+
+    def hand_over(self, handoff):
+        """
+        Gives the stage to `handoff.successor`, which keeps the listeners, and returns it so that the thread
+        runs it next. Called on a `Handoff` got from the input queue, between two batches: `run` then returns
+        the successor instead of placing `END` in the output queue.
+        """
+        successor = handoff.successor
+        logger.info(f"{self.__class__.__name__}: handing over to {successor.__class__.__name__}")
+        successor.listeners.extend(self.listeners)
+        self.cleanup()
+        handoff.done.set()
+        return successor
+
+    def get_batch(self, first):
+        """
+        Collects up to `max_batch_size` objects, starting with `first`. Objects already queued are always taken,
+        but the handler only waits `max_batch_wait_ms` for more when several sessions are open, so that a
+        single user never pays for the batching window.
+        Returns the batch and the control item met while collecting it (`END` or a `Handoff`), if any. The "cancel"
+        and "flush" messages met are applied and passed on right away.
+        """
+        batch = [first]
+        wait = self.max_batch_wait_ms / 1000 if len(self.sessions) > 1 else 0
+        deadline = perf_counter() + wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - perf_counter()
+            try:
+                if remaining > 0:
+                    input = self.queue_in.get(timeout=remaining)
+                else:
+                    input = self.queue_in.get_nowait()
+            except Empty:
+                break
+            if is_end(input) or isinstance(input, Handoff):
+                return batch, input
+            if isinstance(input, Control):
+                if self.control(input):
+                    self.put_output(input)
+                continue
+            self.metrics.observe_input(self.queue_wait())
+            batch.append(input)
+        return batch, None
+
+    def run_batch(self, batch):
+        session_ids, inputs = self.unpack_batch(batch)
+        if not inputs:
+            return
+        if len(inputs) > 1:
+            logger.debug(f"{self.__class__.__name__}: processing a batch of {len(inputs)}")
+        batch_start = start_time = perf_counter()
+        process_time, audio_seconds = 0.0, 0.0
+        for index, output in self.process_batch(inputs):
+            elapsed = perf_counter() - start_time
+            process_time += elapsed
+            self.record_time(elapsed)
+            if self.audio_side == "output":
+                audio_seconds += audio_duration(output)
+            output = self.pack_output(index, output, session_ids[index])
+            if output is None:
+                start_time = perf_counter()
+                continue
+            self.put_output(output)
             start_time = perf_counter()
+        self.expire_unstarted()
+        if self.audio_side == "input":
+            # the batch is done once the generator is exhausted, even if nothing was yielded
+            process_time = perf_counter() - batch_start
+            audio_seconds = sum(audio_duration(input) for input in inputs)
+        if audio_seconds:
+            self.metrics.observe_audio(audio_seconds, process_time)
+
+    def unpack_batch(self, batch):
+        """
+        Takes the payloads of the batch out of their envelopes (or session tags) and sets its sessions, turns and
+        envelopes. Envelopes of an interrupted turn or past their deadline are skipped. Returns the session IDs
+        and the payloads.
+        """
+        session_ids, inputs, envelopes = [], [], []
+        for input in batch:
+            envelope, session_id = None, None
+            if isinstance(input, Envelope):
+                envelope, session_id, input = input, input.session_id, input.payload
+                session = self.sessions.get(session_id)
+                if envelope.turn < session.turn:
+                    logger.debug(f"{self.__class__.__name__}: input of an interrupted turn dropped")
+                    continue
+                if envelope.turn > session.turn:
+                    # the "cancel" message of the new turn is still on its way (process execution)
+                    session.turn = envelope.turn
+                if self.deadlines.expired(envelope):
+                    self.expire(session)
+                    continue
+            elif isinstance(input, SessionMessage):
+                session_id, input = input
+            session_ids.append(session_id)
+            inputs.append(input)
+            envelopes.append(envelope)
+        self.batch_sessions = [self.sessions.get(session_id) for session_id in session_ids]
+        self.batch_turns = [session.turn for session in self.batch_sessions]
+        self.batch_envelopes = envelopes
+        return session_ids, inputs
+
+    def pack_output(self, index, output, session_id):
+        """
+        Puts `output` of `inputs[index]` in an envelope derived from the input's (or tags it with its session), or
+        returns None when nobody is waiting for it anymore: the user barged in, or its deadline passed before it
+        was started. The envelopes and control messages created by the handler (VAD) get the session of the input.
+        """
+        if isinstance(output, Control):
+            output.session_id = session_id
+            return output
+        if self.cancelled(index):
+            return None
+        if isinstance(output, Envelope):
+            output.session_id = session_id
+            return output
+        return self.wrap_output(output, self.batch_envelopes[index], session_id)
+
+    def wrap_output(self, output, envelope, session_id):
+        """
+        Puts `output` in an envelope derived from `envelope`, the input's, stamping the first output of the input.
+        """
+        if envelope is None:
+            return output if session_id is None else SessionMessage(session_id, output)
+        if self.deadlines.start(envelope):
+            envelope.stamp(self.__class__.__name__)
+            if self.audio_side == "output":
+                self.observe_turn(envelope)
+        output = envelope.derive(output)
+        if self.audio_side == "output":
+            return to_client(output)
+        if isinstance(output.payload, tuple) and len(output.payload) == 2 and isinstance(output.payload[1], str):
+            # (text, language_code)
+            output.language = output.payload[1]
+        return output
+
+    def observe_turn(self, envelope):
+        """
+        Records the latency of the turn of `envelope`, from the end of speech to its first audio.
+        """
+        latency = envelope.stamps[-1][1] - envelope.created
+        self.metrics.observe_turn(latency)
+        logger.info(f"Time to first audio: {latency:.3f}")
+        logger.debug(
+            "Per stage: " + ", ".join(f"{stage} {seconds:.3f}" for stage, seconds in envelope.latencies().items())
+        )
+
+    def expire_unstarted(self):
+        """
+        Gives up the inputs of the batch whose deadline passed before their first output. Envelopes with a
+        deadline (see the VAD's `deadline_s`) are skipped when it has passed, and their processing stops if it
+        passes before their first output; both are counted in `metrics.expired`.
+        """
+        for index, envelope in enumerate(self.batch_envelopes):
+            if self.deadlines.expired(envelope):
+                self.expire(self.batch_sessions[index])
+
+    def expire(self, session):
+        """
+        Gives up an input past its deadline: nothing will be answered, so the session listens again.
+        """
+        self.metrics.observe_expired()
+        logger.debug(f"{self.__class__.__name__}: input dropped past its deadline")
+        session.should_listen.set()
+
+    def process_batch(self, inputs):
+        """
+        Default implementation, processing the batch one object at a time. `self.batch_sessions[i]` is the
+        session of `inputs[i]`.
+        """
+        for index, input in enumerate(inputs):
+            self.select(index)
             for output in self.process(input):
-                self._times.append(perf_counter() - start_time)
-                if self.last_time > self.min_time_to_debug:
-                    logger.debug(f"{self.__class__.__name__}: {self.last_time: .3f} s")
-                self.queue_out.put(output)
-                start_time = perf_counter()
+                if self.cancelled() and not isinstance(output, Control):
+                    logger.debug(f"{self.__class__.__name__}: turn interrupted")
+                    break
+                yield index, output
 
-        self.cleanup()
-        self.queue_out.put(b"END")
+    def select(self, index):
+        """
+        Makes `inputs[index]` of the current batch the one being processed: `self.session` and `self.turn`.
+        """
+        self.session = self.batch_sessions[index]
+        self.turn = self.batch_turns[index]
+        self.envelope = self.batch_envelopes[index]
+
+    def cancellation(self, index=None):
+        """
+        Returns a callable telling whether the turn of the input being processed (or of `inputs[index]`) has
+        been interrupted since, or its deadline passed before it was started. It is bound to that input, so it
+        can be polled from a generation thread. When a session is interrupted (barge-in), `process` stops at its
+        next output anyway; long generations poll this to stop even earlier.
+        """
+        if index is None:
+            session, turn, envelope = self.session, self.turn, self.envelope
+        else:
+            session, turn, envelope = self.batch_sessions[index], self.batch_turns[index], self.batch_envelopes[index]
+        return lambda: session.turn != turn or self.deadlines.expired(envelope)
+
+    def cancelled(self, index=None):
+        return self.cancellation(index)()
+
+    def put_output(self, output):
+        """
+        Puts `output` in `queue_out`. A bounded queue may make this wait for room, which is how backpressure
+        reaches the upstream stages, but the wait gives up once the pipeline is stopping. The outputs of an
+        interrupted turn are dropped before (see `pack_output`), and the TTS hands its audio to the clients as is,
+        or in a `SessionMessage` for the sessions other than the default one, which the handlers also accept as
+        input.
+        """
+        while True:
+            try:
+                self.queue_out.put(output, timeout=0.1)
+                self.notify("output", output)
+                return True
+            except Full:
+                if self.stop_event.is_set():
+                    logger.debug(f"{self.__class__.__name__}: output dropped while stopping")
+                    return False
+
+    def add_listener(self, listener):
+        """
+        `listener(event, payload)` is called from the handler thread on "batch_start" and "batch_end" around
+        each batch, on "output" for each output put in `queue_out`, and on handler specific events (e.g.
+        "first_token" for the language models).
+        """
+        self.listeners.append(listener)
+
+    def notify(self, event, payload=None):
+        if event in ("batch_start", "batch_end"):
+            self.busy = event == "batch_start"
+        for listener in self.listeners:
+            listener(event, payload)
+
+    def bind_should_listen(self, should_listen):
+        """
+        The default session listens on the pipeline-wide `should_listen` event, other sessions have their own.
+        """
+        self.should_listen = should_listen
+        self.sessions.default.should_listen = should_listen
+
+    def session_state(self, key, factory, session=None):
+        """
+        Returns the state stored under `key` for the session being processed (or `session`), creating it with
+        `factory` on first use.
+        """
+        session = session if session is not None else self.session
+        state = session.state.setdefault(self.__class__.__name__, {})
+        if key not in state:
+            state[key] = factory()
+        return state[key]
+
+    def queue_wait(self):
+        """
+        How long the input just got waited in `queue_in`, when the queue keeps track of it.
+        """
+        return getattr(self.queue_in, "last_wait", None)
+
+    def record_time(self, elapsed):
+        self._last_time = elapsed
+        self.metrics.observe_output(elapsed)
+        if self.last_time > self.min_time_to_debug:
+            logger.debug(f"{self.__class__.__name__}: {self.last_time: .3f} s")
+
+    def get_metrics(self):
+        return self.metrics.snapshot()
 
     @property
     def last_time(self):
-        return self._times[-1]
-    
+        return self._last_time
+
     @property
     def min_time_to_debug(self):
         return 0.001
 
     def cleanup(self):
         pass
+
+    def release(self):
+        """
+        Frees the models, once the handler will not run again (e.g. when evicted from a `ModelCache`), whereas
+        `cleanup` runs each time the handler stops and must leave it reusable.
+        """
+        pass
@@ -0,0 +1,198 @@
+"""
+Measures the overhead of the pipeline plumbing, without any model: chunks of silence go through a chain of
+pass-through handlers run by `ThreadManager`, connected by the same queues as the pipeline, optionally followed
+by a loopback hop through `SocketSender` and `SocketReceiver`. Reports the throughput and the per-chunk latency.
+
+    python benchmark_pipeline.py --stages 4 --messages 20000 --chunk_size 512
+    python benchmark_pipeline.py --queue ring --socket
+
+To time the whole pipeline with deterministic models instead, run it with `--stt stub --llm stub --tts stub`.
+"""
+import argparse
+import json
+import logging
+import socket
+import threading
+from time import perf_counter, sleep
+
+import numpy as np
+
+from baseHandler import BaseHandler
+from connections.socket_receiver import SocketReceiver
+from connections.socket_sender import SocketSender
+from utils.envelope import END, is_end
+from utils.pipeline_queue import PipelineQueue
+from utils.thread_manager import ThreadManager
+
+logger = logging.getLogger(__name__)
+
+
+class PassThroughHandler(BaseHandler):
+    def process(self, chunk):
+        yield chunk
+
+
+class LoopbackReceiver(SocketReceiver):
+    """
+    `SocketReceiver` connecting to the `SocketSender` of the benchmark, instead of waiting for a client.
+    """
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.conn = socket.create_connection((self.host, self.port))
+                break
+            except ConnectionRefusedError:
+                sleep(0.01)
+        while not self.stop_event.is_set():
+            audio_chunk = self.receive_full_chunk(self.conn, self.chunk_size)
+            if audio_chunk is None:
+                self.queue_out.put(END)
+                break
+            self.queue_out.put(audio_chunk if self.reuse_buffer else bytes(audio_chunk))
+        self.conn.close()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def make_queue(args, name):
+    if args.queue == "ring":
+        from utils.audio_ring_buffer import AudioRingBuffer
+
+        return AudioRingBuffer(
+            n_slots=args.queue_size + 2,
+            slot_samples=args.chunk_size,
+            policy=args.policy,
+            name=name,
+        )
+    return PipelineQueue(maxsize=args.queue_size, policy=args.policy, name=name)
+
+
+def percentile(values, q):
+    return round(float(np.percentile(values, q)) * 1000, 3) if len(values) else None
+
+
+def run_benchmark(args):
+    stop_event = threading.Event()
+    queues = [make_queue(args, f"queue_{index}") for index in range(args.stages + 1)]
+    handlers = [
+        PassThroughHandler(stop_event, queue_in=queues[index], queue_out=queues[index + 1])
+        for index in range(args.stages)
+    ]
+    sink_queue = queues[-1]
+    comms = []
+    if args.socket:
+        port = free_port()
+        sink_queue = make_queue(args, "socket_queue")
+        comms = [
+            SocketSender(stop_event, queues[-1], host="127.0.0.1", port=port),
+            LoopbackReceiver(
+                stop_event,
+                sink_queue,
+                threading.Event(),
+                host="127.0.0.1",
+                port=port,
+                chunk_size=args.chunk_size * 2,
+            ),
+        ]
+
+    # each chunk carries its sequence number in its first 4 bytes, so that drops do not skew the latencies
+    chunk = np.zeros(args.chunk_size, dtype=np.int16)
+    sent = np.zeros(args.messages)
+    received = []
+
+    def sink():
+        while True:
+            chunk = sink_queue.get()
+            now = perf_counter()
+            if is_end(chunk):
+                return
+            sequence = int(np.frombuffer(chunk, dtype=np.uint32, count=1)[0])
+            received.append(now - sent[sequence])
+
+    manager = ThreadManager([*comms, *handlers])
+    manager.start()
+    sink_thread = threading.Thread(target=sink)
+    sink_thread.start()
+    if args.socket:
+        # let the loopback connection establish before timing
+        sleep(0.5)
+
+    interval = 1 / args.rate if args.rate > 0 else 0
+    start = next_time = perf_counter()
+    for sequence in range(args.messages):
+        chunk.view(np.uint32)[0] = sequence
+        if interval:
+            next_time += interval
+            sleep(max(0.0, next_time - perf_counter()))
+        sent[sequence] = perf_counter()
+        # a ring buffer copies the chunk, a queue keeps a reference to it
+        queues[0].put(chunk if args.queue == "ring" else chunk.copy())
+    queues[0].put(END)
+    sink_thread.join()
+    elapsed = perf_counter() - start
+    manager.stop()
+
+    audio_seconds = len(received) * args.chunk_size / 16000
+    return {
+        "config": vars(args),
+        "received": len(received),
+        # dropped or merged by the queues
+        "not_received": args.messages - len(received),
+        "elapsed_s": round(elapsed, 3),
+        "messages_per_s": round(len(received) / elapsed, 1),
+        "realtime_factor": round(audio_seconds / elapsed, 1),
+        "latency_ms": {
+            "p50": percentile(received, 50),
+            "p95": percentile(received, 95),
+            "p99": percentile(received, 99),
+            "max": percentile(received, 100),
+        },
+        "handlers": {
+            f"{handler.__class__.__name__}_{index}": handler.get_metrics()
+            for index, handler in enumerate(handlers)
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stages", type=int, default=4, help="Number of pass-through handlers. Default is 4.")
+    parser.add_argument("--messages", type=int, default=20000, help="Number of chunks sent. Default is 20000.")
+    parser.add_argument("--chunk_size", type=int, default=512, help="Chunk size in int16 samples. Default is 512.")
+    parser.add_argument(
+        "--rate", type=float, default=0, help="Chunks sent per second, 0 for as fast as possible. Default is 0."
+    )
+    parser.add_argument(
+        "--queue", choices=["pipeline", "ring"], default="pipeline",
+        help="Queues between the stages: 'pipeline' (PipelineQueue) or 'ring' (shared-memory AudioRingBuffer).",
+    )
+    parser.add_argument("--queue_size", type=int, default=512, help="Capacity of each queue. Default is 512.")
+    parser.add_argument(
+        "--policy", choices=["block", "drop_oldest", "coalesce"], default="block",
+        help="Policy of the queues when full. Default is 'block'.",
+    )
+    parser.add_argument(
+        "--socket", action="store_true", help="Sends the chunks through a loopback SocketSender/SocketReceiver hop."
+    )
+    parser.add_argument("--output", type=str, default=None, help="Also writes the JSON report to this file.")
+    args = parser.parse_args()
+    if args.chunk_size % 2:
+        parser.error("the chunk size should be even")
+    if args.queue == "ring" and args.policy == "coalesce":
+        parser.error("the ring buffers accept the 'block' and 'drop_oldest' policies only")
+
+    logging.basicConfig(level=logging.WARNING)
+    report = run_benchmark(args)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -22,9 +22,12 @@ class LocalAudioStreamer:
         self.output_queue = output_queue
 
     def run(self):
+        # an AudioRingBuffer copies the samples on put, other queues keep a reference to them
+        copy_input = not getattr(self.input_queue, "copies_on_put", False)
+
         def callback(indata, outdata, frames, time, status):
             if self.output_queue.empty():
-                self.input_queue.put(indata.copy())
+                self.input_queue.put(indata.copy() if copy_input else indata)
                 outdata[:] = 0 * outdata
             else:
                 outdata[:] = self.output_queue.get()[:, np.newaxis]
@@ -2,6 +2,8 @@ import socket
 from rich.console import Console
 import logging
 
+from utils.envelope import END
+
 logger = logging.getLogger(__name__)
 
 console = Console()
@@ -20,23 +22,33 @@ class SocketReceiver:
         host="0.0.0.0",
         port=12345,
         chunk_size=1024,
+        barge_in=False,
     ):
         self.stop_event = stop_event
         self.queue_out = queue_out
         self.should_listen = should_listen
         self.chunk_size = chunk_size
+        self.buffer = bytearray(chunk_size)
+        # an AudioRingBuffer copies the chunk on put, other queues keep a reference to it
+        self.reuse_buffer = getattr(queue_out, "copies_on_put", False)
+        # with barge-in, the VAD needs the audio recorded while the answer is played
+        self.barge_in = barge_in
         self.host = host
         self.port = port
 
     def receive_full_chunk(self, conn, chunk_size):
-        data = b""
-        while len(data) < chunk_size:
-            packet = conn.recv(chunk_size - len(data))
-            if not packet:
+        # received in place, into a buffer allocated once
+        if len(self.buffer) != chunk_size:
+            self.buffer = bytearray(chunk_size)
+        view = memoryview(self.buffer)
+        received = 0
+        while received < chunk_size:
+            n_bytes = conn.recv_into(view[received:], chunk_size - received)
+            if not n_bytes:
                 # connection closed
                 return None
-            data += packet
-        return data
+            received += n_bytes
+        return self.buffer
 
     def run(self):
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -52,9 +64,9 @@ class SocketReceiver:
             audio_chunk = self.receive_full_chunk(self.conn, self.chunk_size)
             if audio_chunk is None:
                 # connection closed
-                self.queue_out.put(b"END")
+                self.queue_out.put(END)
                 break
-            if self.should_listen.is_set():
-                self.queue_out.put(audio_chunk)
+            if self.barge_in or self.should_listen.is_set():
+                self.queue_out.put(audio_chunk if self.reuse_buffer else bytes(audio_chunk))
         self.conn.close()
         logger.info("Receiver closed")
@@ -2,6 +2,8 @@ import socket
 from rich.console import Console
 import logging
 
+from utils.envelope import is_end
+
 logger = logging.getLogger(__name__)
 
 console = Console()
@@ -29,8 +31,10 @@ class SocketSender:
 
         while not self.stop_event.is_set():
             audio_chunk = self.queue_in.get()
-            self.conn.sendall(audio_chunk)
-            if isinstance(audio_chunk, bytes) and audio_chunk == b"END":
+            if is_end(audio_chunk):
+                # the client stops on b"END"
+                self.conn.sendall(b"END")
                 break
+            self.conn.sendall(audio_chunk)
         self.conn.close()
         logger.info("Sender closed")
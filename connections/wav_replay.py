@@ -0,0 +1,149 @@
+import logging
+import os
+import time
+import wave
+from pathlib import Path
+
+import numpy as np
+
+from utils.envelope import END, is_end
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+
+
+def read_wav(path):
+    """
+    Reads a PCM16 WAV file as mono int16 samples at 16 kHz.
+    """
+    with wave.open(str(path), "rb") as f:
+        if f.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16-bit PCM WAV files can be replayed")
+        n_channels = f.getnchannels()
+        sample_rate = f.getframerate()
+        audio = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+    if n_channels > 1:
+        audio = audio.reshape(-1, n_channels).mean(axis=1).astype(np.int16)
+    if sample_rate != SAMPLE_RATE:
+        import librosa
+
+        audio = librosa.resample(audio.astype(np.float32) / 32768, orig_sr=sample_rate, target_sr=SAMPLE_RATE)
+        audio = (np.clip(audio, -1, 1) * 32767).astype(np.int16)
+    return audio
+
+
+class WavReplayer:
+    """
+    Plays WAV files into the pipeline in place of a client: the audio is cut into `chunk_size` chunks put in
+    `queue_out` at `speed` times real time (as fast as possible when `speed` <= 0), each file followed by
+    `silence_ms` of silence so that the VAD detects the end of speech. The next file only starts once the
+    pipeline is idle (`is_idle()`), i.e. when the answer to the previous one has been entirely synthesized.
+    """
+
+    def __init__(
+        self,
+        stop_event,
+        queue_out,
+        should_listen,
+        wav_paths,
+        speed=1.0,
+        chunk_size=512,
+        silence_ms=1500,
+        barge_in=False,
+        is_idle=None,
+        on_file=None,
+    ):
+        self.stop_event = stop_event
+        self.queue_out = queue_out
+        self.should_listen = should_listen
+        self.wav_paths = [Path(path) for path in wav_paths]
+        self.speed = speed
+        self.chunk_size = chunk_size
+        self.silence = np.zeros(int(SAMPLE_RATE * silence_ms / 1000), dtype=np.int16)
+        self.barge_in = barge_in
+        self.is_idle = is_idle or (lambda: True)
+        self.on_file = on_file
+        # index of the file being replayed, or whose answer is being played
+        self.current = None
+
+    def wait_idle(self, settle=0.1):
+        # idle for `settle` seconds in a row: a stage may be between two queues for an instant
+        idle_since = None
+        while not self.stop_event.is_set():
+            if not self.is_idle():
+                idle_since = None
+            elif idle_since is None:
+                idle_since = time.perf_counter()
+            elif time.perf_counter() - idle_since >= settle:
+                return
+            time.sleep(0.01)
+
+    def replay(self, audio):
+        chunk_duration = self.chunk_size / SAMPLE_RATE / self.speed if self.speed > 0 else 0
+        next_time = time.perf_counter()
+        for start in range(0, len(audio), self.chunk_size):
+            if self.stop_event.is_set():
+                return
+            chunk = audio[start : start + self.chunk_size]
+            if len(chunk) < self.chunk_size:
+                chunk = np.pad(chunk, (0, self.chunk_size - len(chunk)))
+            if self.barge_in or self.should_listen.is_set():
+                self.queue_out.put(chunk)
+            if chunk_duration:
+                next_time += chunk_duration
+                time.sleep(max(0.0, next_time - time.perf_counter()))
+
+    def run(self):
+        self.should_listen.set()
+        for index, path in enumerate(self.wav_paths):
+            self.wait_idle()
+            if self.stop_event.is_set():
+                break
+            logger.info(f"Replaying {path}")
+            self.current = index
+            if self.on_file is not None:
+                self.on_file(index, path)
+            self.replay(np.concatenate([read_wav(path), self.silence]))
+        self.wait_idle()
+        logger.info("Replay done")
+        self.queue_out.put(END)
+
+
+class WavRecorder:
+    """
+    Writes the synthesized audio coming out of the pipeline to `<output_dir>/<input stem>_answer.wav`, one file
+    per replayed input, and calls `on_end` once the pipeline is stopped.
+    """
+
+    def __init__(self, stop_event, queue_in, replayer, output_dir="replay_output", on_end=None):
+        self.stop_event = stop_event
+        self.queue_in = queue_in
+        self.replayer = replayer
+        self.output_dir = output_dir
+        self.on_end = on_end
+        self.files = {}
+
+    def writer(self, index):
+        if index not in self.files:
+            path = os.path.join(self.output_dir, f"{self.replayer.wav_paths[index].stem}_answer.wav")
+            f = wave.open(path, "wb")
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(SAMPLE_RATE)
+            self.files[index] = f
+        return self.files[index]
+
+    def run(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        while not self.stop_event.is_set():
+            audio_chunk = self.queue_in.get()
+            if is_end(audio_chunk):
+                break
+            if self.replayer.current is not None:
+                self.writer(self.replayer.current).writeframes(np.asarray(audio_chunk, dtype=np.int16).tobytes())
+        for f in self.files.values():
+            f.close()
+        logger.info(f"Answers written to {self.output_dir}")
+        if self.on_end is not None:
+            self.on_end()
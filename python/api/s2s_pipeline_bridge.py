@@ -3,7 +3,6 @@ import os
 import sys
 import threading
 import time
-from queue import Queue
 from typing import Dict, Any, Optional
 
 # 添加项目根目录到Python路径
@@ -23,10 +22,13 @@ from arguments_classes.chat_tts_arguments import ChatTTSHandlerArguments
 from arguments_classes.facebookmms_tts_arguments import FacebookMMSTTSHandlerArguments
 from arguments_classes.socket_receiver_arguments import SocketReceiverArguments
 from arguments_classes.socket_sender_arguments import SocketSenderArguments
+from arguments_classes.queue_arguments import QueueArguments
 
 import s2s_pipeline
-from VAD.vad_handler import VADHandler
-from utils.thread_manager import ThreadManager
+from utils.audio_reframer import Resampler, decode_pcm, to_float32
+from utils.model_cache import ModelCache
+from utils.envelope import Control, Envelope, to_client
+from utils.session import SessionManager, SessionMessage
 
 # 在模块顶部定义logger
 logger = logging.getLogger("S2SPipelineBridge")
@@ -36,27 +38,41 @@ class S2SPipelineBridge:
     与s2s_pipeline.py的桥接类，用于在WebSocket服务器中控制S2S管道
     """
     
-    def __init__(self):
+    def __init__(self, model_cache_mb=None, model_cache_idle_s=600.0):
         # 使用模块级logger
         logger.info("初始化S2SPipelineBridge")
         
+        # 已加载并预热的处理器（模型）在管道停止后仍保留，重启、客户端重连或切回之前的模型时直接复用；
+        # 超过内存预算（MB，None为不限）或闲置超过model_cache_idle_s秒的模型按LRU释放
+        self.model_cache = ModelCache(
+            max_bytes=model_cache_mb * 1024 * 1024 if model_cache_mb else None,
+            idle_timeout=model_cache_idle_s,
+        )
+        
         self.thread_manager = None
         self.pipeline_running = False
+        # 同一时间只进行一次模型热切换
+        self.swap_lock = threading.Lock()
         self.stop_event = threading.Event()
         self.should_listen = threading.Event()
-        
-        # 创建队列
-        self.recv_audio_chunks_queue = Queue()
-        self.send_audio_chunks_queue = Queue()
-        self.spoken_prompt_queue = Queue()
-        self.text_prompt_queue = Queue()
-        self.lm_response_queue = Queue()
+        # 所有会话共享同一套已加载的模型，每个会话只保存自己的状态
+        self.sessions = SessionManager(self.should_listen)
         
         # 存储从WebSocket客户端接收到的配置
         self.client_config = {}
         
         # 初始化参数
         self._init_arguments()
+        
+        # 创建队列，容量和队列满时的策略由queue_kwargs决定
+        queues = s2s_pipeline.initialize_queues(self.queue_kwargs, multi_session=True)
+        self.recv_audio_chunks_queue = queues["recv_audio_chunks_queue"]
+        self.send_audio_chunks_queue = queues["send_audio_chunks_queue"]
+        self.spoken_prompt_queue = queues["spoken_prompt_queue"]
+        self.text_prompt_queue = queues["text_prompt_queue"]
+        self.lm_response_queue = queues["lm_response_queue"]
+        # 用户打断（barge-in）时丢弃该会话尚未合成或播放的回复
+        s2s_pipeline.flush_on_interrupt(self.sessions, queues)
     
     def _init_arguments(self):
         """初始化所有参数类"""
@@ -95,6 +111,9 @@ class S2SPipelineBridge:
         self.melo_tts_handler_kwargs = MeloTTSHandlerArguments()
         self.chat_tts_handler_kwargs = ChatTTSHandlerArguments()
         self.facebook_mms_tts_handler_kwargs = FacebookMMSTTSHandlerArguments()
+        
+        # 队列参数
+        self.queue_kwargs = QueueArguments()
     
     def update_config(self, client_config: Dict[str, Any]):
         """根据WebSocket客户端配置更新管道配置"""
@@ -155,6 +174,26 @@ class S2SPipelineBridge:
                 self.module_kwargs.tts = "chatTTS"
             elif "facebook" in tts_model.lower() or "mms" in tts_model.lower():
                 self.module_kwargs.tts = "facebookMMS"
+        
+        # 是否允许用户打断回复（barge-in），下次启动管道时生效
+        if "barge_in" in client_config:
+            self.vad_handler_kwargs.barge_in = bool(client_config["barge_in"])
+    
+    def _prepare_args(self):
+        """去掉参数前缀，得到各处理器的setup参数"""
+        s2s_pipeline.prepare_all_args(
+            self.module_kwargs,
+            self.whisper_stt_handler_kwargs,
+            self.paraformer_stt_handler_kwargs,
+            self.faster_whisper_stt_handler_kwargs,
+            self.language_model_handler_kwargs,
+            self.open_api_language_model_handler_kwargs,
+            self.mlx_language_model_handler_kwargs,
+            self.parler_tts_handler_kwargs,
+            self.melo_tts_handler_kwargs,
+            self.chat_tts_handler_kwargs,
+            self.facebook_mms_tts_handler_kwargs,
+        )
     
     def start_pipeline(self):
         """启动S2S管道"""
@@ -167,27 +206,17 @@ class S2SPipelineBridge:
         
         try:            
             # 准备参数
-            s2s_pipeline.prepare_all_args(
-                self.module_kwargs,
-                self.whisper_stt_handler_kwargs,
-                self.paraformer_stt_handler_kwargs,
-                self.faster_whisper_stt_handler_kwargs,
-                self.language_model_handler_kwargs,
-                self.open_api_language_model_handler_kwargs,
-                self.mlx_language_model_handler_kwargs,
-                self.parler_tts_handler_kwargs,
-                self.melo_tts_handler_kwargs,
-                self.chat_tts_handler_kwargs,
-                self.facebook_mms_tts_handler_kwargs,
-            )
+            self._prepare_args()
             
-            # 重置事件和队列
+            # 重置事件和队列：清空上次停止时留下的数据和结束标记
+            self._drain_queues()
             self.stop_event.clear()
             self.should_listen.set()  # 默认启动监听
             
             queues_and_events = {
                 "stop_event": self.stop_event,
                 "should_listen": self.should_listen,
+                "sessions": self.sessions,
                 "recv_audio_chunks_queue": self.recv_audio_chunks_queue,
                 "send_audio_chunks_queue": self.send_audio_chunks_queue,
                 "spoken_prompt_queue": self.spoken_prompt_queue,
@@ -212,6 +241,7 @@ class S2SPipelineBridge:
                 self.chat_tts_handler_kwargs,
                 self.facebook_mms_tts_handler_kwargs,
                 queues_and_events,
+                create=self.model_cache.create,
             )
             
             # 启动管道
@@ -241,6 +271,8 @@ class S2SPipelineBridge:
             # 停止线程管理器
             if self.thread_manager:
                 self.thread_manager.stop()
+                # 模型留在缓存中供下次启动复用
+                self.model_cache.checkin(self.thread_manager.handlers)
                 self.thread_manager = None
             
             self.pipeline_running = False
@@ -249,22 +281,178 @@ class S2SPipelineBridge:
         except Exception as e:
             logger.error(f"停止S2S管道时出错: {str(e)}")
     
-    def send_audio(self, audio_data):
-        """发送音频数据到输入队列"""
+    def swap_model(self, model_type, on_done=None):
+        """
+        热切换一个阶段（"stt"、"llm"或"tts"）的模型：新模型在后台线程中加载和预热，旧模型继续服务，
+        然后在两轮对话之间原子切换，无需重启整个管道。切换完成或失败后调用on_done(success, error)。
+        返回是否开始了切换。
+        """
+        if model_type not in ("stt", "llm", "tts"):
+            logger.warning(f"不支持热切换的模型类型: {model_type}")
+            return False
+        if not self.pipeline_running or self.thread_manager is None:
+            logger.warning("S2S管道未运行，无法热切换模型")
+            return False
+        thread = threading.Thread(target=self._swap_model, args=(model_type, on_done), daemon=True)
+        thread.start()
+        return True
+    
+    def _swap_model(self, model_type, on_done):
+        with self.swap_lock:
+            try:
+                start = time.time()
+                logger.info(f"正在后台加载新的{model_type}模型...")
+                new_handler = self._build_stage(model_type)
+                logger.info(f"新的{model_type}模型已加载，用时 {time.time() - start:.1f} 秒")
+                
+                old_handler = self.thread_manager.find(new_handler.queue_in)
+                if model_type == "tts":
+                    # 等待正在播放的回复合成完毕，避免同一句回复中途换声音
+                    self._wait_turn_end()
+                handoff = self.thread_manager.replace(old_handler, new_handler)
+                while not handoff.done.wait(0.1):
+                    if not self.pipeline_running:
+                        raise RuntimeError("管道已停止")
+                logger.info(f"{model_type}模型已切换为 {new_handler.__class__.__name__}")
+                # 旧模型留在缓存中，切回时无需重新加载
+                self.model_cache.checkin([old_handler])
+                if on_done:
+                    on_done(True, None)
+            except Exception as e:
+                logger.error(f"热切换{model_type}模型失败: {str(e)}")
+                if on_done:
+                    on_done(False, str(e))
+    
+    def _build_stage(self, model_type):
+        """按当前配置创建一个阶段的处理器，创建时即加载并预热模型"""
+        self._prepare_args()
+        if model_type == "stt":
+            return s2s_pipeline.get_stt_handler(
+                self.module_kwargs,
+                self.stop_event,
+                self.spoken_prompt_queue,
+                self.text_prompt_queue,
+                self.whisper_stt_handler_kwargs,
+                self.faster_whisper_stt_handler_kwargs,
+                self.paraformer_stt_handler_kwargs,
+                self.sessions,
+                self.model_cache.create,
+            )
+        if model_type == "llm":
+            return s2s_pipeline.get_llm_handler(
+                self.module_kwargs,
+                self.stop_event,
+                self.text_prompt_queue,
+                self.lm_response_queue,
+                self.language_model_handler_kwargs,
+                self.open_api_language_model_handler_kwargs,
+                self.mlx_language_model_handler_kwargs,
+                self.sessions,
+                self.model_cache.create,
+            )
+        return s2s_pipeline.get_tts_handler(
+            self.module_kwargs,
+            self.stop_event,
+            self.lm_response_queue,
+            self.send_audio_chunks_queue,
+            self.should_listen,
+            self.parler_tts_handler_kwargs,
+            self.melo_tts_handler_kwargs,
+            self.chat_tts_handler_kwargs,
+            self.facebook_mms_tts_handler_kwargs,
+            self.sessions,
+            self.model_cache.create,
+        )
+    
+    def _wait_turn_end(self, timeout=30.0, settle=0.2):
+        """等待LLM和TTS都空闲且没有待合成的句子并持续settle秒，最多等待timeout秒"""
+        deadline = time.time() + timeout
+        idle_since = None
+        while time.time() < deadline and self.pipeline_running:
+            lm = self.thread_manager.find(self.text_prompt_queue)
+            tts = self.thread_manager.find(self.lm_response_queue)
+            idle = (
+                not getattr(lm, "busy", False)
+                and not getattr(tts, "busy", False)
+                and self.lm_response_queue.empty()
+            )
+            if not idle:
+                idle_since = None
+            elif idle_since is None:
+                idle_since = time.time()
+            elif time.time() - idle_since >= settle:
+                return
+            time.sleep(0.05)
+        logger.warning("等待当前回复结束超时，直接切换模型")
+    
+    def _drain_queues(self):
+        for queue in self.get_queues().values():
+            while not queue.empty():
+                try:
+                    queue.get_nowait()
+                except Exception:
+                    break
+    
+    def open_session(self, session_id=None):
+        """为一个新的对话创建会话，返回会话ID"""
+        session = self.sessions.open(session_id)
+        logger.info(f"打开会话: {session.session_id}，当前会话数: {len(self.sessions)}")
+        return session.session_id
+    
+    def close_session(self, session_id):
+        """关闭会话并释放其状态"""
+        self.sessions.close(session_id)
+        if self.pipeline_running:
+            try:
+                # 各阶段丢弃该会话尚在队列中的数据
+                self.recv_audio_chunks_queue.put(Control.flush(session_id))
+            except Exception as e:
+                logger.error(f"清空会话队列失败: {str(e)}")
+        logger.info(f"关闭会话: {session_id}，当前会话数: {len(self.sessions)}")
+    
+    def _tag(self, payload, session_id):
+        return payload if session_id is None else SessionMessage(session_id, payload)
+    
+    def _convert_audio(self, audio_data, session_id, sample_rate, sample_format):
+        """将客户端音频转换为管道采样率的float32音频；每个会话保留自己的重采样状态，音频块的切分不影响结果"""
+        samples = to_float32(decode_pcm(audio_data, sample_format))
+        pipeline_rate = self.vad_handler_kwargs.sample_rate
+        if not sample_rate or sample_rate == pipeline_rate:
+            return samples
+        state = self.sessions.get(session_id).state.setdefault(self.__class__.__name__, {})
+        resampler = state.get("resampler")
+        if resampler is None or resampler.input_rate != sample_rate:
+            resampler = state["resampler"] = Resampler(sample_rate, pipeline_rate)
+        return resampler(samples)
+
+    def send_audio(self, audio_data, session_id=None, sample_rate=None, sample_format="int16"):
+        """发送音频数据到输入队列
+
+        音频块大小任意：VAD会把它切分为模型需要的窗口，客户端可以发送更大的音频包。
+        sample_rate与管道采样率不同或sample_format为float32时，先转换为管道采样率的float32音频。
+        """
         # 使用模块级logger
         if not self.pipeline_running:
             logger.warning("S2S管道未运行，无法发送音频数据")
             return False
         
         try:
-            # 这里可能需要对音频数据进行解码和转换
-            self.recv_audio_chunks_queue.put(audio_data)
+            if (
+                session_id is not None
+                and not self.vad_handler_kwargs.barge_in
+                and not self.sessions.get(session_id).should_listen.is_set()
+            ):
+                # 该会话正在播放回复，与SocketReceiver一样丢弃输入音频；开启barge-in时VAD需要这些音频来检测打断
+                return True
+            if sample_format != "int16" or (sample_rate and sample_rate != self.vad_handler_kwargs.sample_rate):
+                audio_data = self._convert_audio(audio_data, session_id, sample_rate, sample_format)
+            self.recv_audio_chunks_queue.put(self._tag(audio_data, session_id))
             return True
         except Exception as e:
             logger.error(f"发送音频数据失败: {str(e)}")
             return False
     
-    def send_text(self, text, language="en"):
+    def send_text(self, text, language="en", session_id=None):
         """直接发送文本到LLM，绕过STT阶段"""
         # 使用模块级logger
         if not self.pipeline_running:
@@ -272,28 +460,41 @@ class S2SPipelineBridge:
             return False
         
         try:
-            # 将文本直接放入text_prompt_queue队列
-            self.text_prompt_queue.put({
-                "text": text,
-                "language": language
-            })
+            # 将文本直接放入text_prompt_queue队列，队列已满时不阻塞调用方，直接返回失败
+            session = self.sessions.get(session_id)
+            self.text_prompt_queue.put(Envelope(
+                (text, language),
+                session_id=session_id,
+                turn=session.turn,
+                language=language,
+            ), block=False)
             return True
         except Exception as e:
             logger.error(f"发送文本失败: {str(e)}")
             return False
     
-    def set_listening(self, should_listen):
+    def set_listening(self, should_listen, session_id=None):
         """设置是否监听音频输入"""
         # 使用模块级logger
+        event = self.sessions.get(session_id).should_listen
         if should_listen:
-            self.should_listen.set()
+            event.set()
             logger.info("已启用音频监听")
         else:
-            self.should_listen.clear()
+            event.clear()
             logger.info("已禁用音频监听")
     
+    def interrupt(self, session_id=None):
+        """打断会话当前的回复：停止正在进行的生成并清空待合成、待播放的数据"""
+        self.sessions.interrupt(session_id)
+        logger.info(f"会话被打断: {session_id or 'default'}")
+    
+    def add_interrupt_listener(self, listener):
+        """注册会话被打断时的回调listener(session)，例如通知客户端停止播放"""
+        self.sessions.add_interrupt_listener(listener)
+    
     def get_audio_output(self, timeout=0.1):
-        """获取音频输出队列中的数据"""
+        """获取音频输出队列中的数据，属于某个会话的数据以SessionMessage返回"""
         try:
             return self.send_audio_chunks_queue.get(block=True, timeout=timeout)
         except:
@@ -303,10 +504,33 @@ class S2SPipelineBridge:
         """获取文本输出队列中的数据"""
         try:
             queue = self.text_prompt_queue if is_transcription else self.lm_response_queue
-            return queue.get(block=True, timeout=timeout)
+            # 去掉消息信封（Envelope），客户端只需要文本，属于某个会话的数据以SessionMessage返回
+            item = queue.get(block=True, timeout=timeout)
+            # 控制消息（Control）只在各阶段之间传递
+            return None if isinstance(item, Control) else to_client(item)
         except:
             return None
     
+    def get_queues(self):
+        """管道各阶段之间的队列"""
+        return {
+            "recv_audio_chunks_queue": self.recv_audio_chunks_queue,
+            "send_audio_chunks_queue": self.send_audio_chunks_queue,
+            "spoken_prompt_queue": self.spoken_prompt_queue,
+            "text_prompt_queue": self.text_prompt_queue,
+            "lm_response_queue": self.lm_response_queue,
+        }
+    
+    def get_active_sessions(self):
+        """当前打开的会话数"""
+        return len(self.sessions)
+    
+    def get_metrics(self):
+        """获取各个处理阶段的延迟统计"""
+        if self.thread_manager is None:
+            return {}
+        return self.thread_manager.get_metrics()
+    
     def is_running(self):
         """检查管道是否正在运行"""
         return self.pipeline_running 
\ No newline at end of file
@@ -17,6 +17,8 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 # 导入桥接模块
 from s2s_pipeline_bridge import S2SPipelineBridge
+from utils.metrics_server import MetricsServer
+from utils.session import SessionMessage
 
 # 创建日志目录
 log_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
@@ -51,10 +53,11 @@ class S2SWebSocketServer:
     作为独立的服务运行，使得前端UI和后端处理系统可以完全分离。
     """
     
-    def __init__(self, host: str = "127.0.0.1", port: int = 8766, model_path: Optional[str] = None, preload_models: bool = True):
+    def __init__(self, host: str = "127.0.0.1", port: int = 8766, model_path: Optional[str] = None, preload_models: bool = True, metrics_port: Optional[int] = None, barge_in: bool = False, model_cache_mb: Optional[int] = None, model_cache_idle_s: float = 600.0):
         self.host = host
         self.port = port
         self.clients = set()
+        self.client_sessions = {}  # websocket -> 管道会话ID，每个客户端一个对话
         self.audio_input_queue = Queue()   # 存储从前端接收的音频数据
         self.audio_output_queue = Queue()  # 存储要发送到前端的音频数据
         self.text_input_queue = Queue()    # 存储从前端接收的文本数据
@@ -79,10 +82,27 @@ class S2SWebSocketServer:
             os.environ["LOCAL_MODEL_PATH"] = self.model_path
         
         # 创建S2S管道桥接
-        self.pipeline_bridge = S2SPipelineBridge()
+        self.pipeline_bridge = S2SPipelineBridge(model_cache_mb=model_cache_mb, model_cache_idle_s=model_cache_idle_s)
+        
+        # 用户打断回复时通知对应客户端停止播放；回调在VAD线程中执行，通过服务器的事件循环发送
+        self.loop = None
+        self.pipeline_bridge.add_interrupt_listener(self._on_interrupt)
         
         # 更新管道配置
-        self.pipeline_bridge.update_config(self.pipeline_config)
+        self.pipeline_bridge.update_config({**self.pipeline_config, "barge_in": barge_in})
+        
+        # 指标服务（Prometheus文本格式），在预加载之前启动以便反映预热状态
+        self.metrics_server = None
+        if metrics_port:
+            self.metrics_server = MetricsServer(
+                host=host,
+                port=metrics_port,
+                get_queues=self.pipeline_bridge.get_queues,
+                get_handler_metrics=self.pipeline_bridge.get_metrics,
+                get_active_sessions=self.pipeline_bridge.get_active_sessions,
+                is_ready=self.pipeline_bridge.is_running,
+            )
+            self.metrics_server.start()
         
         # 创建结果监听线程
         self.result_listener_running = False
@@ -117,11 +137,16 @@ class S2SWebSocketServer:
     async def register(self, websocket):
         """注册新的WebSocket客户端连接"""
         self.clients.add(websocket)
+        self.loop = asyncio.get_running_loop()
+        self.client_sessions[websocket] = self.pipeline_bridge.open_session()
         logger.info(f"客户端连接: {websocket.remote_address}，当前连接数: {len(self.clients)}")
         
     async def unregister(self, websocket):
         """注销WebSocket客户端连接"""
         self.clients.remove(websocket)
+        session_id = self.client_sessions.pop(websocket, None)
+        if session_id is not None:
+            self.pipeline_bridge.close_session(session_id)
         logger.info(f"客户端断开: {websocket.remote_address}，当前连接数: {len(self.clients)}")
     
     async def send_status(self, websocket, status: str, details: Optional[Dict[str, Any]] = None):
@@ -152,6 +177,8 @@ class S2SWebSocketServer:
             if self.pipeline_bridge.is_running():
                 await self.send_status(websocket, "pipeline_ready")
             
+            session_id = self.client_sessions[websocket]
+            
             async for message in websocket:
                 try:
                     data = json.loads(message)
@@ -191,15 +218,14 @@ class S2SWebSocketServer:
                                 self.pipeline_config["tts_model"] = model_name
                                 self.pipeline_bridge.update_config({"tts_model": model_name})
                             
-                            # 如果模型已加载，可能需要重启管道以应用新模型
+                            # 管道运行中时只热切换该阶段的模型：新模型在后台加载，旧模型继续服务直到切换
                             if self.pipeline_bridge.is_running():
-                                logger.info("模型已更改，正在重启管道...")
-                                self.pipeline_bridge.stop_pipeline()
-                                if self.pipeline_bridge.start_pipeline():
-                                    await self.send_status(websocket, "pipeline_restarted")
-                                else:
-                                    await self.send_status(websocket, "error", {
-                                        "message": "重启管道失败"
+                                logger.info("模型已更改，正在后台加载新模型...")
+                                on_swapped = functools.partial(self._on_model_swapped, websocket, model_type, model_name)
+                                if self.pipeline_bridge.swap_model(model_type, on_swapped):
+                                    await self.send_status(websocket, "model_loading", {
+                                        "model_type": model_type,
+                                        "model_name": model_name
                                     })
                             
                             await self.send_status(websocket, "model_set", {
@@ -226,7 +252,7 @@ class S2SWebSocketServer:
                                 continue
                         
                         # 启用语音监听
-                        self.pipeline_bridge.set_listening(True)
+                        self.pipeline_bridge.set_listening(True, session_id)
                         await self.send_status(websocket, "listening_started")
                     
                     elif message_type == "stop_listening":
@@ -235,7 +261,7 @@ class S2SWebSocketServer:
                         
                         if self.pipeline_bridge.is_running():
                             # 禁用语音监听
-                            self.pipeline_bridge.set_listening(False)
+                            self.pipeline_bridge.set_listening(False, session_id)
                             await self.send_status(websocket, "listening_stopped")
                         else:
                             await self.send_status(websocket, "warning", {
@@ -249,7 +275,12 @@ class S2SWebSocketServer:
                             if audio_base64:
                                 try:
                                     audio_data = base64.b64decode(audio_base64)
-                                    self.pipeline_bridge.send_audio(audio_data)
+                                    self.pipeline_bridge.send_audio(
+                                        audio_data,
+                                        session_id,
+                                        sample_rate=message_data.get("sample_rate"),
+                                        sample_format=message_data.get("format", "int16"),
+                                    )
                                 except Exception as e:
                                     logger.error(f"处理音频数据失败: {str(e)}")
                                     await self.send_status(websocket, "error", {
@@ -268,7 +299,12 @@ class S2SWebSocketServer:
                                 if audio_base64:
                                     try:
                                         audio_data = base64.b64decode(audio_base64)
-                                        self.pipeline_bridge.send_audio(audio_data)
+                                        self.pipeline_bridge.send_audio(
+                                            audio_data,
+                                            session_id,
+                                            sample_rate=message_data.get("sample_rate"),
+                                            sample_format=message_data.get("format", "int16"),
+                                        )
                                     except Exception as e:
                                         logger.error(f"处理音频数据失败: {str(e)}")
                     
@@ -278,7 +314,7 @@ class S2SWebSocketServer:
                             text = message_data.get("text", "")
                             language = message_data.get("language", self.pipeline_config["language"])
                             if text:
-                                self.pipeline_bridge.send_text(text, language)
+                                self.pipeline_bridge.send_text(text, language, session_id)
                                 await self.send_status(websocket, "text_sent")
                         else:
                             if self.pipeline_bridge.start_pipeline():
@@ -292,13 +328,18 @@ class S2SWebSocketServer:
                                 text = message_data.get("text", "")
                                 language = message_data.get("language", self.pipeline_config["language"])
                                 if text:
-                                    self.pipeline_bridge.send_text(text, language)
+                                    self.pipeline_bridge.send_text(text, language, session_id)
                                     await self.send_status(websocket, "text_sent")
                             else:
                                 await self.send_status(websocket, "error", {
                                     "message": "启动管道失败"
                                 })
                     
+                    elif message_type == "interrupt":
+                        # 客户端主动打断当前回复
+                        if self.pipeline_bridge.is_running():
+                            self.pipeline_bridge.interrupt(session_id)
+                    
                     elif message_type == "response":
                         # 接收客户端处理后的响应数据（目前未使用）
                         pass
@@ -372,6 +413,7 @@ class S2SWebSocketServer:
             try:
                 # 检查转录结果
                 transcript = self.pipeline_bridge.get_text_output(timeout=0.1, is_transcription=True)
+                transcript, targets = self._route(transcript, websockets_list)
                 if transcript:
                     language_code = "auto"
                     if isinstance(transcript, tuple) and len(transcript) > 1:
@@ -387,10 +429,11 @@ class S2SWebSocketServer:
                             "language": language_code
                         }
                     }
-                    self._send_to_all_clients(message, websockets_list, loop)
+                    self._send_to_all_clients(message, targets, loop)
                 
                 # 检查LLM响应
                 response = self.pipeline_bridge.get_text_output(timeout=0.1)
+                response, targets = self._route(response, websockets_list)
                 if response:
                     # 发送LLM响应到所有客户端
                     message = {
@@ -399,7 +442,7 @@ class S2SWebSocketServer:
                             "text": response
                         }
                     }
-                    self._send_to_all_clients(message, websockets_list, loop)
+                    self._send_to_all_clients(message, targets, loop)
                 
                 # 短暂休眠以减少CPU使用率
                 time.sleep(0.01)
@@ -410,6 +453,35 @@ class S2SWebSocketServer:
         
         logger.debug("结果监听线程已停止")
     
+    def _route(self, output, websockets_list):
+        """将属于某个会话的输出只路由给对应的客户端，未标记会话的输出广播给所有客户端"""
+        if isinstance(output, SessionMessage):
+            targets = [
+                websocket for websocket in websockets_list
+                if self.client_sessions.get(websocket) == output.session_id
+            ]
+            return output.payload, targets
+        return output, websockets_list
+    
+    def _on_interrupt(self, session):
+        """会话被打断：通知该会话的客户端立即停止播放已收到的音频"""
+        if self.loop is None:
+            return
+        message = json.dumps({"type": "stop_playback", "data": {}})
+        for websocket, session_id in list(self.client_sessions.items()):
+            if session_id == session.session_id and websocket.open:
+                asyncio.run_coroutine_threadsafe(websocket.send(message), self.loop)
+    
+    def _on_model_swapped(self, websocket, model_type, model_name, success, error):
+        """模型热切换完成或失败时通知发起切换的客户端，在切换线程中调用"""
+        if self.loop is None or not websocket.open:
+            return
+        if success:
+            status = self.send_status(websocket, "model_swapped", {"model_type": model_type, "model_name": model_name})
+        else:
+            status = self.send_status(websocket, "error", {"message": f"切换模型失败: {error}"})
+        asyncio.run_coroutine_threadsafe(status, self.loop)
+    
     def _send_to_all_clients(self, message, websockets_list, loop):
         """向所有WebSocket客户端发送消息"""
         for websocket in websockets_list:
@@ -419,12 +491,12 @@ class S2SWebSocketServer:
                     loop
                 )
 
-async def main(host: str, port: int, model_path: Optional[str] = None, preload_models: bool = True):
+async def main(host: str, port: int, model_path: Optional[str] = None, preload_models: bool = True, metrics_port: Optional[int] = None, barge_in: bool = False, model_cache_mb: Optional[int] = None, model_cache_idle_s: float = 600.0):
     """主函数，启动WebSocket服务器"""
     logger.debug("调试模式已启用")
     
     # 创建WebSocket服务器实例
-    server = S2SWebSocketServer(host=host, port=port, model_path=model_path, preload_models=preload_models)
+    server = S2SWebSocketServer(host=host, port=port, model_path=model_path, preload_models=preload_models, metrics_port=metrics_port, barge_in=barge_in, model_cache_mb=model_cache_mb, model_cache_idle_s=model_cache_idle_s)
     
     # 启动WebSocket服务器
     async with websockets.serve(server.handle_client, host, port):
@@ -438,11 +510,15 @@ if __name__ == "__main__":
     parser.add_argument("--port", type=int, default=8766, help="WebSocket服务器端口")
     parser.add_argument("--model_path", type=str, default=None, help="本地模型路径")
     parser.add_argument("--no_preload", action="store_true", help="禁用模型预加载，改为按需加载")
+    parser.add_argument("--metrics_port", type=int, default=None, help="指标服务端口（Prometheus文本格式），默认不启用")
+    parser.add_argument("--barge_in", action="store_true", help="允许用户说话打断正在播放的回复，客户端会收到stop_playback消息")
+    parser.add_argument("--model_cache_mb", type=int, default=None, help="管道停止后保留的模型的内存预算（MB），超出时按LRU释放，默认不限")
+    parser.add_argument("--model_cache_idle_s", type=float, default=600.0, help="未使用的模型保留的秒数，默认600秒")
     
     args = parser.parse_args()
     
     # 启动WebSocket服务器
     try:
-        asyncio.run(main(args.host, args.port, args.model_path, not args.no_preload))
+        asyncio.run(main(args.host, args.port, args.model_path, not args.no_preload, args.metrics_port, args.barge_in, args.model_cache_mb, args.model_cache_idle_s))
     except KeyboardInterrupt:
         logger.info("服务器已手动停止") 
\ No newline at end of file
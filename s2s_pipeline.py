@@ -3,11 +3,9 @@ import os
 import sys
 from copy import copy
 from pathlib import Path
-from queue import Queue
 from threading import Event
 from typing import Optional
 from sys import platform
-from VAD.vad_handler import VADHandler
 from arguments_classes.chat_tts_arguments import ChatTTSHandlerArguments
 from arguments_classes.language_model_arguments import LanguageModelHandlerArguments
 from arguments_classes.mlx_language_model_arguments import (
@@ -16,6 +14,8 @@ from arguments_classes.mlx_language_model_arguments import (
 from arguments_classes.module_arguments import ModuleArguments
 from arguments_classes.paraformer_stt_arguments import ParaformerSTTHandlerArguments
 from arguments_classes.parler_tts_arguments import ParlerTTSHandlerArguments
+from arguments_classes.queue_arguments import QueueArguments
+from arguments_classes.replay_arguments import ReplayArguments
 from arguments_classes.socket_receiver_arguments import SocketReceiverArguments
 from arguments_classes.socket_sender_arguments import SocketSenderArguments
 from arguments_classes.vad_arguments import VADHandlerArguments
@@ -26,31 +26,27 @@ from arguments_classes.faster_whisper_stt_arguments import (
 from arguments_classes.melo_tts_arguments import MeloTTSHandlerArguments
 from arguments_classes.open_api_language_model_arguments import OpenApiLanguageModelHandlerArguments
 from arguments_classes.facebookmms_tts_arguments import FacebookMMSTTSHandlerArguments
-import torch
-import nltk
-from rich.console import Console
-from transformers import (
-    HfArgumentParser,
-)
-
+from arguments_classes.stub_stt_arguments import StubSTTHandlerArguments
+from arguments_classes.stub_language_model_arguments import StubLanguageModelHandlerArguments
+from arguments_classes.stub_tts_arguments import StubTTSHandlerArguments
+
+from utils.async_pipeline import AsyncPipelineManager, AsyncPipelineQueue, async_creator
+from utils.audio_ring_buffer import AudioRingBuffer
+from utils.metrics_server import MetricsServer
+from utils.pipeline_queue import PipelineQueue
+from utils.registry import load_handler
+from utils.process_manager import MP_CONTEXT, HandlerSpec, ProcessManager, ProcessQueue
+from utils.session import SessionManager, session_id_of
+from utils.compile_cache import clear_manifest
+from utils.cpu_budget import parse_budgets
+from utils.startup import build_stages, format_timeline
 from utils.thread_manager import ThreadManager
 
-# Ensure that the necessary NLTK resources are available
-try:
-    nltk.data.find("tokenizers/punkt_tab")
-except (LookupError, OSError):
-    nltk.download("punkt_tab")
-try:
-    nltk.data.find("tokenizers/averaged_perceptron_tagger_eng")
-except (LookupError, OSError):
-    nltk.download("averaged_perceptron_tagger_eng")
-
 # caching allows ~50% compilation time reduction
 # see https://docs.google.com/document/d/1y5CRfMLdwEoF1nTk9q8qEu1mgMUuUtvhklPKJ2emLU8/edit#heading=h.o2asbxsrp1ma
 CURRENT_DIR = Path(__file__).resolve().parent
 os.environ["TORCHINDUCTOR_CACHE_DIR"] = os.path.join(CURRENT_DIR, "tmp")
 
-console = Console()
 logging.getLogger("numba").setLevel(logging.WARNING)  # quiet down numba logs
 
 # 定义全局logger变量
@@ -59,8 +55,9 @@ logger = logging.getLogger(__name__)
 def rename_args(args, prefix):
     """
     Rename arguments by removing the prefix and prepares the gen_kwargs.
+    Can be applied again after setting prefixed arguments: the gen_kwargs already prepared are kept.
     """
-    gen_kwargs = {}
+    gen_kwargs = dict(args.__dict__.get("gen_kwargs", {}))
     for key in copy(args.__dict__):
         if key.startswith(prefix):
             value = args.__dict__.pop(key)
@@ -74,6 +71,9 @@ def rename_args(args, prefix):
 
 
 def parse_arguments():
+    # imported here so that the modules using this one do not pay for transformers
+    from transformers import HfArgumentParser
+
     parser = HfArgumentParser(
         (
             ModuleArguments,
@@ -90,6 +90,11 @@ def parse_arguments():
             MeloTTSHandlerArguments,
             ChatTTSHandlerArguments,
             FacebookMMSTTSHandlerArguments,
+            StubSTTHandlerArguments,
+            StubLanguageModelHandlerArguments,
+            StubTTSHandlerArguments,
+            QueueArguments,
+            ReplayArguments,
         )
     )
 
@@ -111,6 +116,8 @@ def setup_logger(log_level):
 
     # torch compile logs
     if log_level == "debug":
+        import torch
+
         torch._logging.set_logs(graph_breaks=True, recompiles=True, cudagraphs=True)
 
 
@@ -179,6 +186,9 @@ def prepare_all_args(
     melo_tts_handler_kwargs,
     chat_tts_handler_kwargs,
     facebook_mms_tts_handler_kwargs,
+    stub_stt_handler_kwargs=None,
+    stub_language_model_handler_kwargs=None,
+    stub_tts_handler_kwargs=None,
 ):
     prepare_module_args(
         module_kwargs,
@@ -204,17 +214,107 @@ def prepare_all_args(
     rename_args(melo_tts_handler_kwargs, "melo")
     rename_args(chat_tts_handler_kwargs, "chat_tts")
     rename_args(facebook_mms_tts_handler_kwargs, "facebook_mms")
+    if stub_stt_handler_kwargs is not None:
+        rename_args(stub_stt_handler_kwargs, "stub_stt")
+    if stub_language_model_handler_kwargs is not None:
+        rename_args(stub_language_model_handler_kwargs, "stub_lm")
+    if stub_tts_handler_kwargs is not None:
+        rename_args(stub_tts_handler_kwargs, "stub_tts")
+
+
+QUEUE_NAMES = (
+    "recv_audio_chunks_queue",
+    "send_audio_chunks_queue",
+    "spoken_prompt_queue",
+    "text_prompt_queue",
+    "lm_response_queue",
+)
 
 
-def initialize_queues_and_events():
+def initialize_queues(queue_kwargs=None, execution="thread", multi_session=False):
+    """
+    Creates the inter-stage queues with the capacity and policy set in `queue_kwargs` (QueueArguments).
+    `multi_session` is set when the pipeline serves several sessions (e.g. the websocket server).
+    """
+    if queue_kwargs is None:
+        queue_kwargs = QueueArguments()
+    if multi_session and queue_kwargs.shared_audio_buffers:
+        raise ValueError("The shared audio buffers serve the default session only: disable shared_audio_buffers.")
+    if execution == "process":
+        queues = {
+            name: ProcessQueue(maxsize=getattr(queue_kwargs, f"{name}_size"), name=name)
+            for name in QUEUE_NAMES
+        }
+    elif execution == "asyncio":
+        if queue_kwargs.shared_audio_buffers:
+            raise ValueError("The shared audio buffers are thread queues: use --execution thread.")
+        queues = {
+            name: AsyncPipelineQueue(
+                maxsize=getattr(queue_kwargs, f"{name}_size"),
+                policy=getattr(queue_kwargs, f"{name}_policy"),
+                name=name,
+            )
+            for name in QUEUE_NAMES
+        }
+    else:
+        queues = {
+            name: PipelineQueue(
+                maxsize=getattr(queue_kwargs, f"{name}_size"),
+                policy=getattr(queue_kwargs, f"{name}_policy"),
+                name=name,
+            )
+            for name in QUEUE_NAMES
+        }
+    if queue_kwargs.shared_audio_buffers:
+        for name in ("recv_audio_chunks_queue", "send_audio_chunks_queue"):
+            queues[name] = AudioRingBuffer(
+                # unbounded queues get the default capacity
+                n_slots=(getattr(queue_kwargs, f"{name}_size") or 512) + 2,
+                policy=getattr(queue_kwargs, f"{name}_policy"),
+                name=name,
+            )
+    return queues
+
+
+def flush_on_interrupt(sessions, queues):
+    """
+    When a session is interrupted, its answer still waiting to be synthesized or played is discarded.
+    """
+
+    def flush(session):
+        for name in ("lm_response_queue", "send_audio_chunks_queue"):
+            flushed = queues[name].flush(lambda item: session_id_of(item) == session.session_id)
+            if flushed:
+                logger.debug(f"Barge-in: {flushed} items flushed from {name}")
+
+    sessions.add_interrupt_listener(flush)
+
+
+def initialize_queues_and_events(queue_kwargs=None, execution="thread"):
+    if execution == "process":
+        # shared with the handler processes
+        should_listen = MP_CONTEXT.Event()
+        stop_event = MP_CONTEXT.Event()
+    else:
+        should_listen = Event()
+        stop_event = Event()
+    sessions = SessionManager(should_listen)
+    queues = initialize_queues(queue_kwargs, execution)
+    if execution != "process":
+        flush_on_interrupt(sessions, queues)
     return {
-        "stop_event": Event(),
-        "should_listen": Event(),
-        "recv_audio_chunks_queue": Queue(),
-        "send_audio_chunks_queue": Queue(),
-        "spoken_prompt_queue": Queue(),
-        "text_prompt_queue": Queue(),
-        "lm_response_queue": Queue(),
+        "stop_event": stop_event,
+        "should_listen": should_listen,
+        "sessions": sessions,
+        **queues,
+    }
+
+
+def get_queues(queues_and_events):
+    return {
+        name: queue
+        for name, queue in queues_and_events.items()
+        if name.endswith("_queue")
     }
 
 
@@ -234,7 +334,16 @@ def build_pipeline(
     chat_tts_handler_kwargs,
     facebook_mms_tts_handler_kwargs,
     queues_and_events,
+    replay_kwargs=None,
+    stub_stt_handler_kwargs=None,
+    stub_language_model_handler_kwargs=None,
+    stub_tts_handler_kwargs=None,
+    create=None,
 ):
+    """
+    `create(handler_class, *args, **kwargs)` builds the handlers, e.g. `ModelCache.create` to reuse the models
+    of a previous pipeline (thread execution only).
+    """
     stop_event = queues_and_events["stop_event"]
     should_listen = queues_and_events["should_listen"]
     recv_audio_chunks_queue = queues_and_events["recv_audio_chunks_queue"]
@@ -242,28 +351,96 @@ def build_pipeline(
     spoken_prompt_queue = queues_and_events["spoken_prompt_queue"]
     text_prompt_queue = queues_and_events["text_prompt_queue"]
     lm_response_queue = queues_and_events["lm_response_queue"]
+    # models are loaded once and shared by every session of the pipeline
+    sessions = queues_and_events.get("sessions")
+    if sessions is None:
+        sessions = SessionManager(should_listen)
+    process_execution = module_kwargs.execution == "process"
+    if process_execution:
+        # the handlers are built in their own process from these specs; the sessions stay in this one, so
+        # each handler process serves the default session only
+        create = HandlerSpec
+        sessions = None
+    else:
+        create = create or create_handler
+        if module_kwargs.execution == "asyncio":
+            create = async_creator(create)
+            if module_kwargs.llm == "transformers" and getattr(language_model_handler_kwargs, "max_batch_size", 1) > 1:
+                logger.warning(
+                    "Continuous batching of the LM needs --execution thread: with asyncio, each prompt is "
+                    "generated on its own."
+                )
     if module_kwargs.mode == "local":
         from connections.local_audio_streamer import LocalAudioStreamer
 
-        local_audio_streamer = LocalAudioStreamer(
-            input_queue=recv_audio_chunks_queue, output_queue=send_audio_chunks_queue
+        local_audio_streamer = create(
+            LocalAudioStreamer,
+            input_queue=recv_audio_chunks_queue,
+            output_queue=send_audio_chunks_queue,
         )
         comms_handlers = [local_audio_streamer]
         should_listen.set()
+    elif module_kwargs.mode == "replay":
+        if process_execution:
+            raise ValueError("The replay mode needs the handlers in this process: use --execution thread.")
+        from connections.wav_replay import WavRecorder, WavReplayer
+        from utils.replay import TurnTracker
+
+        tracker = TurnTracker(
+            get_queues(queues_and_events).values(), should_listen=should_listen
+        )
+        replayer = create(
+            WavReplayer,
+            stop_event,
+            recv_audio_chunks_queue,
+            should_listen,
+            replay_kwargs.replay_files,
+            speed=replay_kwargs.replay_speed,
+            silence_ms=replay_kwargs.replay_silence_ms,
+            barge_in=vad_handler_kwargs.barge_in,
+            is_idle=tracker.idle,
+            on_file=tracker.start_file,
+        )
+        report_path = replay_kwargs.replay_report or os.path.join(
+            replay_kwargs.replay_output_dir, "latency_report.json"
+        )
+        comms_handlers = [
+            replayer,
+            create(
+                WavRecorder,
+                stop_event,
+                send_audio_chunks_queue,
+                replayer,
+                output_dir=replay_kwargs.replay_output_dir,
+                on_end=lambda: tracker.write_report(
+                    report_path,
+                    config={
+                        "stt": module_kwargs.stt,
+                        "llm": module_kwargs.llm,
+                        "tts": module_kwargs.tts,
+                        "replay_speed": replay_kwargs.replay_speed,
+                        "files": replay_kwargs.replay_files,
+                    },
+                ),
+            ),
+        ]
     else:
         from connections.socket_receiver import SocketReceiver
         from connections.socket_sender import SocketSender
 
         comms_handlers = [
-            SocketReceiver(
+            create(
+                SocketReceiver,
                 stop_event,
                 recv_audio_chunks_queue,
                 should_listen,
                 host=socket_receiver_kwargs.recv_host,
                 port=socket_receiver_kwargs.recv_port,
                 chunk_size=socket_receiver_kwargs.chunk_size,
+                barge_in=vad_handler_kwargs.barge_in,
             ),
-            SocketSender(
+            create(
+                SocketSender,
                 stop_event,
                 send_audio_chunks_queue,
                 host=socket_sender_kwargs.send_host,
@@ -271,64 +448,108 @@ def build_pipeline(
             ),
         ]
 
-    vad = VADHandler(
-        stop_event,
-        queue_in=recv_audio_chunks_queue,
-        queue_out=spoken_prompt_queue,
-        setup_args=(should_listen,),
-        setup_kwargs=vars(vad_handler_kwargs),
-    )
-
-    stt = get_stt_handler(module_kwargs, stop_event, spoken_prompt_queue, text_prompt_queue, whisper_stt_handler_kwargs, faster_whisper_stt_handler_kwargs, paraformer_stt_handler_kwargs)
-    lm = get_llm_handler(module_kwargs, stop_event, text_prompt_queue, lm_response_queue, language_model_handler_kwargs, open_api_language_model_handler_kwargs, mlx_language_model_handler_kwargs)
-    tts = get_tts_handler(module_kwargs, stop_event, lm_response_queue, send_audio_chunks_queue, should_listen, parler_tts_handler_kwargs, melo_tts_handler_kwargs, chat_tts_handler_kwargs, facebook_mms_tts_handler_kwargs)
-
-    return ThreadManager([*comms_handlers, vad, stt, lm, tts])
-
-
-def get_stt_handler(module_kwargs, stop_event, spoken_prompt_queue, text_prompt_queue, whisper_stt_handler_kwargs, faster_whisper_stt_handler_kwargs, paraformer_stt_handler_kwargs):
-    if module_kwargs.stt == "moonshine":
-        from STT.moonshine_handler import MoonshineSTTHandler
-        return MoonshineSTTHandler(
+    def build_vad():
+        return create(
+            load_handler("vad", module_kwargs.vad),
             stop_event,
-            queue_in=spoken_prompt_queue,
-            queue_out=text_prompt_queue,
+            queue_in=recv_audio_chunks_queue,
+            queue_out=spoken_prompt_queue,
+            setup_args=(should_listen,),
+            setup_kwargs=vars(vad_handler_kwargs),
+            sessions=sessions,
         )
-    if module_kwargs.stt == "whisper":
-        from STT.whisper_stt_handler import WhisperSTTHandler
-        return WhisperSTTHandler(
+
+    def build_stt():
+        return get_stt_handler(
+            module_kwargs,
             stop_event,
-            queue_in=spoken_prompt_queue,
-            queue_out=text_prompt_queue,
-            setup_kwargs=vars(whisper_stt_handler_kwargs),
+            spoken_prompt_queue,
+            text_prompt_queue,
+            whisper_stt_handler_kwargs,
+            faster_whisper_stt_handler_kwargs,
+            paraformer_stt_handler_kwargs,
+            sessions=sessions,
+            create=create,
+            stub_stt_handler_kwargs=stub_stt_handler_kwargs,
         )
-    elif module_kwargs.stt == "whisper-mlx":
-        from STT.lightning_whisper_mlx_handler import LightningWhisperSTTHandler
-        return LightningWhisperSTTHandler(
+
+    def build_lm():
+        return get_llm_handler(
+            module_kwargs,
             stop_event,
-            queue_in=spoken_prompt_queue,
-            queue_out=text_prompt_queue,
-            setup_kwargs=vars(whisper_stt_handler_kwargs),
+            text_prompt_queue,
+            lm_response_queue,
+            language_model_handler_kwargs,
+            open_api_language_model_handler_kwargs,
+            mlx_language_model_handler_kwargs,
+            sessions=sessions,
+            create=create,
+            stub_language_model_handler_kwargs=stub_language_model_handler_kwargs,
         )
-    elif module_kwargs.stt == "paraformer":
-        from STT.paraformer_handler import ParaformerSTTHandler
-        return ParaformerSTTHandler(
+
+    def build_tts():
+        return get_tts_handler(
+            module_kwargs,
             stop_event,
-            queue_in=spoken_prompt_queue,
-            queue_out=text_prompt_queue,
-            setup_kwargs=vars(paraformer_stt_handler_kwargs),
+            lm_response_queue,
+            send_audio_chunks_queue,
+            should_listen,
+            parler_tts_handler_kwargs,
+            melo_tts_handler_kwargs,
+            chat_tts_handler_kwargs,
+            facebook_mms_tts_handler_kwargs,
+            sessions=sessions,
+            create=create,
+            stub_tts_handler_kwargs=stub_tts_handler_kwargs,
         )
-    elif module_kwargs.stt == "faster-whisper":
-        from STT.faster_whisper_handler import FasterWhisperSTTHandler
 
-        return FasterWhisperSTTHandler(
-            stop_event,
-            queue_in=spoken_prompt_queue,
-            queue_out=text_prompt_queue,
-            setup_kwargs=vars(faster_whisper_stt_handler_kwargs),
+    # the stages are independent until they run: their models are loaded and warmed up side by side
+    stages, timeline = build_stages(
+        {"vad": build_vad, "stt": build_stt, "lm": build_lm, "tts": build_tts},
+        # in process execution, the handlers are only specified here and load in their own process
+        parallel=module_kwargs.parallel_startup and not process_execution,
+    )
+    vad, stt, lm, tts = stages["vad"], stages["stt"], stages["lm"], stages["tts"]
+    for name, budget in parse_budgets(module_kwargs.cpu_budget).items():
+        if process_execution:
+            # each stage has the process to itself: its inter-op pool only serves it
+            budget.interop_threads = 1
+        logger.info(f"{name}: {budget}")
+        stages[name].cpu_budget = budget
+    if not process_execution:
+        logger.info(format_timeline(timeline))
+
+    if process_execution:
+        return ProcessManager([*comms_handlers, vad, stt, lm, tts], log_level=module_kwargs.log_level)
+    if module_kwargs.mode == "replay":
+        tracker.attach(vad=vad, stt=stt, lm=lm, tts=tts)
+    if module_kwargs.execution == "asyncio":
+        return AsyncPipelineManager(
+            [*comms_handlers, vad, stt, lm, tts], queues=get_queues(queues_and_events).values()
         )
-    else:
-        raise ValueError("The STT should be either whisper, whisper-mlx, or paraformer.")
+    return ThreadManager([*comms_handlers, vad, stt, lm, tts])
+
+
+def create_handler(handler_class, *args, **kwargs):
+    return handler_class(*args, **kwargs)
+
+
+def get_stt_handler(module_kwargs, stop_event, spoken_prompt_queue, text_prompt_queue, whisper_stt_handler_kwargs, faster_whisper_stt_handler_kwargs, paraformer_stt_handler_kwargs, sessions=None, create=create_handler, stub_stt_handler_kwargs=None):
+    handler_kwargs = {
+        "whisper": whisper_stt_handler_kwargs,
+        "whisper-mlx": whisper_stt_handler_kwargs,
+        "faster-whisper": faster_whisper_stt_handler_kwargs,
+        "paraformer": paraformer_stt_handler_kwargs,
+        "stub": stub_stt_handler_kwargs,
+    }.get(module_kwargs.stt)
+    return create(
+        load_handler("stt", module_kwargs.stt),
+        stop_event,
+        queue_in=spoken_prompt_queue,
+        queue_out=text_prompt_queue,
+        setup_kwargs=vars(handler_kwargs) if handler_kwargs is not None else {},
+        sessions=sessions,
+    )
 
 
 def get_llm_handler(
@@ -338,87 +559,76 @@ def get_llm_handler(
     lm_response_queue, 
     language_model_handler_kwargs,
     open_api_language_model_handler_kwargs,
-    mlx_language_model_handler_kwargs
+    mlx_language_model_handler_kwargs,
+    sessions=None,
+    create=create_handler,
+    stub_language_model_handler_kwargs=None,
 ):
-    if module_kwargs.llm == "transformers":
-        from LLM.language_model import LanguageModelHandler
-        return LanguageModelHandler(
-            stop_event,
-            queue_in=text_prompt_queue,
-            queue_out=lm_response_queue,
-            setup_kwargs=vars(language_model_handler_kwargs),
-        )
-    elif module_kwargs.llm == "open_api":
-        from LLM.openai_api_language_model import OpenApiModelHandler
-        return OpenApiModelHandler(
-            stop_event,
-            queue_in=text_prompt_queue,
-            queue_out=lm_response_queue,
-            setup_kwargs=vars(open_api_language_model_handler_kwargs),
-        )
+    handler_kwargs = {
+        "transformers": language_model_handler_kwargs,
+        "open_api": open_api_language_model_handler_kwargs,
+        "mlx-lm": mlx_language_model_handler_kwargs,
+        "stub": stub_language_model_handler_kwargs,
+    }.get(module_kwargs.llm)
+    return create(
+        load_handler("llm", module_kwargs.llm),
+        stop_event,
+        queue_in=text_prompt_queue,
+        queue_out=lm_response_queue,
+        setup_kwargs=vars(handler_kwargs) if handler_kwargs is not None else {},
+        sessions=sessions,
+    )
 
-    elif module_kwargs.llm == "mlx-lm":
-        from LLM.mlx_language_model import MLXLanguageModelHandler
-        return MLXLanguageModelHandler(
-            stop_event,
-            queue_in=text_prompt_queue,
-            queue_out=lm_response_queue,
-            setup_kwargs=vars(mlx_language_model_handler_kwargs),
-        )
 
-    else:
-        raise ValueError("The LLM should be either transformers or mlx-lm")
+def get_tts_handler(module_kwargs, stop_event, lm_response_queue, send_audio_chunks_queue, should_listen, parler_tts_handler_kwargs, melo_tts_handler_kwargs, chat_tts_handler_kwargs, facebook_mms_tts_handler_kwargs, sessions=None, create=create_handler, stub_tts_handler_kwargs=None):
+    handler_kwargs = {
+        "parler": parler_tts_handler_kwargs,
+        "melo": melo_tts_handler_kwargs,
+        "chatTTS": chat_tts_handler_kwargs,
+        "facebookMMS": facebook_mms_tts_handler_kwargs,
+        "stub": stub_tts_handler_kwargs,
+    }.get(module_kwargs.tts)
+    return create(
+        load_handler("tts", module_kwargs.tts),
+        stop_event,
+        queue_in=lm_response_queue,
+        queue_out=send_audio_chunks_queue,
+        setup_args=(should_listen,),
+        setup_kwargs=vars(handler_kwargs) if handler_kwargs is not None else {},
+        sessions=sessions,
+    )
 
 
-def get_tts_handler(module_kwargs, stop_event, lm_response_queue, send_audio_chunks_queue, should_listen, parler_tts_handler_kwargs, melo_tts_handler_kwargs, chat_tts_handler_kwargs, facebook_mms_tts_handler_kwargs):
-    if module_kwargs.tts == "parler":
-        from TTS.parler_handler import ParlerTTSHandler
-        return ParlerTTSHandler(
-            stop_event,
-            queue_in=lm_response_queue,
-            queue_out=send_audio_chunks_queue,
-            setup_args=(should_listen,),
-            setup_kwargs=vars(parler_tts_handler_kwargs),
-        )
-    elif module_kwargs.tts == "melo":
-        try:
-            from TTS.melo_handler import MeloTTSHandler
-        except RuntimeError as e:
-            logger.error(
-                "Error importing MeloTTSHandler. You might need to run: python -m unidic download"
-            )
-            raise e
-        return MeloTTSHandler(
-            stop_event,
-            queue_in=lm_response_queue,
-            queue_out=send_audio_chunks_queue,
-            setup_args=(should_listen,),
-            setup_kwargs=vars(melo_tts_handler_kwargs),
-        )
-    elif module_kwargs.tts == "chatTTS":
-        try:
-            from TTS.chatTTS_handler import ChatTTSHandler
-        except RuntimeError as e:
-            logger.error("Error importing ChatTTSHandler")
-            raise e
-        return ChatTTSHandler(
+def precompile(module_kwargs, queues_and_events, stt_handler_kwargs, tts_handler_kwargs):
+    """
+    Builds the STT and TTS handlers one after the other from an empty compile cache, so that their setup
+    compiles and warms up every shape bucket and stores the result (see utils/compile_cache.py).
+    """
+    clear_manifest()
+    stop_event = queues_and_events["stop_event"]
+
+    def build_stt():
+        return get_stt_handler(
+            module_kwargs,
             stop_event,
-            queue_in=lm_response_queue,
-            queue_out=send_audio_chunks_queue,
-            setup_args=(should_listen,),
-            setup_kwargs=vars(chat_tts_handler_kwargs),
+            queues_and_events["spoken_prompt_queue"],
+            queues_and_events["text_prompt_queue"],
+            *stt_handler_kwargs,
         )
-    elif module_kwargs.tts == "facebookMMS":
-        from TTS.facebookmms_handler import FacebookMMSTTSHandler
-        return FacebookMMSTTSHandler(
+
+    def build_tts():
+        return get_tts_handler(
+            module_kwargs,
             stop_event,
-            queue_in=lm_response_queue,
-            queue_out=send_audio_chunks_queue,
-            setup_args=(should_listen,),
-            setup_kwargs=vars(facebook_mms_tts_handler_kwargs),
+            queues_and_events["lm_response_queue"],
+            queues_and_events["send_audio_chunks_queue"],
+            queues_and_events["should_listen"],
+            *tts_handler_kwargs,
         )
-    else:
-        raise ValueError("The TTS should be either parler, melo, chatTTS or facebookMMS")
+
+    # one after the other: the compilations of the two models would compete for the same cores
+    _, timeline = build_stages({"stt": build_stt, "tts": build_tts}, parallel=False)
+    logger.info(format_timeline(timeline))
 
 
 def main():
@@ -437,6 +647,11 @@ def main():
         melo_tts_handler_kwargs,
         chat_tts_handler_kwargs,
         facebook_mms_tts_handler_kwargs,
+        stub_stt_handler_kwargs,
+        stub_language_model_handler_kwargs,
+        stub_tts_handler_kwargs,
+        queue_kwargs,
+        replay_kwargs,
     ) = parse_arguments()
 
     setup_logger(module_kwargs.log_level)
@@ -453,9 +668,33 @@ def main():
         melo_tts_handler_kwargs,
         chat_tts_handler_kwargs,
         facebook_mms_tts_handler_kwargs,
+        stub_stt_handler_kwargs,
+        stub_language_model_handler_kwargs,
+        stub_tts_handler_kwargs,
     )
 
-    queues_and_events = initialize_queues_and_events()
+    queues_and_events = initialize_queues_and_events(queue_kwargs, module_kwargs.execution)
+
+    if module_kwargs.precompile:
+        precompile(
+            module_kwargs,
+            queues_and_events,
+            (whisper_stt_handler_kwargs, faster_whisper_stt_handler_kwargs, paraformer_stt_handler_kwargs),
+            (parler_tts_handler_kwargs, melo_tts_handler_kwargs, chat_tts_handler_kwargs, facebook_mms_tts_handler_kwargs),
+        )
+        return
+
+    # started before the models are loaded, so that the warmup shows as not ready
+    pipeline = {}
+    if module_kwargs.metrics_port:
+        MetricsServer(
+            host=module_kwargs.metrics_host,
+            port=module_kwargs.metrics_port,
+            get_queues=lambda: get_queues(queues_and_events),
+            get_handler_metrics=lambda: pipeline["manager"].get_metrics() if pipeline else {},
+            get_active_sessions=lambda: len(queues_and_events["sessions"]),
+            is_ready=lambda: bool(pipeline),
+        ).start()
 
     pipeline_manager = build_pipeline(
         module_kwargs,
@@ -473,10 +712,15 @@ def main():
         chat_tts_handler_kwargs,
         facebook_mms_tts_handler_kwargs,
         queues_and_events,
+        replay_kwargs,
+        stub_stt_handler_kwargs,
+        stub_language_model_handler_kwargs,
+        stub_tts_handler_kwargs,
     )
 
     try:
         pipeline_manager.start()
+        pipeline["manager"] = pipeline_manager
     except KeyboardInterrupt:
         pipeline_manager.stop()
 
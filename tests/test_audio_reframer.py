@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from utils.audio_reframer import AudioReframer, Resampler, decode_pcm
+
+
+def random_cuts(rng, length, max_size):
+    cuts, position = [], 0
+    while position < length:
+        size = int(rng.integers(1, max_size))
+        cuts.append((position, position + size))
+        position += size
+    return cuts
+
+
+def test_reframer_is_chunk_size_invariant():
+    rng = np.random.default_rng(0)
+    pcm = (rng.standard_normal(20000) * 3000).astype(np.int16)
+    reframer = AudioReframer(512, capacity=600)
+    windows = [reframer.push(pcm[start:end].tobytes()).copy() for start, end in random_cuts(rng, len(pcm), 3000)]
+    windows = np.concatenate(windows)
+    assert windows.shape == (len(pcm) // 512, 512)
+    assert np.allclose(windows.reshape(-1), pcm[: windows.size] / 32768)
+
+
+def test_reframer_takes_float32_arrays():
+    reframer = AudioReframer(4)
+    assert reframer.push(np.ones(3, dtype=np.float32)).shape == (0, 4)
+    windows = reframer.push(np.full(6, 0.5, dtype=np.float32))
+    assert np.array_equal(windows, [[1, 1, 1, 0.5], [0.5, 0.5, 0.5, 0.5]])
+
+
+def test_decode_pcm():
+    samples = np.array([0.25, -0.5], dtype=np.float32)
+    assert np.array_equal(decode_pcm(samples.tobytes(), "float32"), samples)
+    with pytest.raises(ValueError):
+        decode_pcm(b"\0\0", "int8")
+
+
+@pytest.mark.parametrize("input_rate", [48000, 44100, 8000])
+def test_resampler_is_chunk_size_invariant(input_rate):
+    rng = np.random.default_rng(0)
+    audio = rng.standard_normal(input_rate).astype(np.float32)
+    whole = Resampler(input_rate, 16000)(audio)
+    resampler = Resampler(input_rate, 16000)
+    chunked = np.concatenate([resampler(audio[start:end]) for start, end in random_cuts(rng, len(audio), 900)])
+    assert abs(len(whole) - 16000) <= 2
+    assert len(chunked) == len(whole)
+    assert np.allclose(chunked, whole, atol=1e-5)
+
+
+def test_resampler_keeps_a_tone():
+    t = np.arange(48000) / 48000
+    resampled = Resampler(48000, 16000)(np.sin(2 * np.pi * 440 * t).astype(np.float32))
+    expected = np.sin(2 * np.pi * 440 * (np.arange(16000) * 3 + 1) / 48000)
+    assert np.allclose(resampled, expected, atol=1e-2)
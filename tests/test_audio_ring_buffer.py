@@ -0,0 +1,106 @@
+from queue import Empty, Full
+
+import numpy as np
+import pytest
+
+from arguments_classes.queue_arguments import QueueArguments
+from s2s_pipeline import initialize_queues
+from utils.audio_ring_buffer import AudioRingBuffer
+from utils.envelope import END
+from utils.process_manager import MP_CONTEXT
+
+
+@pytest.fixture
+def ring():
+    ring = AudioRingBuffer(n_slots=6, slot_samples=4)
+    yield ring
+    ring.close()
+
+
+def read_all(ring):
+    chunks = []
+    while True:
+        try:
+            chunks.append(ring.get_nowait().copy())
+        except Empty:
+            return chunks
+
+
+def test_chunks_longer_than_a_slot_span_several(ring):
+    ring.put(np.arange(10, dtype=np.int16))
+    assert ring.qsize() == 3
+    assert [chunk.tolist() for chunk in read_all(ring)] == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+
+
+def test_bytes_are_read_as_samples(ring):
+    ring.put(np.array([1, -2], dtype=np.int16).tobytes())
+    assert ring.get().tolist() == [1, -2]
+
+
+def test_full_ring_blocks_or_drops_the_oldest():
+    blocking = AudioRingBuffer(n_slots=4, slot_samples=1)
+    dropping = AudioRingBuffer(n_slots=4, slot_samples=1, policy="drop_oldest")
+    try:
+        for value in range(blocking.maxsize):
+            blocking.put(np.array([value], dtype=np.int16))
+        with pytest.raises(Full):
+            blocking.put_nowait(np.array([9], dtype=np.int16))
+
+        for value in range(4):
+            dropping.put(np.array([value], dtype=np.int16))
+        assert dropping.dropped == 2
+        assert [chunk.tolist() for chunk in read_all(dropping)] == [[2], [3]]
+    finally:
+        blocking.close()
+        dropping.close()
+
+
+def test_end_follows_the_audio_before_it_and_is_got_once(ring):
+    ring.put(np.arange(2, dtype=np.int16))
+    ring.put(END)
+    ring.put(np.arange(2, 4, dtype=np.int16))
+    assert ring.get().tolist() == [0, 1]
+    assert ring.get() is END
+    # the ring is open again
+    assert ring.get().tolist() == [2, 3]
+    with pytest.raises(Empty):
+        ring.get_nowait()
+
+
+def test_flush_drops_the_unread_audio(ring):
+    ring.put(np.arange(8, dtype=np.int16))
+    assert ring.flush() == 2
+    assert ring.empty()
+
+
+def test_samples_of_another_dtype_are_rejected(ring):
+    with pytest.raises(ValueError):
+        ring.put(np.zeros(4, dtype=np.float32))
+
+
+def put_chunks(ring):
+    for value in range(3):
+        ring.put(np.full(4, value, dtype=np.int16))
+    ring.put(END)
+
+
+def test_another_process_writes_into_the_same_memory(ring):
+    process = MP_CONTEXT.Process(target=put_chunks, args=(ring,))
+    process.start()
+    chunks = []
+    while (chunk := ring.get(timeout=30)) is not END:
+        chunks.append(chunk.tolist())
+    process.join()
+    assert chunks == [[0] * 4, [1] * 4, [2] * 4]
+
+
+def test_shared_buffers_are_refused_to_several_sessions():
+    queue_kwargs = QueueArguments(shared_audio_buffers=True)
+    with pytest.raises(ValueError):
+        initialize_queues(queue_kwargs, multi_session=True)
+    with pytest.raises(ValueError):
+        initialize_queues(queue_kwargs, execution="asyncio")
+    queues = initialize_queues(queue_kwargs)
+    assert isinstance(queues["recv_audio_chunks_queue"], AudioRingBuffer)
+    for name in ("recv_audio_chunks_queue", "send_audio_chunks_queue"):
+        queues[name].close()
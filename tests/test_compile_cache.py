@@ -0,0 +1,49 @@
+import pytest
+
+from utils import compile_cache
+from utils.compile_cache import CompileCache
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(compile_cache, "CACHE_DIR", tmp_path)
+    monkeypatch.setattr(compile_cache, "MANIFEST", tmp_path / "compile_manifest.json")
+    monkeypatch.setattr(compile_cache, "PROCESS_ARTIFACTS", tmp_path / "artifacts-1-1.bin")
+    return tmp_path
+
+
+def test_saved_shapes_are_valid_in_the_next_process():
+    shapes = ["1x3000", "2x3000"]
+    cache = CompileCache("whisper", model_name="tiny", compile_mode="default", device="cpu")
+    assert not cache.valid(shapes)
+    cache.save(shapes)
+    restarted = CompileCache("whisper", model_name="tiny", compile_mode="default", device="cpu")
+    assert restarted.valid(shapes) and restarted.valid(shapes[:1])
+    assert not restarted.valid(["4x3000"])
+    assert restarted.short_warmup(shapes)
+    assert not CompileCache("whisper", model_name="small", compile_mode="default", device="cpu").valid(shapes)
+
+
+def test_no_short_warmup_with_cuda_graphs(monkeypatch):
+    monkeypatch.setattr(compile_cache, "uses_cuda_graphs", lambda compile_mode, device: True)
+    cache = CompileCache("parler", compile_mode="reduce-overhead", device="cpu")
+    cache.save(["1x4"])
+    assert cache.valid(["1x4"]) and not cache.short_warmup(["1x4"])
+
+
+def test_entries_share_the_artifacts_of_their_process(cache_dir, monkeypatch):
+    import torch
+
+    monkeypatch.setattr(torch.compiler, "save_cache_artifacts", lambda: (b"graphs", None), raising=False)
+    stale = cache_dir / "artifacts-0-0.bin"
+    stale.write_bytes(b"old")
+    whisper = CompileCache("whisper", compile_mode="default", device="cpu")
+    parler = CompileCache("parler", compile_mode="default", device="cpu")
+    whisper.save(["1x3000"])
+    parler.save(["1x4"])
+    assert whisper.artifacts == parler.artifacts == cache_dir / "artifacts-1-1.bin"
+    assert whisper.artifacts.read_bytes() == b"graphs"
+    # no entry refers to it anymore
+    assert not stale.exists()
+    whisper.artifacts.unlink()
+    assert not CompileCache("whisper", compile_mode="default", device="cpu").valid(["1x3000"])
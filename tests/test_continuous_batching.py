@@ -0,0 +1,109 @@
+import pytest
+import torch
+from transformers import LlamaConfig, LlamaForCausalLM
+
+from LLM.continuous_batching import ContinuousBatcher, Sequence
+
+
+class ByteTokenizer:
+    """
+    Each token is a byte of the UTF-8 text, so a character can span several tokens.
+    """
+
+    eos_token_id = 0
+
+    def decode(self, ids, skip_special_tokens=False):
+        return bytes(ids).decode("utf-8", errors="replace")
+
+
+@pytest.fixture(scope="module")
+def model():
+    torch.manual_seed(0)
+    config = LlamaConfig(
+        vocab_size=256,
+        hidden_size=32,
+        intermediate_size=64,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        eos_token_id=0,
+    )
+    return LlamaForCausalLM(config).eval()
+
+
+def greedy(model, prompt, max_new_tokens):
+    with torch.no_grad():
+        output = model.generate(
+            torch.tensor([prompt]), max_new_tokens=max_new_tokens, do_sample=False, pad_token_id=0
+        )
+    return output[0, len(prompt) :].tolist()
+
+
+def test_batched_decoding_matches_generate(model):
+    batcher = ContinuousBatcher(model, ByteTokenizer(), "cpu", max_batch_size=4)
+    prompts = [[5, 6, 7], [8, 9, 10, 11, 12, 13, 14], [20, 21], [30, 31, 32, 33]]
+    lengths = [12, 4, 9, 6]
+    sequences = [Sequence(torch.tensor([prompt]), length) for prompt, length in zip(prompts, lengths)]
+
+    # sequences join at different steps and leave when done
+    batcher.add(sequences[0])
+    batcher.add(sequences[1])
+    for _ in range(3):
+        batcher.step()
+    batcher.add(sequences[2])
+    batcher.step()
+    batcher.add(sequences[3])
+    while batcher.active:
+        batcher.step()
+
+    for sequence, prompt, length in zip(sequences, prompts, lengths):
+        expected = greedy(model, prompt, length)
+        assert sequence.generated_ids == expected[: len(sequence.generated_ids)]
+        assert sequence.finished
+    assert batcher.cache is None and batcher.rows == []
+
+
+def test_cache_is_only_rebuilt_when_the_batch_changes(model, monkeypatch):
+    batcher = ContinuousBatcher(model, ByteTokenizer(), "cpu", max_batch_size=4)
+    repacks = []
+    repack = batcher._repack
+    monkeypatch.setattr(batcher, "_repack", lambda: repacks.append(len(batcher.active)) or repack())
+    batcher.add(Sequence(torch.tensor([[5, 6, 7]]), 20))
+    batcher.add(Sequence(torch.tensor([[8, 9]]), 20))
+    for _ in range(5):
+        batcher.step()
+    assert repacks == [2]
+    batcher.cancel(lambda sequence: sequence.input_ids.shape[1] == 2)
+    batcher.step()
+    assert repacks == [2, 1]
+
+
+def test_incomplete_characters_wait_for_their_last_byte(model):
+    batcher = ContinuousBatcher(model, ByteTokenizer(), "cpu")
+    sequence = Sequence(torch.tensor([[1]]), max_new_tokens=10)
+    new_texts = [batcher._append(sequence, token) for token in "aé b".encode()]
+    assert new_texts == ["a", "", "é", " ", "b"]
+    assert sequence.text == "aé b"
+    # only the tokens since the last printed text are decoded again
+    assert sequence.prefix_offset == 4 and sequence.read_offset == 5
+
+
+def test_sampling_without_temperature_is_greedy(model):
+    batcher = ContinuousBatcher(model, ByteTokenizer(), "cpu", temperature=0.0, do_sample=True)
+    assert not batcher.do_sample
+    sequence = Sequence(torch.tensor([[5, 6, 7]]), 8)
+    batcher.add(sequence)
+    while batcher.active:
+        batcher.step()
+    assert sequence.generated_ids == greedy(model, [5, 6, 7], 8)[: len(sequence.generated_ids)]
+
+
+def test_sampling_applies_top_k(model):
+    torch.manual_seed(0)
+    batcher = ContinuousBatcher(model, ByteTokenizer(), "cpu", temperature=1.0, do_sample=True, top_k=1)
+    sequence = Sequence(torch.tensor([[5, 6, 7]]), 8)
+    batcher.add(sequence)
+    while batcher.active:
+        batcher.step()
+    # sampling among the single most likely token is greedy decoding
+    assert sequence.generated_ids == greedy(model, [5, 6, 7], 8)[: len(sequence.generated_ids)]
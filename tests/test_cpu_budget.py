@@ -0,0 +1,42 @@
+import pytest
+
+from utils.cpu_budget import auto_budgets, format_cpus, parse_budgets, parse_cpus
+
+
+def test_parse_and_format_cpus():
+    assert parse_cpus("0-3,8") == [0, 1, 2, 3, 8]
+    assert format_cpus([0, 1, 2, 3, 8]) == "0-3,8"
+    assert format_cpus([5]) == "5"
+
+
+def test_parse_budgets():
+    budgets = parse_budgets("vad=1@0,stt=3@1-3,lm=8@4-7+12-15")
+    assert budgets["vad"].threads == 1 and budgets["vad"].cpus == [0]
+    assert budgets["stt"].cpus == [1, 2, 3]
+    assert budgets["lm"].threads == 8 and budgets["lm"].cpus == [4, 5, 6, 7, 12, 13, 14, 15]
+    assert "tts" not in budgets
+
+
+def test_parse_budgets_without_cpus():
+    budgets = parse_budgets("tts=2")
+    assert budgets["tts"].threads == 2 and budgets["tts"].cpus is None
+    assert parse_budgets("") == {}
+
+
+def test_parse_budgets_unknown_stage():
+    with pytest.raises(ValueError):
+        parse_budgets("llm=4")
+
+
+def test_auto_budgets_split_the_cores():
+    budgets = parse_budgets("auto", cpus=list(range(8)))
+    assert budgets["vad"].cpus == [0]
+    cpus = [cpu for stage in ("stt", "lm", "tts") for cpu in budgets[stage].cpus]
+    assert sorted(cpus) == list(range(1, 8))
+    assert budgets["lm"].threads > budgets["stt"].threads
+
+
+def test_auto_budgets_few_cores():
+    budgets = auto_budgets([0, 1])
+    assert all(budget.cpus is None for budget in budgets.values())
+    assert all(budget.threads >= 1 for budget in budgets.values())
@@ -0,0 +1,55 @@
+from time import monotonic
+
+from utils.deadline import DeadlineTracker
+from utils.envelope import Envelope
+
+
+def utterance(session_id=None, deadline_s=-1.0, created=None):
+    envelope = Envelope("text", session_id=session_id, created=created)
+    envelope.deadline = envelope.created + deadline_s
+    return envelope
+
+
+def test_an_utterance_past_its_deadline_expires_until_started():
+    deadlines = DeadlineTracker()
+    envelope = utterance()
+    assert deadlines.expired(envelope)
+    assert deadlines.start(envelope)
+    # its next outputs are not cut
+    assert not deadlines.expired(envelope.derive("next sentence"))
+    assert not deadlines.start(envelope.derive("next sentence"))
+
+
+def test_no_deadline_never_expires():
+    deadlines = DeadlineTracker()
+    assert not deadlines.expired(Envelope("text"))
+    assert not deadlines.expired(None)
+    assert not deadlines.expired(utterance(deadline_s=60.0))
+
+
+def test_utterances_created_at_the_same_time_are_told_apart():
+    deadlines = DeadlineTracker()
+    created = monotonic()
+    first, second = utterance(created=created), utterance(created=created)
+    assert first.utterance != second.utterance
+    deadlines.start(first)
+    assert deadlines.start(second)
+
+
+def test_started_utterances_are_not_forgotten():
+    deadlines = DeadlineTracker()
+    envelope = utterance(session_id="a")
+    deadlines.start(envelope)
+    for _ in range(1000):
+        deadlines.start(utterance(session_id="b"))
+    assert not deadlines.expired(envelope.derive("next sentence"))
+
+
+def test_sessions_are_tracked_apart_and_forgotten_once_closed():
+    deadlines = DeadlineTracker()
+    older = utterance(session_id="a")
+    deadlines.start(utterance(session_id="b"))
+    assert deadlines.expired(older)
+    deadlines.start(older)
+    deadlines.forget("a")
+    assert "a" not in deadlines.started and "b" in deadlines.started
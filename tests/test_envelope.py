@@ -0,0 +1,72 @@
+import pickle
+import threading
+
+import pytest
+
+from baseHandler import BaseHandler
+from utils.envelope import END, Control, Envelope, is_end, to_client
+from utils.pipeline_queue import PipelineQueue
+from utils.session import SessionMessage
+
+
+class Upper(BaseHandler):
+    def process(self, text):
+        yield text.upper()
+
+
+def test_derived_envelopes_keep_what_the_stages_need():
+    envelope = Envelope("hello", session_id="a", turn=2, language="en", deadline=10.0)
+    envelope.stamp("STT")
+    derived = envelope.derive("HELLO")
+    assert derived.payload == "HELLO"
+    assert (derived.session_id, derived.turn, derived.language) == ("a", 2, "en")
+    assert (derived.created, derived.deadline, derived.utterance) == (
+        envelope.created,
+        envelope.deadline,
+        envelope.utterance,
+    )
+    assert list(derived.latencies()) == ["STT"]
+    # the stamps of the derived envelope are its own
+    derived.stamp("LLM")
+    assert list(envelope.latencies()) == ["STT"]
+
+
+def test_envelopes_and_controls_survive_pickling():
+    envelope = pickle.loads(pickle.dumps(Envelope("hello", session_id="a", turn=1)))
+    assert (envelope.payload, envelope.session_id, envelope.turn) == ("hello", "a", 1)
+    assert pickle.loads(pickle.dumps(END)) == END
+    assert is_end(pickle.loads(pickle.dumps(END)))
+
+
+def test_controls():
+    with pytest.raises(ValueError):
+        Control("pause")
+    assert Control.cancel("a", 2) == Control("cancel", "a", 2)
+    assert len({Control.cancel("a", 2), Control.cancel("a", 2), Control.flush("a")}) == 2
+    assert Control.cancel("a", 2).urgent and Control.flush("a").urgent and not END.urgent
+    assert is_end(END) and is_end(b"END")
+    assert not is_end(Control.flush("a")) and not is_end(b"audio")
+
+
+def test_clients_get_the_payload():
+    assert to_client(Envelope(b"audio")) == b"audio"
+    assert to_client(Envelope(b"audio", session_id="a")) == SessionMessage("a", b"audio")
+    assert to_client(b"audio") == b"audio"
+
+
+def test_cancel_overtakes_and_drops_the_items_of_the_interrupted_turn():
+    queue_in, queue_out = PipelineQueue(), PipelineQueue()
+    handler = Upper(threading.Event(), queue_in, queue_out)
+    queue_in.put(Envelope("old answer", turn=0))
+    queue_in.put(Control.cancel(None, 1))
+    queue_in.put(Envelope("new answer", turn=1))
+    queue_in.put(END)
+    handler.run()
+    outputs = []
+    while not queue_out.empty():
+        outputs.append(queue_out.get_nowait())
+    # the stage catches up with the turn of the message, which it passes on
+    assert handler.sessions.default.turn == 1
+    assert outputs[0] == Control.cancel(None, 1)
+    assert [output.payload for output in outputs[1:-1]] == ["NEW ANSWER"]
+    assert outputs[-1] == END
@@ -0,0 +1,31 @@
+import pytest
+
+from utils.metrics import LatencyHistogram
+
+
+def test_empty_histogram():
+    histogram = LatencyHistogram()
+    assert histogram.percentile(50) == 0.0
+    assert histogram.snapshot()["count"] == 0
+
+
+def test_percentiles():
+    histogram = LatencyHistogram()
+    for millisecond in range(1, 1001):
+        histogram.observe(millisecond / 1000)
+    snapshot = histogram.snapshot()
+    assert snapshot["count"] == 1000
+    assert snapshot["max"] == 1.0
+    assert snapshot["mean"] == pytest.approx(0.5005)
+    # accurate to the resolution of the buckets
+    assert snapshot["p50"] == pytest.approx(0.5, rel=0.15)
+    assert snapshot["p99"] == pytest.approx(0.99, rel=0.15)
+    assert snapshot["p50"] <= snapshot["p95"] <= snapshot["p99"] <= snapshot["max"]
+
+
+def test_out_of_range_values():
+    histogram = LatencyHistogram(min_value=1e-3, max_value=1.0)
+    histogram.observe(0.0)
+    histogram.observe(10.0)
+    assert histogram.percentile(100) == 10.0
+    assert histogram.percentile(0) == 0.0
@@ -0,0 +1,65 @@
+from queue import Queue
+from threading import Event
+
+from baseHandler import BaseHandler
+from utils.model_cache import ModelCache
+
+
+class LanguageHandler(BaseHandler):
+    """
+    Changes its setup arguments in place, as the Whisper handlers do with their gen_kwargs.
+    """
+
+    released = 0
+
+    def setup(self, gen_kwargs={}):
+        gen_kwargs["language"] = "en"
+        self.gen_kwargs = gen_kwargs
+
+    def release(self):
+        LanguageHandler.released += 1
+
+
+def build(cache, queues, gen_kwargs):
+    return cache.create(
+        LanguageHandler, queues["stop"], queues["in"], queues["out"], setup_kwargs={"gen_kwargs": gen_kwargs}
+    )
+
+
+def queues():
+    return {"stop": Event(), "in": Queue(), "out": Queue()}
+
+
+def test_checked_in_handlers_are_reused():
+    cache, shared = ModelCache(idle_timeout=None), queues()
+    gen_kwargs = {"max_new_tokens": 64}
+    handler = build(cache, shared, gen_kwargs)
+    # the setup changed its own copy
+    assert gen_kwargs == {"max_new_tokens": 64}
+    assert handler.gen_kwargs["language"] == "en"
+    cache.checkin([handler])
+    assert build(cache, shared, gen_kwargs) is handler
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_handlers_in_use_are_not_shared():
+    cache, shared = ModelCache(idle_timeout=None), queues()
+    first = build(cache, shared, {})
+    assert build(cache, shared, {}) is not first
+
+
+def test_different_arguments_or_queues_miss():
+    cache, shared = ModelCache(idle_timeout=None), queues()
+    handler = build(cache, shared, {"max_new_tokens": 64})
+    cache.checkin([handler])
+    assert build(cache, shared, {"max_new_tokens": 32}) is not handler
+    assert build(cache, queues(), {"max_new_tokens": 64}) is not handler
+
+
+def test_idle_handlers_are_released():
+    LanguageHandler.released = 0
+    cache, shared = ModelCache(idle_timeout=0.0), queues()
+    handler = build(cache, shared, {})
+    cache.checkin([handler])
+    assert LanguageHandler.released == 1
+    assert not cache.entries
@@ -0,0 +1,110 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from utils.async_pipeline import AsyncPipelineQueue
+from utils.envelope import END, Control, Envelope
+from utils.pipeline_queue import PipelineQueue, coalesce
+from utils.session import SessionMessage
+
+
+def drain(queue):
+    items = []
+    while not queue.empty():
+        items.append(queue.get_nowait())
+    return items
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        PipelineQueue(policy="lifo")
+    with pytest.raises(ValueError):
+        AsyncPipelineQueue(policy="lifo")
+
+
+def test_drop_oldest_keeps_the_latest_items():
+    queue = PipelineQueue(maxsize=2, policy="drop_oldest")
+    for chunk in (b"a", b"b", b"c"):
+        queue.put(chunk)
+    assert drain(queue) == [b"b", b"c"]
+    assert queue.dropped == 1
+
+
+def test_drop_oldest_never_drops_control_items():
+    queue = PipelineQueue(maxsize=2, policy="drop_oldest")
+    queue.put(END)
+    queue.put(b"a")
+    queue.put(b"b")
+    assert drain(queue) == [END, b"b"]
+
+
+def test_coalesce_merges_into_the_newest_item():
+    queue = PipelineQueue(maxsize=1, policy="coalesce")
+    queue.put(b"ab")
+    queue.put(b"cd")
+    assert drain(queue) == [b"abcd"]
+    assert queue.coalesced == 1
+
+
+def test_control_items_do_not_wait_for_room():
+    queue = PipelineQueue(maxsize=1)
+    queue.put(b"a")
+    queue.put(END, block=False)
+    assert drain(queue) == [b"a", END]
+
+
+def test_urgent_control_items_go_first():
+    queue = PipelineQueue()
+    queue.put(b"a")
+    cancel = Control.cancel("session", 1)
+    queue.put(cancel)
+    assert drain(queue) == [cancel, b"a"]
+
+
+def test_flush_keeps_control_items():
+    queue = PipelineQueue()
+    queue.put(SessionMessage("a", b"1"))
+    queue.put(END)
+    queue.put(SessionMessage("b", b"2"))
+    assert queue.flush(lambda item: item.session_id == "a") == 1
+    assert drain(queue) == [END, SessionMessage("b", b"2")]
+
+
+def test_last_wait():
+    queue = PipelineQueue()
+    assert queue.last_wait is None
+    queue.put(b"a")
+    queue.get()
+    assert queue.last_wait >= 0
+
+
+def test_coalesce_items():
+    assert np.array_equal(coalesce(np.zeros(2), np.ones(2)), [0, 0, 1, 1])
+    assert coalesce(("Hello", "en"), ("world", "en")) == ("Hello world", "en")
+    assert coalesce(("Hello", "en"), ("monde", "fr")) is None
+    assert coalesce(b"a", END) is None
+    assert coalesce(SessionMessage("a", b"1"), SessionMessage("b", b"2")) is None
+
+
+def test_coalesce_envelopes_of_the_same_utterance_only():
+    older = Envelope("Hello", session_id="a", turn=1)
+    merged = coalesce(older, older.derive("world"))
+    assert merged.payload == "Hello world" and merged.turn == 1
+    assert coalesce(older, Envelope("world", session_id="a", turn=1)) is None
+
+
+def test_async_queue_policies():
+    async def run():
+        dropping = AsyncPipelineQueue(maxsize=2, policy="drop_oldest")
+        coalescing = AsyncPipelineQueue(maxsize=1, policy="coalesce")
+        for chunk in (b"a", b"b", b"c"):
+            await dropping.put(chunk)
+            await coalescing.put(chunk)
+        cancel = Control.cancel("session", 1)
+        await dropping.put(cancel)
+        return drain(dropping), drain(coalescing)
+
+    dropped, coalesced = asyncio.run(run())
+    assert dropped == [Control.cancel("session", 1), b"b", b"c"]
+    assert coalesced == [b"abc"]
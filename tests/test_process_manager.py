@@ -0,0 +1,53 @@
+import time
+
+from baseHandler import BaseHandler
+from utils.envelope import END
+from utils.process_manager import MP_CONTEXT, HandlerSpec, ProcessManager, ProcessQueue
+
+
+class Doubler(BaseHandler):
+    def process(self, value):
+        yield 2 * value
+
+
+def put_values(queue, values):
+    for value in values:
+        queue.put(value)
+
+
+def test_queue_items_keep_their_order_and_wait_time_across_processes():
+    queue = ProcessQueue(name="values")
+    process = MP_CONTEXT.Process(target=put_values, args=(queue, [1, 2, 3]))
+    process.start()
+    assert [queue.get(timeout=30) for _ in range(3)] == [1, 2, 3]
+    assert queue.last_wait is not None and queue.last_wait >= 0
+    process.join()
+    assert queue.name == "values"
+
+
+def test_spec_arguments_are_found_by_name_or_position():
+    stop_event, queue_in, queue_out = object(), object(), object()
+    spec = HandlerSpec(Doubler, stop_event, queue_in=queue_in, queue_out=queue_out)
+    assert spec.argument("stop_event") is stop_event
+    assert spec.argument("queue_in") is queue_in
+    assert spec.argument("sessions") is None
+    assert spec.name == "Doubler"
+
+
+def test_handler_process_reports_metrics_and_stops_on_end():
+    stop_event = MP_CONTEXT.Event()
+    queue_in, queue_out = ProcessQueue(), ProcessQueue()
+    manager = ProcessManager([HandlerSpec(Doubler, stop_event, queue_in=queue_in, queue_out=queue_out)])
+    manager.start()
+    try:
+        queue_in.put(21)
+        assert queue_out.get(timeout=60) == 42
+        deadline = time.monotonic() + 30
+        while manager.get_metrics().get("Doubler", {}).get("inputs", 0) < 1 and time.monotonic() < deadline:
+            time.sleep(0.1)
+        assert manager.get_metrics()["Doubler"]["inputs"] == 1
+    finally:
+        # the handler waits for an input: `stop` wakes it up with `END` instead of terminating it
+        manager.stop(timeout=30)
+    assert manager.processes[0].exitcode == 0
+    assert queue_out.get(timeout=30) == END
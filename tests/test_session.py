@@ -0,0 +1,40 @@
+from utils.session import DEFAULT_SESSION_ID, SessionManager
+
+
+def test_a_manager_without_sessions_is_truthy():
+    sessions = SessionManager()
+    assert len(sessions) == 0
+    assert sessions
+
+
+def test_open_get_close():
+    sessions = SessionManager()
+    session = sessions.open("a")
+    assert sessions.open("a") is session
+    assert sessions.get("a") is session
+    assert session.should_listen.is_set()
+    assert len(sessions) == 1 and "a" in sessions
+    sessions.close("a")
+    assert "a" not in sessions
+    # a closed session is not resurrected
+    assert sessions.get("a") is not session
+    assert "a" not in sessions
+
+
+def test_default_session():
+    sessions = SessionManager()
+    assert sessions.get() is sessions.default
+    assert sessions.get(DEFAULT_SESSION_ID) is sessions.default
+    sessions.close(DEFAULT_SESSION_ID)
+    assert DEFAULT_SESSION_ID in sessions
+
+
+def test_interrupt():
+    sessions = SessionManager()
+    session = sessions.open("a")
+    interrupted = []
+    sessions.add_interrupt_listener(interrupted.append)
+    sessions.add_interrupt_listener(lambda session: 1 / 0)
+    assert sessions.interrupt("a") is session
+    assert session.turn == 1
+    assert interrupted == [session]
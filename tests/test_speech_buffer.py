@@ -0,0 +1,32 @@
+import numpy as np
+
+from VAD.vad_iterator import SpeechBuffer
+
+WINDOW = 512
+
+
+def test_speech_buffer_keeps_the_pre_roll_and_trims_the_silence():
+    buffer = SpeechBuffer(pre_roll=100, capacity=64)
+    audio = np.arange(1000, dtype=np.float32)
+    for start in range(0, 320, 32):
+        buffer.listen(audio[start : start + 32])
+    buffer.start(audio[320:352])
+    for start in range(352, 608, 32):
+        buffer.append(audio[start : start + 32], speech=True)
+    buffer.append(audio[608:640], speech=False)
+    buffer.append(audio[640:672], speech=False)
+    assert np.array_equal(buffer.emit(pad=40), audio[220:648])
+
+
+def test_speech_buffer_short_pre_roll():
+    buffer = SpeechBuffer(pre_roll=100)
+    buffer.listen(np.ones(30, dtype=np.float32))
+    buffer.start(np.full(10, 2, dtype=np.float32))
+    assert np.array_equal(buffer.emit(pad=0), [1] * 30 + [2] * 10)
+
+
+def test_speech_buffer_without_pre_roll():
+    buffer = SpeechBuffer(pre_roll=0)
+    buffer.listen(np.ones(WINDOW, dtype=np.float32))
+    buffer.start(np.full(WINDOW, 2, dtype=np.float32))
+    assert np.array_equal(buffer.emit(pad=0), np.full(WINDOW, 2))
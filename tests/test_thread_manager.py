@@ -0,0 +1,56 @@
+import threading
+
+import pytest
+
+from baseHandler import BaseHandler
+from utils.envelope import END
+from utils.pipeline_queue import PipelineQueue
+from utils.thread_manager import ThreadManager
+
+
+class Tagger(BaseHandler):
+    def setup(self, tag, release=None):
+        self.tag = tag
+        self.release = release
+
+    def process(self, value):
+        if self.release is not None:
+            # holds the first input until the test has queued the next ones
+            self.release.wait(timeout=30)
+        yield f"{self.tag}:{value}"
+
+
+def test_hot_swap_hands_the_stage_over_between_two_items():
+    stop_event = threading.Event()
+    queue_in, queue_out = PipelineQueue(), PipelineQueue()
+    release = threading.Event()
+    old = Tagger(stop_event, queue_in, queue_out, setup_kwargs={"tag": "old", "release": release})
+    new = Tagger(stop_event, queue_in, queue_out, setup_kwargs={"tag": "new"})
+    events = []
+    old.add_listener(lambda event, payload: events.append(event))
+    manager = ThreadManager([old])
+    manager.start()
+
+    queue_in.put(1)
+    queue_in.put(2)
+    handoff = manager.replace(old, new)
+    queue_in.put(3)
+    release.set()
+    assert handoff.done.wait(timeout=30)
+    outputs = [queue_out.get(timeout=30) for _ in range(3)]
+    manager.stop()
+
+    # nothing lost or processed twice, and the items queued before the switch are the old handler's
+    assert outputs == ["old:1", "old:2", "new:3"]
+    assert queue_out.get(timeout=30) == END
+    assert manager.find(queue_in) is new
+    # the listeners follow the stage
+    assert new.listeners == old.listeners and "output" in events
+
+
+def test_replacement_must_read_the_same_queue():
+    stop_event = threading.Event()
+    old = Tagger(stop_event, PipelineQueue(), PipelineQueue(), setup_kwargs={"tag": "old"})
+    new = Tagger(stop_event, PipelineQueue(), PipelineQueue(), setup_kwargs={"tag": "new"})
+    with pytest.raises(ValueError):
+        ThreadManager([old]).replace(old, new)
@@ -0,0 +1,18 @@
+from utils.utils import batch_bucket, batch_buckets, next_power_of_2
+
+
+def test_next_power_of_2():
+    assert [next_power_of_2(x) for x in (0, 1, 2, 3, 5, 8)] == [1, 1, 2, 4, 8, 8]
+
+
+def test_batch_buckets():
+    assert batch_buckets(1) == [1]
+    assert batch_buckets(8) == [1, 2, 4, 8]
+    assert batch_buckets(6) == [1, 2, 4, 6]
+
+
+def test_batch_bucket_is_a_bucket():
+    for max_batch_size in range(1, 10):
+        for batch_size in range(1, max_batch_size + 1):
+            bucket = batch_bucket(batch_size, max_batch_size)
+            assert bucket in batch_buckets(max_batch_size) and bucket >= batch_size
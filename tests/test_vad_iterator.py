@@ -0,0 +1,99 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from VAD.vad_iterator import MultiStreamVADIterator, VADIterator
+
+WINDOW = 512
+
+
+class LoudnessModel:
+    """
+    Batched model stand-in: a window is speech when it is loud.
+    """
+
+    def reset(self, slot):
+        pass
+
+    def __call__(self, slots, windows):
+        return (np.abs(windows).mean(axis=1) > 0.1).astype(np.float32)
+
+
+def speech(*segments):
+    """
+    Audio of (is speech, number of windows) segments, with a different value per sample.
+    """
+    samples = np.arange(sum(windows for _, windows in segments) * WINDOW, dtype=np.float32) % 100 / 1000
+    loudness = np.concatenate([np.full(windows * WINDOW, 0.5 if loud else 0.0) for loud, windows in segments])
+    return (samples + loudness).astype(np.float32)
+
+
+def test_multi_stream_utterance():
+    audio = speech((False, 3), (True, 4), (False, 5))
+    iterator = MultiStreamVADIterator(LoudnessModel(), min_silence_duration_ms=64, speech_pad_ms=32, capacity=1)
+    slots = [iterator.open(), iterator.open()]
+    started, utterances = [], []
+    for index in range(len(audio) // WINDOW):
+        window = audio[index * WINDOW : (index + 1) * WINDOW]
+        window_started, window_utterances = iterator(slots, np.stack([window, window]))
+        started.append(window_started)
+        utterances.extend(window_utterances)
+    assert [index for index, window_started in enumerate(started) if window_started.any()] == [3]
+    assert [position for position, _ in utterances] == [0, 1]
+    # 32 ms of pre-roll, the speech and 32 ms of the silence after it
+    for _, utterance in utterances:
+        assert np.array_equal(utterance, audio[2 * WINDOW : 8 * WINDOW])
+
+
+def test_multi_stream_matches_single_streams():
+    rng = np.random.default_rng(0)
+    streams = [speech(*[(bool(rng.integers(2)), int(rng.integers(1, 6))) for _ in range(12)]) for _ in range(4)]
+    singles = [VADIterator(LoudnessModel(), min_silence_duration_ms=100) for _ in streams]
+    expected = [
+        [
+            utterance
+            for index in range(len(audio) // WINDOW)
+            if (utterance := single(audio[index * WINDOW : (index + 1) * WINDOW])) is not None
+        ]
+        for single, audio in zip(singles, streams)
+    ]
+
+    iterator = MultiStreamVADIterator(LoudnessModel(), min_silence_duration_ms=100, capacity=1)
+    slots = [iterator.open() for _ in streams]
+    cursors = [0] * len(streams)
+    got = [[] for _ in streams]
+    while any(cursor + WINDOW <= len(audio) for cursor, audio in zip(cursors, streams)):
+        # a random subset of the streams in each call
+        ready = [stream for stream, audio in enumerate(streams) if cursors[stream] + WINDOW <= len(audio)]
+        batch = [stream for stream in ready if rng.random() < 0.6] or ready[:1]
+        windows = np.stack([streams[stream][cursors[stream] : cursors[stream] + WINDOW] for stream in batch])
+        _, utterances = iterator([slots[stream] for stream in batch], windows)
+        for position, utterance in utterances:
+            got[batch[position]].append(utterance)
+        for stream in batch:
+            cursors[stream] += WINDOW
+
+    assert any(expected)
+    for stream_expected, stream_got in zip(expected, got):
+        assert len(stream_expected) == len(stream_got)
+        assert all(np.array_equal(a, b) for a, b in zip(stream_expected, stream_got))
+
+
+def test_closed_slots_are_reused_clean():
+    iterator = MultiStreamVADIterator(LoudnessModel(), capacity=1)
+    slot = iterator.open()
+    iterator([slot], speech((True, 1)).reshape(1, -1))
+    iterator.close(slot)
+    assert iterator.open() == slot
+    assert not iterator.triggered[slot]
+    assert iterator.buffers[slot].length == 0
+    # more streams than the initial capacity
+    assert len({iterator.open() for _ in range(5)}) == 5
+
+
+def test_onnx_vad_does_not_import_torch():
+    # torch made unimportable: any import of it fails the run
+    code = "import sys; sys.modules['torch'] = None; import VAD.silero_onnx"
+    subprocess.run([sys.executable, "-c", code], check=True, cwd=Path(__file__).parents[1])
@@ -0,0 +1,286 @@
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from queue import Empty, Full
+from time import perf_counter
+
+from utils.envelope import END
+from utils.pipeline_queue import POLICIES, Handoff, coalesce, is_control, is_urgent
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncPipelineQueue(asyncio.Queue):
+    """
+    asyncio counterpart of PipelineQueue, used between the stages of the asyncio execution: same timestamps
+    (`last_wait`), same policies when full and control items (`Control`, `Handoff`) that never wait for room.
+    Threads (network and audio I/O handlers) use it through a `SyncQueueView`, once `bind` gave it the loop.
+    """
+
+    def __init__(self, maxsize=0, policy="block", name=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Queue policy should be one of {POLICIES}, got {policy}")
+        super().__init__(maxsize)
+        self.policy = policy
+        self.name = name
+        self.dropped = 0
+        self.coalesced = 0
+        self.last_wait = None
+        self.loop = None
+
+    def bind(self, loop):
+        self.loop = loop
+
+    def _init(self, maxsize):
+        self._queue = deque()
+
+    def _put(self, item):
+        self._queue.append((perf_counter(), item))
+
+    def _get(self):
+        put_time, item = self._queue.popleft()
+        self.last_wait = perf_counter() - put_time
+        return item
+
+    def put_nowait(self, item):
+        if self.full() and not is_control(item):
+            if self.policy == "coalesce" and self._coalesce_newest(item):
+                return
+            if not (self.policy == "drop_oldest" and self._drop_oldest()):
+                raise asyncio.QueueFull
+        if is_urgent(item):
+            self._queue.appendleft((perf_counter(), item))
+        else:
+            self._put(item)
+        self._unfinished_tasks += 1
+        self._finished.clear()
+        self._wakeup_next(self._getters)
+
+    async def put(self, item):
+        if is_control(item):
+            return self.put_nowait(item)
+        try:
+            return self.put_nowait(item)
+        except asyncio.QueueFull:
+            return await super().put(item)
+
+    def _drop_oldest(self):
+        for index, (_, queued) in enumerate(self._queue):
+            if not is_control(queued):
+                del self._queue[index]
+                self._unfinished_tasks -= 1
+                self.dropped += 1
+                if self.dropped == 1 or self.dropped % 100 == 0:
+                    logger.warning(f"{self.name or 'queue'} full, {self.dropped} items dropped so far")
+                return True
+        return False
+
+    def _coalesce_newest(self, item):
+        if not self._queue:
+            return False
+        put_time, newest = self._queue[-1]
+        merged = coalesce(newest, item)
+        if merged is None:
+            return False
+        # keep the timestamp of the older item, its content has been waiting since then
+        self._queue[-1] = (put_time, merged)
+        self.coalesced += 1
+        return True
+
+    def flush(self, predicate=lambda item: True):
+        """
+        Removes the queued items matching `predicate`, keeping the control items. Returns how many were removed.
+        Can be called from any thread.
+        """
+        if self.loop is not None and self.loop.is_running() and not in_loop(self.loop):
+            return call_in_loop(self.loop, self.flush, predicate)
+        kept = deque(
+            (put_time, item) for put_time, item in self._queue if is_control(item) or not predicate(item)
+        )
+        removed = len(self._queue) - len(kept)
+        self._queue = kept
+        self._unfinished_tasks -= removed
+        if self._unfinished_tasks == 0:
+            self._finished.set()
+        for _ in range(removed):
+            self._wakeup_next(self._putters)
+        return removed
+
+
+def in_loop(loop):
+    try:
+        return asyncio.get_running_loop() is loop
+    except RuntimeError:
+        return False
+
+
+def call_in_loop(loop, function, *args):
+    """
+    Calls `function(*args)` in the thread of `loop` and returns its result.
+    """
+
+    async def call():
+        return function(*args)
+
+    return asyncio.run_coroutine_threadsafe(call(), loop).result()
+
+
+class SyncQueueView:
+    """
+    The blocking `queue.Queue` interface of an `AsyncPipelineQueue`, for the handlers running in threads.
+    """
+
+    def __init__(self, queue):
+        self.queue = queue
+
+    def __getattr__(self, name):
+        return getattr(self.queue, name)
+
+    def run(self, coroutine, timeout=None):
+        if in_loop(self.queue.loop):
+            raise RuntimeError("SyncQueueView would block the event loop, use the AsyncPipelineQueue")
+        return asyncio.run_coroutine_threadsafe(
+            asyncio.wait_for(coroutine, timeout) if timeout is not None else coroutine, self.queue.loop
+        ).result()
+
+    def put(self, item, block=True, timeout=None):
+        if not block:
+            return self.put_nowait(item)
+        try:
+            self.run(self.queue.put(item), timeout)
+        except (asyncio.TimeoutError, FutureTimeoutError):
+            raise Full
+
+    def put_nowait(self, item):
+        try:
+            if in_loop(self.queue.loop):
+                return self.queue.put_nowait(item)
+            return call_in_loop(self.queue.loop, self.queue.put_nowait, item)
+        except asyncio.QueueFull:
+            raise Full
+
+    def get(self, block=True, timeout=None):
+        if not block:
+            return self.get_nowait()
+        try:
+            return self.run(self.queue.get(), timeout)
+        except (asyncio.TimeoutError, FutureTimeoutError):
+            raise Empty
+
+    def get_nowait(self):
+        try:
+            return call_in_loop(self.queue.loop, self.queue.get_nowait)
+        except asyncio.QueueEmpty:
+            raise Empty
+
+    def empty(self):
+        return self.queue.empty()
+
+    def qsize(self):
+        return self.queue.qsize()
+
+
+def sync_view(value):
+    return SyncQueueView(value) if isinstance(value, AsyncPipelineQueue) else value
+
+
+def async_creator(create):
+    """
+    Wraps the handler factory `create(handler_class, *args, **kwargs)` for the asyncio execution: the pipeline
+    stages (BaseHandler subclasses) are built as AsyncBaseHandlers, the other handlers (network and audio I/O),
+    which keep running in threads, get their queues through a `SyncQueueView`.
+    """
+    from asyncBaseHandler import asyncify
+    from baseHandler import BaseHandler
+
+    def create_async(handler_class, *args, **kwargs):
+        if issubclass(handler_class, BaseHandler):
+            return create(asyncify(handler_class), *args, **kwargs)
+        args = [sync_view(arg) for arg in args]
+        kwargs = {name: sync_view(value) for name, value in kwargs.items()}
+        return create(handler_class, *args, **kwargs)
+
+    return create_async
+
+
+class AsyncPipelineManager:
+    """
+    Same interface as ThreadManager, running the handlers in one asyncio event loop, in a thread of its own:
+    the AsyncBaseHandlers as tasks of the loop, the other handlers (network and audio I/O) in threads.
+    """
+
+    def __init__(self, handlers, queues=()):
+        self.handlers = handlers
+        self.queues = list(queues)
+        self.loop = None
+        self.thread = None
+        self.started = threading.Event()
+
+    def start(self):
+        self.thread = threading.Thread(target=asyncio.run, args=(self.serve(),), name="pipeline-loop")
+        self.thread.start()
+        self.started.wait()
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        for queue in self.queues:
+            queue.bind(self.loop)
+        self.started.set()
+        await asyncio.gather(*(self.run_handler(index) for index in range(len(self.handlers))))
+
+    async def run_handler(self, index):
+        # a handler returns its successor when it hands its stage over (see `replace`)
+        handler = self.handlers[index]
+        while handler is not None:
+            self.handlers[index] = handler
+            if hasattr(handler, "run_async"):
+                handler = await handler.run_async()
+            else:
+                handler = await asyncio.to_thread(handler.run)
+
+    def replace(self, old, new):
+        """
+        Same as `ThreadManager.replace`, `new` being an AsyncBaseHandler.
+        """
+        if new.queue_in is not old.queue_in:
+            raise ValueError("The replacement handler should read the same input queue")
+        handoff = Handoff(new)
+        call_in_loop(self.loop, old.queue_in.put_nowait, handoff)
+        return handoff
+
+    def find(self, queue_in):
+        """
+        The handler currently reading `queue_in`, if any.
+        """
+        for handler in self.handlers:
+            queue = getattr(handler, "queue_in", None)
+            if queue is queue_in or getattr(queue, "queue", None) is queue_in:
+                return handler
+        return None
+
+    def stop(self):
+        for handler in self.handlers:
+            handler.stop_event.set()
+        if self.loop is not None and self.loop.is_running():
+            # wakes up the handlers waiting for an input
+            call_in_loop(self.loop, self.put_end)
+        if self.thread is not None:
+            self.thread.join()
+
+    def put_end(self):
+        for handler in self.handlers:
+            queue_in = getattr(handler, "queue_in", None)
+            if queue_in is not None:
+                queue_in.put_nowait(END)
+
+    def get_metrics(self):
+        """
+        Latency histograms of every handler exposing some, keyed by handler class name.
+        """
+        return {
+            handler.__class__.__name__: handler.get_metrics()
+            for handler in self.handlers
+            if hasattr(handler, "get_metrics")
+        }
@@ -0,0 +1,98 @@
+import numpy as np
+
+SAMPLE_FORMATS = ("int16", "float32")
+
+
+def decode_pcm(chunk, sample_format="int16"):
+    """
+    The samples of `chunk`, raw PCM bytes in `sample_format` or a NumPy array, as an array viewing the same memory.
+    """
+    if isinstance(chunk, np.ndarray):
+        return chunk.reshape(-1)
+    if sample_format not in SAMPLE_FORMATS:
+        raise ValueError(f"The sample format should be one of {SAMPLE_FORMATS}, got {sample_format!r}")
+    return np.frombuffer(chunk, dtype=sample_format)
+
+
+def to_float32(samples, out=None):
+    """
+    int16 samples scaled to [-1, 1[ (float samples are kept as they are), written into `out` if given.
+    """
+    if out is None:
+        out = np.empty(len(samples), dtype=np.float32)
+    if samples.dtype == np.int16:
+        np.multiply(samples, 1 / 32768, out=out, casting="unsafe")
+    else:
+        out[:] = samples
+    return out
+
+
+class Resampler:
+    """
+    Streaming resampler of a float32 stream: the chunks can be of any size and the result does not depend on how
+    the stream is cut. When the input rate is a multiple of the output rate (48 or 32 kHz to 16 kHz), each group of
+    input samples is averaged, which also filters what would alias; otherwise the samples are linearly interpolated,
+    which is enough for the VAD and the STT models.
+    """
+
+    def __init__(self, input_rate, output_rate):
+        self.input_rate = input_rate
+        self.output_rate = output_rate
+        self.factor = input_rate // output_rate if input_rate % output_rate == 0 else None
+        # input samples carried over to the next chunk: the incomplete group, or the last sample to interpolate from
+        self.carry = np.zeros(0, dtype=np.float32)
+        # position of the next output sample, in input samples from the first carried sample
+        self.position = 0.0
+
+    def __call__(self, samples):
+        samples = np.concatenate([self.carry, samples])
+        if self.factor is not None:
+            count = len(samples) // self.factor
+            self.carry = samples[count * self.factor :]
+            return samples[: count * self.factor].reshape(count, self.factor).mean(axis=1, dtype=np.float32)
+        if len(samples) < 2:
+            self.carry = samples
+            return np.zeros(0, dtype=np.float32)
+        step = self.input_rate / self.output_rate
+        positions = np.arange(self.position, len(samples) - 1, step)
+        self.position = (positions[-1] + step if len(positions) else self.position) - (len(samples) - 1)
+        self.carry = samples[-1:]
+        return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+class AudioReframer:
+    """
+    Cuts a stream of audio chunks of any size into the fixed-size windows a model takes (512 samples at 16 kHz for
+    Silero), as float32. The samples are converted straight into a buffer allocated once (doubled if a chunk does
+    not fit), and the windows are returned as a view of it: no array is allocated per chunk or per window.
+    `push` adds a chunk and returns the complete windows, valid until the next `push`; the incomplete window waits
+    for the next chunk.
+    """
+
+    def __init__(self, window_size, capacity=None):
+        self.window_size = window_size
+        self.buffer = np.zeros(capacity or 32 * window_size, dtype=np.float32)
+        self.start = 0
+        self.end = 0
+
+    def push(self, chunk, sample_format="int16"):
+        samples = decode_pcm(chunk, sample_format)
+        # the windows returned by the last call are done with: the incomplete one moves to the front
+        pending = self.end - self.start
+        if self.start:
+            self.buffer[:pending] = self.buffer[self.start : self.end]
+            self.start, self.end = 0, pending
+        if pending + len(samples) > len(self.buffer):
+            grown = np.zeros(max(2 * len(self.buffer), pending + len(samples)), dtype=np.float32)
+            grown[:pending] = self.buffer[:pending]
+            self.buffer = grown
+        to_float32(samples, out=self.buffer[self.end : self.end + len(samples)])
+        self.end += len(samples)
+        count = (self.end - self.start) // self.window_size
+        windows = self.buffer[self.start : self.start + count * self.window_size].reshape(count, self.window_size)
+        self.start += count * self.window_size
+        return windows
+
+    def reset(self):
+        self.start = 0
+        self.end = 0
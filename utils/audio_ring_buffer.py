@@ -0,0 +1,208 @@
+import logging
+import weakref
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from queue import Empty, Full
+
+import numpy as np
+
+from utils.envelope import END, is_end
+from utils.process_manager import MP_CONTEXT
+
+logger = logging.getLogger(__name__)
+
+# header cursors, int64; CLOSED is 0, or 1 + the number of slots written before `END`
+WRITTEN, READ, CLOSED, DROPPED = range(4)
+HEADER_SIZE = 4
+
+
+def _attach(name):
+    try:
+        return SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 registers every attachment with the resource tracker, which would unlink the
+        # segment when the attaching process exits
+        shm = SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+def _release(shm, owner):
+    shm.close()
+    if owner:
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class AudioRingBuffer:
+    """
+    Single-producer single-consumer ring of fixed-size audio slots in shared memory, usable in place of the
+    raw audio queues (`recv_audio_chunks_queue`, `send_audio_chunks_queue`) of the default session.
+    The slots are allocated once: `put` copies the samples into the next free slots (chunks longer than a
+    slot span several of them) and `get` returns a view of the oldest slot, valid until the next `get`, so no
+    array is allocated per chunk. The cursors live in the shared segment too and the buffer can be handed to
+    another process, which attaches to the same memory.
+    When the ring is full, `put` either blocks ("block") or overwrites the oldest unread slot ("drop_oldest").
+    `END` closes the ring: the reader gets it once the slots written before it are read. Like the `END` of a
+    queue, it is got once: the ring is then open again, e.g. for a pipeline restarted on the same buffers.
+    """
+
+    # the producer may reuse its buffer as soon as `put` returns
+    copies_on_put = True
+
+    def __init__(self, n_slots=512, slot_samples=512, dtype="int16", policy="block", name=None):
+        if policy not in ("block", "drop_oldest"):
+            raise ValueError(f"AudioRingBuffer policy should be 'block' or 'drop_oldest', got {policy}")
+        if n_slots < 3:
+            raise ValueError("AudioRingBuffer needs at least 3 slots")
+        self.n_slots = n_slots
+        self.slot_samples = slot_samples
+        self.dtype = np.dtype(dtype)
+        self.policy = policy
+        self.name = name
+        self.coalesced = 0
+        nbytes = (
+            HEADER_SIZE * 8 + n_slots * 4 + n_slots * slot_samples * self.dtype.itemsize
+        )
+        self._shm = SharedMemory(create=True, size=nbytes)
+        self._cond = MP_CONTEXT.Condition(MP_CONTEXT.Lock())
+        self._map(owner=True)
+        self._header[:] = 0
+
+    def _map(self, owner):
+        buf = self._shm.buf
+        self._header = np.ndarray((HEADER_SIZE,), dtype=np.int64, buffer=buf)
+        self._lengths = np.ndarray(
+            (self.n_slots,), dtype=np.int32, buffer=buf, offset=HEADER_SIZE * 8
+        )
+        self._slots = np.ndarray(
+            (self.n_slots, self.slot_samples),
+            dtype=self.dtype,
+            buffer=buf,
+            offset=HEADER_SIZE * 8 + self.n_slots * 4,
+        )
+        self._finalizer = weakref.finalize(self, _release, self._shm, owner)
+
+    def __getstate__(self):
+        return {
+            "shm_name": self._shm.name,
+            "cond": self._cond,
+            "n_slots": self.n_slots,
+            "slot_samples": self.slot_samples,
+            "dtype": self.dtype.str,
+            "policy": self.policy,
+            "name": self.name,
+        }
+
+    def __setstate__(self, state):
+        self.n_slots = state["n_slots"]
+        self.slot_samples = state["slot_samples"]
+        self.dtype = np.dtype(state["dtype"])
+        self.policy = state["policy"]
+        self.name = state["name"]
+        self.coalesced = 0
+        self._cond = state["cond"]
+        self._shm = _attach(state["shm_name"])
+        self._map(owner=False)
+
+    @property
+    def maxsize(self):
+        # two slots are never filled: the one whose view was handed out by the last `get`, and the one
+        # `drop_oldest` writes into when the ring is full
+        return self.n_slots - 2
+
+    @property
+    def dropped(self):
+        return int(self._header[DROPPED])
+
+    def qsize(self):
+        return int(self._header[WRITTEN] - self._header[READ])
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def _full(self):
+        return self._header[WRITTEN] - self._header[READ] >= self.maxsize
+
+    def _ended(self):
+        # the slots written before `END` are read (or were dropped)
+        closed = self._header[CLOSED]
+        return bool(closed) and self._header[READ] >= closed - 1
+
+    def put(self, chunk, block=True, timeout=None):
+        if is_end(chunk):
+            with self._cond:
+                self._header[CLOSED] = self._header[WRITTEN] + 1
+                self._cond.notify_all()
+            return
+        if isinstance(chunk, (bytes, bytearray, memoryview)):
+            samples = np.frombuffer(chunk, dtype=self.dtype)
+        else:
+            samples = np.asarray(chunk).reshape(-1)
+            if samples.dtype != self.dtype:
+                raise ValueError(f"{self.name or 'AudioRingBuffer'} holds {self.dtype} samples, got {samples.dtype}")
+
+        for start in range(0, len(samples), self.slot_samples):
+            part = samples[start : start + self.slot_samples]
+            with self._cond:
+                if self._full():
+                    if self.policy == "drop_oldest":
+                        self._header[READ] += 1
+                        self._header[DROPPED] += 1
+                    elif not self._cond.wait_for(
+                        lambda: not self._full(), timeout if block else 0
+                    ):
+                        raise Full
+                slot = self._header[WRITTEN] % self.n_slots
+                self._slots[slot, : len(part)] = part
+                self._lengths[slot] = len(part)
+                self._header[WRITTEN] += 1
+                self._cond.notify_all()
+
+    def get(self, block=True, timeout=None):
+        """
+        Returns a view of the oldest slot, only valid until the next call, or `END` once the slots written
+        before it are read.
+        """
+        with self._cond:
+            if not self._cond.wait_for(
+                lambda: self._header[WRITTEN] > self._header[READ] or self._ended(),
+                timeout if block else 0,
+            ):
+                raise Empty
+            if self._ended():
+                self._header[CLOSED] = 0
+                return END
+            slot = self._header[READ] % self.n_slots
+            self._header[READ] += 1
+            # the writer may now reuse the slot read before this one
+            self._cond.notify_all()
+            return self._slots[slot, : self._lengths[slot]]
+
+    def flush(self, predicate=lambda item: True):
+        """
+        Drops the unread slots when `predicate` holds for them. All the audio of a ring belongs to the same
+        session, so the oldest slot decides for all.
+        """
+        with self._cond:
+            removed = int(self._header[WRITTEN] - self._header[READ])
+            if not removed or not predicate(self._slots[self._header[READ] % self.n_slots]):
+                return 0
+            self._header[READ] = self._header[WRITTEN]
+            self._cond.notify_all()
+            return removed
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def put_nowait(self, chunk):
+        return self.put(chunk, block=False)
+
+    @property
+    def last_wait(self):
+        return None
+
+    def close(self):
+        self._finalizer()
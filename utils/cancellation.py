@@ -0,0 +1,32 @@
+import itertools
+
+import torch
+from transformers import StoppingCriteria, StoppingCriteriaList
+
+
+class CancelledCriteria(StoppingCriteria):
+    """
+    Stops a `generate` call as soon as `is_cancelled()` is true, e.g. once the user barged in on the turn it is
+    generating for. Checked after every decoding step.
+    """
+
+    def __init__(self, is_cancelled):
+        self.is_cancelled = is_cancelled
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full(
+            (input_ids.shape[0],), self.is_cancelled(), dtype=torch.bool, device=input_ids.device
+        )
+
+
+def cancellation_criteria(is_cancelled):
+    return StoppingCriteriaList([CancelledCriteria(is_cancelled)])
+
+
+def step_limit_criteria(n_steps):
+    """
+    Stops a `generate` call after `n_steps` decoding steps, leaving its shapes (e.g. of a static cache sized by
+    `max_new_tokens`) unchanged.
+    """
+    steps = itertools.count(1)
+    return cancellation_criteria(lambda: next(steps) >= n_steps)
@@ -0,0 +1,155 @@
+import hashlib
+import json
+import logging
+import os
+import platform
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# same directory as TORCHINDUCTOR_CACHE_DIR, set in s2s_pipeline.py
+CACHE_DIR = Path(__file__).resolve().parent.parent / "tmp"
+MANIFEST = CACHE_DIR / "compile_manifest.json"
+_manifest_lock = threading.Lock()
+# torch serializes every graph compiled in the process, whichever model it belongs to: the entries written by a
+# process share one artifact file, rewritten with all of them at each save, and the files of other processes are
+# left alone
+PROCESS_ARTIFACTS = CACHE_DIR / f"artifacts-{os.getpid()}-{int(time.time())}.bin"
+_loaded_artifacts = set()
+
+
+def uses_cuda_graphs(compile_mode, device):
+    """
+    Whether torch.compile captures CUDA graphs, which are recorded in each process, cache or not.
+    """
+    return device == "cuda" and compile_mode in ("reduce-overhead", "max-autotune")
+
+
+def read_manifest():
+    try:
+        with open(MANIFEST) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def clear_manifest():
+    """
+    Forgets every warmup, so that the next start warms up in full (see `--precompile`).
+    """
+    with _manifest_lock:
+        if MANIFEST.exists():
+            MANIFEST.unlink()
+
+
+class CompileCache:
+    """
+    Keeps track of the torch.compile warmups of a handler across restarts. The compiled graphs themselves live
+    in the inductor caches (TORCHINDUCTOR_CACHE_DIR) and, when torch supports it, in a portable artifact file
+    saved next to them; the manifest records for which configuration (model, dtype, compile mode, device, torch
+    version) and shape buckets they were produced.
+    When `valid` holds, the compiled graphs are found in the cache instead of being built, so the warmup can be
+    cut down to what still has to run in each process: a short generation per shape bucket to load them, unless
+    CUDA graphs have to be captured (see `short_warmup`).
+    """
+
+    def __init__(self, handler_name, **config):
+        import torch
+
+        self.handler_name = handler_name
+        self.config = {
+            **config,
+            "torch": torch.__version__,
+            "machine": torch.cuda.get_device_name() if config.get("device") == "cuda" else platform.machine(),
+        }
+        digest = hashlib.sha1(json.dumps(self.config, sort_keys=True, default=str).encode()).hexdigest()[:16]
+        self.key = f"{handler_name}-{digest}"
+        self.entry = read_manifest().get(self.key)
+
+    @property
+    def artifacts(self):
+        """
+        The artifact file of the entry, if it has one. Entries of older versions only had a flag, they are
+        compiled again.
+        """
+        name = self.entry.get("artifacts") if self.entry else None
+        return CACHE_DIR / name if isinstance(name, str) else None
+
+    def valid(self, shapes):
+        """
+        Whether every shape bucket in `shapes` has been compiled with this configuration before.
+        """
+        if self.entry is None:
+            return False
+        if self.entry.get("artifacts") and (self.artifacts is None or not self.artifacts.exists()):
+            return False
+        return set(map(str, shapes)) <= set(self.entry["shapes"])
+
+    def short_warmup(self, shapes):
+        """
+        Whether the warmup can be a short generation per shape bucket: the graphs are in the cache and there is
+        no CUDA graph to capture, which needs the longest generation to run in each process.
+        """
+        config = self.config
+        return self.valid(shapes) and not uses_cuda_graphs(config.get("compile_mode"), config.get("device"))
+
+    def load(self):
+        """
+        Loads the saved compiled artifacts, to call before the first compiled call.
+        """
+        import torch
+
+        torch._inductor.config.fx_graph_cache = True
+        artifacts = self.artifacts
+        if artifacts is None or not artifacts.exists():
+            return False
+        if not hasattr(torch.compiler, "load_cache_artifacts"):
+            return False
+        with _manifest_lock:
+            if artifacts in _loaded_artifacts:
+                # shared with the model of another handler, already loaded
+                return True
+            _loaded_artifacts.add(artifacts)
+        try:
+            torch.compiler.load_cache_artifacts(artifacts.read_bytes())
+            return True
+        except Exception as e:
+            logger.warning(f"{self.handler_name}: could not load the compiled artifacts ({e}), compiling again")
+            return False
+
+    def save(self, shapes):
+        """
+        Records the shape buckets just warmed up, and saves the compiled artifacts when torch supports it.
+        """
+        import torch
+
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        artifacts = None
+        with _manifest_lock:
+            if hasattr(torch.compiler, "save_cache_artifacts"):
+                saved = torch.compiler.save_cache_artifacts()
+                if saved is not None:
+                    PROCESS_ARTIFACTS.write_bytes(saved[0])
+                    artifacts = PROCESS_ARTIFACTS.name
+            manifest = read_manifest()
+            # the shapes compiled by an older process are in its artifact file, which this entry no longer uses
+            self.entry = {
+                "handler": self.handler_name,
+                "config": self.config,
+                "shapes": sorted(set(map(str, shapes))),
+                "artifacts": artifacts,
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }
+            manifest[self.key] = self.entry
+            tmp = MANIFEST.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp, "w") as f:
+                json.dump(manifest, f, indent=2)
+            os.replace(tmp, MANIFEST)
+            # the artifact files no entry refers to anymore
+            referenced = {entry.get("artifacts") for entry in manifest.values()}
+            for path in CACHE_DIR.glob("artifacts-*.bin"):
+                if path.name not in referenced and path != PROCESS_ARTIFACTS:
+                    path.unlink(missing_ok=True)
+        logger.info(f"{self.handler_name}: compiled warmup of {len(shapes)} shape buckets cached")
@@ -0,0 +1,120 @@
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("vad", "stt", "lm", "tts")
+# share of the cores of each stage in the "auto" split, once the VAD got its own core: the LLM decodes token by
+# token while the STT and the TTS run one call per utterance or sentence
+AUTO_WEIGHTS = {"stt": 1, "lm": 2, "tts": 1}
+
+
+class CpuBudget:
+    """
+    Intra-op threads and CPU cores given to a pipeline stage, so that the stages running at the same time (STT of
+    a turn, TTS of the previous one) do not each claim every core. `apply` is called by the thread (or process) that
+    runs the stage, before it runs: `torch.set_num_threads` and the affinity apply to the calling thread only, and
+    to the whole process in the process execution, which also sets the inter-op threads.
+    """
+
+    def __init__(self, threads, cpus=None, interop_threads=None):
+        self.threads = threads
+        self.cpus = sorted(cpus) if cpus else None
+        self.interop_threads = interop_threads
+
+    def apply(self, name=None):
+        if self.cpus:
+            if hasattr(os, "sched_setaffinity"):
+                os.sched_setaffinity(0, self.cpus)
+            else:
+                logger.warning("CPU affinity is not supported on this platform, only the thread budget applies")
+        try:
+            import torch
+        except ImportError:
+            return
+        # initializes the thread pool settings of this thread first, which would otherwise reset them on its
+        # first parallel op
+        torch.get_num_threads()
+        torch.set_num_threads(self.threads)
+        if self.interop_threads:
+            try:
+                torch.set_num_interop_threads(self.interop_threads)
+            except RuntimeError:
+                # only possible before the first inter-op parallel work of the process
+                logger.debug("inter-op threads already set")
+        logger.debug(f"{name or 'stage'}: {self}")
+
+    def __repr__(self):
+        cpus = format_cpus(self.cpus) if self.cpus else "any core"
+        return f"CpuBudget({self.threads} thread{'s' if self.threads > 1 else ''} on {cpus})"
+
+
+def available_cpus():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def parse_cpus(spec):
+    """
+    "0-3,8" -> [0, 1, 2, 3, 8]
+    """
+    cpus = []
+    for part in spec.split(","):
+        first, _, last = part.partition("-")
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def format_cpus(cpus):
+    ranges, start = [], None
+    for index, cpu in enumerate(cpus):
+        if start is None:
+            start = cpu
+        if index + 1 == len(cpus) or cpus[index + 1] != cpu + 1:
+            ranges.append(str(start) if start == cpu else f"{start}-{cpu}")
+            start = None
+    return ",".join(ranges)
+
+
+def auto_budgets(cpus=None):
+    """
+    Splits the available cores between the stages: one for the VAD, the others in disjoint sets weighted by
+    `AUTO_WEIGHTS`. With fewer than 4 cores the stages are not pinned and only share the threads.
+    """
+    cpus = cpus if cpus is not None else available_cpus()
+    if len(cpus) < 4:
+        threads = max(1, (len(cpus) - 1) // len(AUTO_WEIGHTS))
+        return {"vad": CpuBudget(1), **{stage: CpuBudget(threads) for stage in AUTO_WEIGHTS}}
+    budgets = {"vad": CpuBudget(1, cpus[:1])}
+    remaining = cpus[1:]
+    total = sum(AUTO_WEIGHTS.values())
+    counts = {stage: max(1, len(remaining) * weight // total) for stage, weight in AUTO_WEIGHTS.items()}
+    # the cores left by the rounding go to the LLM
+    counts["lm"] += len(remaining) - sum(counts.values())
+    start = 0
+    for stage, count in counts.items():
+        budgets[stage] = CpuBudget(count, remaining[start : start + count])
+        start += count
+    return budgets
+
+
+def parse_budgets(spec, cpus=None):
+    """
+    `spec` is "auto" (see `auto_budgets`) or comma-separated `<stage>=<threads>[@<cpus>]`, e.g.
+    "vad=1@0,stt=3@1-3,lm=8@4-11,tts=4@12-15", cpus being a list of ranges joined by "+" (e.g. "0-3+8-11").
+    Stages not listed keep the torch defaults. Returns {stage: CpuBudget}.
+    """
+    if not spec:
+        return {}
+    if spec == "auto":
+        return auto_budgets(cpus)
+    budgets = {}
+    for item in spec.split(","):
+        stage, _, budget = item.partition("=")
+        stage = stage.strip()
+        if stage not in STAGES:
+            raise ValueError(f"CPU budget stage should be one of {STAGES}, got {stage!r}")
+        threads, _, stage_cpus = budget.partition("@")
+        budgets[stage] = CpuBudget(int(threads), parse_cpus(stage_cpus.replace("+", ",")) if stage_cpus else None)
+    return budgets
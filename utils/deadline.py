@@ -0,0 +1,43 @@
+from time import monotonic
+
+
+class DeadlineTracker:
+    """
+    Tells a handler which utterances are stale: those whose deadline (`Envelope.deadline`, set by the VAD) has
+    passed before the handler output anything for them. Once an utterance is started, its deadline no longer
+    applies to the handler, so that an answer the user already hears is not cut in the middle (e.g. the TTS keeps
+    synthesizing its next sentences).
+    Utterances are told apart by `Envelope.utterance`. A handler starts the utterances of a session in the order
+    they were created, so only the last one started is kept per session.
+    """
+
+    def __init__(self):
+        # session_id -> id of the last utterance started
+        self.started = {}
+
+    def is_started(self, envelope):
+        last = self.started.get(envelope.session_id)
+        return last is not None and envelope.utterance <= last
+
+    def expired(self, envelope):
+        return (
+            envelope is not None
+            and envelope.deadline is not None
+            and monotonic() > envelope.deadline
+            and not self.is_started(envelope)
+        )
+
+    def start(self, envelope):
+        """
+        Records the first output for the utterance of `envelope`. Returns False when it was already started.
+        """
+        if self.is_started(envelope):
+            return False
+        self.started[envelope.session_id] = envelope.utterance
+        return True
+
+    def forget(self, session_id):
+        """
+        Drops what is known of the session, once it is closed.
+        """
+        self.started.pop(session_id, None)
@@ -0,0 +1,142 @@
+import itertools
+from time import monotonic
+
+from utils.session import SessionMessage
+
+# ids of the utterances, in the order they are created
+_utterances = itertools.count()
+
+
+class Envelope:
+    """
+    Item passed between the pipeline stages, from the VAD to the TTS: the handler's `payload` and what the
+    stages need to know about it without looking inside it:
+    - `session_id` (None for the default session) and `turn`, the turn of the session the item belongs to,
+      so that every stage drops the items of an interrupted turn as soon as it gets them;
+    - `language`, the language code of the transcription and answer, once known;
+    - `utterance`, the id of the utterance the item comes from, shared by the items derived from it;
+    - `created` (time.monotonic) when the VAD emitted the utterance, and its `deadline`, if any;
+    - `stamps`, the (stage, time.monotonic) at which each stage output its first item for the utterance, for
+      per-turn latency accounting.
+    The audio leaves the TTS as a plain chunk, or in a `SessionMessage` for the sessions other than the default one.
+    """
+
+    __slots__ = ("payload", "session_id", "turn", "language", "created", "deadline", "stamps", "utterance")
+
+    def __init__(
+        self,
+        payload,
+        session_id=None,
+        turn=0,
+        language=None,
+        created=None,
+        deadline=None,
+        stamps=(),
+        utterance=None,
+    ):
+        self.payload = payload
+        self.session_id = session_id
+        self.turn = turn
+        self.language = language
+        self.created = monotonic() if created is None else created
+        self.deadline = deadline
+        self.stamps = stamps
+        self.utterance = next(_utterances) if utterance is None else utterance
+
+    def derive(self, payload):
+        """
+        Envelope of an output computed from this item.
+        """
+        return Envelope(
+            payload,
+            self.session_id,
+            self.turn,
+            self.language,
+            self.created,
+            self.deadline,
+            self.stamps,
+            utterance=self.utterance,
+        )
+
+    def stamp(self, stage):
+        self.stamps = self.stamps + ((stage, monotonic()),)
+
+    def latencies(self):
+        """
+        Seconds from the creation of the utterance to the first output of each stage.
+        """
+        return {stage: time - self.created for stage, time in self.stamps}
+
+    def __repr__(self):
+        return f"Envelope({self.payload!r}, session_id={self.session_id!r}, turn={self.turn})"
+
+
+class Control:
+    """
+    Control message travelling through the queues along with the items, never dropped and never waiting for room:
+    - "end" (`END`): the handler stops and passes it on, once the items queued before it are processed;
+    - "cancel": the turns of the session older than `turn` are interrupted, the handler stops working on them and
+      passes the message on, so that each stage learns it even without a shared `SessionManager` (process
+      execution);
+    - "flush": the handler drops the items of the session still in its input queue and passes the message on.
+    "cancel" and "flush" are queued ahead of the items.
+    """
+
+    __slots__ = ("kind", "session_id", "turn")
+
+    KINDS = ("end", "cancel", "flush")
+
+    def __init__(self, kind, session_id=None, turn=None):
+        if kind not in self.KINDS:
+            raise ValueError(f"Control kind should be one of {self.KINDS}, got {kind}")
+        self.kind = kind
+        self.session_id = session_id
+        self.turn = turn
+
+    @classmethod
+    def cancel(cls, session_id, turn):
+        return cls("cancel", session_id, turn)
+
+    @classmethod
+    def flush(cls, session_id):
+        return cls("flush", session_id)
+
+    @property
+    def urgent(self):
+        return self.kind != "end"
+
+    def __eq__(self, other):
+        return isinstance(other, Control) and (self.kind, self.session_id, self.turn) == (
+            other.kind,
+            other.session_id,
+            other.turn,
+        )
+
+    def __hash__(self):
+        return hash((self.kind, self.session_id, self.turn))
+
+    def __repr__(self):
+        return f"Control({self.kind!r}, session_id={self.session_id!r}, turn={self.turn!r})"
+
+
+END = Control("end")
+
+
+def is_end(item):
+    """
+    The end of the stream: `END`, or b"END" as sent by the clients and older handlers.
+    """
+    if isinstance(item, Control):
+        return item.kind == "end"
+    return isinstance(item, bytes) and item == b"END"
+
+
+def to_client(item):
+    """
+    `item` as handed to the clients: the payload, in a `SessionMessage` for the sessions other than the default one.
+    """
+    if not isinstance(item, Envelope):
+        return item
+    if item.session_id is None:
+        return item.payload
+    return SessionMessage(item.session_id, item.payload)
@@ -0,0 +1,91 @@
+"""
+Profiles the import time of the entry points and of every registered backend, each in a fresh interpreter so
+that nothing is cached, and lists their heaviest dependencies:
+
+    python -m utils.import_profile
+    python -m utils.import_profile s2s_pipeline stt:whisper tts:melo
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+from utils.registry import REGISTRIES
+
+ROOT = Path(__file__).resolve().parent.parent
+ENTRY_POINTS = {
+    "s2s_pipeline": "s2s_pipeline",
+    "websocket bridge": "s2s_pipeline_bridge",
+}
+MARKER = "-- import profile --"
+IMPORT_TIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def targets():
+    """
+    {label: module} of the entry points and of the modules of every backend.
+    """
+    modules = dict(ENTRY_POINTS)
+    for kind, registry in REGISTRIES.items():
+        for name, path in registry.items():
+            modules[f"{kind}:{name}"] = path.rpartition(".")[0]
+    return modules
+
+
+def profile(module):
+    """
+    Returns the import time of `module` in seconds and its heaviest dependencies as (cumulative seconds, name),
+    or None and the error when it cannot be imported.
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([str(ROOT), str(ROOT / "python" / "api")]))
+    code = (
+        "import sys, time; sys.stderr.write('%s\\n'); start = time.perf_counter(); "
+        f"import {module}; print(time.perf_counter() - start)"
+    ) % MARKER
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    lines = result.stderr.splitlines()
+    # the modules imported by the interpreter itself are listed before the marker
+    lines = lines[lines.index(MARKER) + 1 :] if MARKER in lines else lines
+    if result.returncode != 0:
+        errors = [line for line in lines if not line.startswith("import time:")]
+        return None, errors[-1] if errors else f"exit code {result.returncode}"
+    dependencies = []
+    for line in lines:
+        match = IMPORT_TIME.match(line)
+        # the modules imported by the target and by its parent packages, not their own dependencies
+        if match and len(match.group(3)) <= 2 and not module.startswith(match.group(4)):
+            dependencies.append((int(match.group(2)) / 1e6, match.group(4)))
+    return float(result.stdout.strip().splitlines()[-1]), sorted(dependencies, reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "targets",
+        nargs="*",
+        help="Labels (e.g. s2s_pipeline, stt:whisper) or module names to profile. Default is all of them.",
+    )
+    parser.add_argument("--top", type=int, default=5, help="Number of dependencies listed per target. Default is 5.")
+    args = parser.parse_args()
+
+    modules = targets()
+    selected = args.targets or list(modules)
+    for label in selected:
+        seconds, details = profile(modules.get(label, label))
+        if seconds is None:
+            print(f"{label:<24} not importable: {details}")
+            continue
+        dependencies = ", ".join(f"{name} {dep_seconds:.2f}s" for dep_seconds, name in details[: args.top])
+        print(f"{label:<24} {seconds:6.2f} s  ({dependencies})")
+
+
+if __name__ == "__main__":
+    main()
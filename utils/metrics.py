@@ -0,0 +1,128 @@
+import math
+import threading
+
+
+class LatencyHistogram:
+    """
+    Streaming histogram of durations (in seconds) with fixed log-spaced buckets, so that memory stays constant
+    however long the pipeline runs. Percentiles are interpolated inside the bucket and are accurate to a few
+    percent with the default resolution.
+    """
+
+    def __init__(self, min_value=1e-5, max_value=1e3, buckets_per_decade=20):
+        self.min_value = min_value
+        self.buckets_per_decade = buckets_per_decade
+        n_buckets = math.ceil(math.log10(max_value / min_value) * buckets_per_decade)
+        # first bucket gathers everything below min_value, last one everything above max_value
+        self.counts = [0] * (n_buckets + 2)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def _bucket(self, value):
+        if value < self.min_value:
+            return 0
+        index = int(math.log10(value / self.min_value) * self.buckets_per_decade) + 1
+        return min(index, len(self.counts) - 1)
+
+    def _lower_bound(self, bucket):
+        if bucket == 0:
+            return 0.0
+        return self.min_value * 10 ** ((bucket - 1) / self.buckets_per_decade)
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[self._bucket(value)] += 1
+            self.count += 1
+            self.total += value
+            self.max = max(self.max, value)
+
+    def percentile(self, q):
+        """
+        q in [0, 100]. Returns 0 when nothing was observed.
+        """
+        with self._lock:
+            if self.count == 0:
+                return 0.0
+            rank = q / 100 * self.count
+            cumulated = 0
+            for bucket, count in enumerate(self.counts):
+                if count and cumulated + count >= rank:
+                    lower = self._lower_bound(bucket)
+                    # the last bucket has no upper bound but the largest value seen
+                    if bucket == len(self.counts) - 1:
+                        upper = self.max
+                    else:
+                        upper = min(self._lower_bound(bucket + 1), self.max)
+                    fraction = (rank - cumulated) / count
+                    return lower + max(upper - lower, 0.0) * fraction
+                cumulated += count
+            return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+class HandlerMetrics:
+    """
+    Instrumentation of a pipeline handler: how long its inputs waited in the input queue, and how long it
+    took to produce each output. Handlers consuming or producing audio also track their real-time factor,
+    i.e. processing time over audio duration, and the TTS the latency of each turn, from the end of speech to
+    its first audio.
+    """
+
+    def __init__(self):
+        self.queue_time = LatencyHistogram()
+        self.process_time = LatencyHistogram()
+        self.turn_latency = LatencyHistogram()
+        self.inputs = 0
+        self.outputs = 0
+        self.expired = 0
+        self.audio_seconds = 0.0
+        self.audio_process_seconds = 0.0
+
+    def observe_input(self, queue_time=None):
+        self.inputs += 1
+        if queue_time is not None:
+            self.queue_time.observe(queue_time)
+
+    def observe_output(self, process_time):
+        self.outputs += 1
+        self.process_time.observe(process_time)
+
+    def observe_turn(self, latency):
+        self.turn_latency.observe(latency)
+
+    def observe_expired(self):
+        self.expired += 1
+
+    def observe_audio(self, audio_seconds, process_seconds):
+        self.audio_seconds += audio_seconds
+        self.audio_process_seconds += process_seconds
+
+    @property
+    def real_time_factor(self):
+        if not self.audio_seconds:
+            return None
+        return self.audio_process_seconds / self.audio_seconds
+
+    def snapshot(self):
+        return {
+            "inputs": self.inputs,
+            "outputs": self.outputs,
+            "expired": self.expired,
+            "queue_time": self.queue_time.snapshot(),
+            "process_time": self.process_time.snapshot(),
+            "turn_latency": self.turn_latency.snapshot(),
+            "audio_seconds": self.audio_seconds,
+            "real_time_factor": self.real_time_factor,
+        }
@@ -0,0 +1,167 @@
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsServer:
+    """
+    Serves the runtime state of a pipeline in the Prometheus text format on `/metrics`, and its readiness on
+    `/ready` (200 once the models are loaded and warmed up, 503 before).
+    All the sources are callables, evaluated at scrape time, so that the server can be started before the
+    pipeline is built.
+    """
+
+    def __init__(
+        self,
+        host="0.0.0.0",
+        port=9100,
+        get_queues=dict,
+        get_handler_metrics=dict,
+        get_active_sessions=lambda: 0,
+        is_ready=lambda: False,
+    ):
+        self.host = host
+        self.port = port
+        self.get_queues = get_queues
+        self.get_handler_metrics = get_handler_metrics
+        self.get_active_sessions = get_active_sessions
+        self.is_ready = is_ready
+        self.httpd = None
+
+    def start(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith("/metrics"):
+                    self.reply(200, server.render(), "text/plain; version=0.0.4; charset=utf-8")
+                elif self.path.startswith("/ready"):
+                    ready = server.is_ready()
+                    self.reply(200 if ready else 503, "ready\n" if ready else "warming up\n", "text/plain")
+                else:
+                    self.reply(404, "not found\n", "text/plain")
+
+            def reply(self, code, body, content_type):
+                body = body.encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        self.httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        logger.info(f"Metrics served on http://{self.host}:{self.port}/metrics")
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    def render(self):
+        lines = []
+
+        def metric(name, kind, help, samples):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_str = ",".join(f'{key}="{val}"' for key, val in labels.items())
+                lines.append(f"{name}{{{label_str}}} {value}" if label_str else f"{name} {value}")
+
+        metric("s2s_ready", "gauge", "1 once all the models are loaded and warmed up.", [({}, int(bool(self.is_ready())))])
+        metric("s2s_active_sessions", "gauge", "Number of open sessions.", [({}, self.get_active_sessions())])
+        queues = self.get_queues()
+        metric(
+            "s2s_queue_depth",
+            "gauge",
+            "Number of items waiting in each pipeline queue.",
+            [({"queue": name}, queue.qsize()) for name, queue in queues.items()],
+        )
+        metric(
+            "s2s_queue_capacity",
+            "gauge",
+            "Capacity of each pipeline queue, 0 when unbounded.",
+            [({"queue": name}, queue.maxsize) for name, queue in queues.items()],
+        )
+        metric(
+            "s2s_queue_dropped_total",
+            "counter",
+            "Items dropped by the queues with the drop_oldest policy when full.",
+            [({"queue": name}, getattr(queue, "dropped", 0)) for name, queue in queues.items()],
+        )
+        metric(
+            "s2s_queue_coalesced_total",
+            "counter",
+            "Items merged into the previous one by the queues with the coalesce policy when full.",
+            [({"queue": name}, getattr(queue, "coalesced", 0)) for name, queue in queues.items()],
+        )
+
+        handler_metrics = self.get_handler_metrics()
+        for kind, help in (
+            ("queue_time", "Time spent by the inputs of each stage in its input queue."),
+            ("process_time", "Time taken by each stage to produce an output."),
+        ):
+            name = f"s2s_stage_{kind}_seconds"
+            samples = []
+            for handler, snapshot in handler_metrics.items():
+                histogram = snapshot[kind]
+                for quantile, key in (("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99")):
+                    samples.append(({"handler": handler, "quantile": quantile}, histogram[key]))
+            metric(name, "summary", help, samples)
+            for handler, snapshot in handler_metrics.items():
+                lines.append(f'{name}_sum{{handler="{handler}"}} {snapshot[kind]["sum"]}')
+                lines.append(f'{name}_count{{handler="{handler}"}} {snapshot[kind]["count"]}')
+
+        turns = {
+            handler: snapshot["turn_latency"]
+            for handler, snapshot in handler_metrics.items()
+            if snapshot.get("turn_latency", {}).get("count")
+        }
+        name = "s2s_turn_latency_seconds"
+        metric(
+            name,
+            "summary",
+            "Time from the end of speech to the first audio of the answer, measured by the TTS.",
+            [
+                ({"handler": handler, "quantile": quantile}, histogram[key])
+                for handler, histogram in turns.items()
+                for quantile, key in (("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99"))
+            ],
+        )
+        for handler, histogram in turns.items():
+            lines.append(f'{name}_sum{{handler="{handler}"}} {histogram["sum"]}')
+            lines.append(f'{name}_count{{handler="{handler}"}} {histogram["count"]}')
+
+        metric(
+            "s2s_stage_expired_total",
+            "counter",
+            "Inputs of each stage skipped or stopped because their deadline had passed (see --deadline_s).",
+            [({"handler": handler}, snapshot.get("expired", 0)) for handler, snapshot in handler_metrics.items()],
+        )
+        metric(
+            "s2s_real_time_factor",
+            "gauge",
+            "Processing time over audio duration of the stages consuming (STT) or producing (TTS) audio.",
+            [
+                ({"handler": handler}, snapshot["real_time_factor"])
+                for handler, snapshot in handler_metrics.items()
+                if snapshot["real_time_factor"] is not None
+            ],
+        )
+        metric(
+            "s2s_stage_audio_seconds_total",
+            "counter",
+            "Audio consumed or produced by each stage.",
+            [
+                ({"handler": handler}, snapshot["audio_seconds"])
+                for handler, snapshot in handler_metrics.items()
+                if snapshot["audio_seconds"]
+            ],
+        )
+        return "\n".join(lines) + "\n"
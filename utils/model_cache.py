@@ -0,0 +1,157 @@
+import copy
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from baseHandler import BaseHandler
+
+logger = logging.getLogger(__name__)
+
+
+def handler_memory(handler):
+    """
+    Bytes held by the torch modules among the handler's attributes (parameters and buffers), 0 when it has
+    none, e.g. for remote API handlers.
+    """
+    total, seen = 0, set()
+    for value in vars(handler).values():
+        if not (hasattr(value, "parameters") and hasattr(value, "buffers")):
+            continue
+        try:
+            tensors = [*value.parameters(), *value.buffers()]
+        except TypeError:
+            continue
+        for tensor in tensors:
+            if id(tensor) not in seen:
+                seen.add(id(tensor))
+                total += tensor.numel() * tensor.element_size()
+    return total
+
+
+class ModelCache:
+    """
+    LRU cache of constructed handlers, i.e. of loaded and warmed-up models, so that a pipeline rebuilt with the
+    same arguments (restart, reconnection, switching back to a previous model) reuses them instead of loading
+    them again. Use `create` as the `create` argument of `build_pipeline` and of the get_*_handler functions, and
+    give the handlers back with `checkin` once they no longer run.
+    Handlers are keyed by class, setup arguments and the queues, events and sessions they are bound to.
+    Handlers checked in are released, least recently used first, when the cache holds more than `max_bytes` of
+    model weights (None for no limit) or when they stay unused for `idle_timeout` seconds (None to keep them).
+    """
+
+    def __init__(self, max_bytes=None, idle_timeout=600.0):
+        self.max_bytes = max_bytes
+        self.idle_timeout = idle_timeout
+        # key -> [handler, bytes, in use, last checked in], least recently used first
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._sweeper = None
+
+    @staticmethod
+    def key(handler_class, args, kwargs):
+        setup_kwargs = kwargs.get("setup_kwargs", {})
+        return (
+            f"{handler_class.__module__}.{handler_class.__qualname__}",
+            repr(sorted(setup_kwargs.items())),
+            tuple(id(arg) for arg in (*args, *kwargs.get("setup_args", ()))),
+            id(kwargs.get("queue_in")),
+            id(kwargs.get("queue_out")),
+            id(kwargs.get("sessions")),
+        )
+
+    def create(self, handler_class, *args, **kwargs):
+        if not issubclass(handler_class, BaseHandler):
+            # the connections own threads and sockets, they are cheap to build anew
+            return handler_class(*args, **kwargs)
+        key = self.key(handler_class, args, kwargs)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and not entry[2]:
+                self.entries.move_to_end(key)
+                entry[2] = True
+                # the listeners belong to the pipeline it was used in
+                entry[0].listeners.clear()
+                self.hits += 1
+                logger.info(f"{handler_class.__name__} reused from the model cache")
+                return entry[0]
+            self.misses += 1
+        # the handler gets its own copy of the setup arguments: a setup changing them in place (e.g. adding the
+        # language to its gen_kwargs) would otherwise change the key of the next pipeline built with them
+        kwargs = {**kwargs, "setup_kwargs": copy.deepcopy(kwargs.get("setup_kwargs", {}))}
+        handler = handler_class(*args, **kwargs)
+        with self._lock:
+            if key not in self.entries:
+                self.entries[key] = [handler, handler_memory(handler), True, None]
+        return handler
+
+    def checkin(self, handlers):
+        """
+        Marks `handlers` as unused: they can be handed out again, or released once the cache needs room or
+        they have been idle for too long.
+        """
+        now = time.monotonic()
+        with self._lock:
+            for entry in self.entries.values():
+                if any(entry[0] is handler for handler in handlers):
+                    entry[2] = False
+                    entry[3] = now
+            evicted = self._evict()
+        self._release(evicted)
+        self._start_sweeper()
+
+    @property
+    def size(self):
+        return sum(entry[1] for entry in self.entries.values())
+
+    def _evict(self):
+        evicted = []
+        now = time.monotonic()
+        for key, (handler, nbytes, in_use, last_used) in list(self.entries.items()):
+            if in_use:
+                continue
+            too_big = self.max_bytes is not None and self.size > self.max_bytes
+            too_old = self.idle_timeout is not None and now - last_used >= self.idle_timeout
+            if too_big or too_old:
+                del self.entries[key]
+                evicted.append(handler)
+        return evicted
+
+    def _release(self, handlers):
+        for handler in handlers:
+            logger.info(f"{handler.__class__.__name__} released from the model cache")
+            handler.release()
+        if handlers:
+            try:
+                import torch
+
+                if torch.cuda.is_available():
+                    torch.cuda.empty_cache()
+            except ImportError:
+                pass
+
+    def _start_sweeper(self):
+        if self.idle_timeout is None or self._sweeper is not None:
+            return
+        self._sweeper = threading.Thread(target=self._sweep, daemon=True)
+        self._sweeper.start()
+
+    def _sweep(self):
+        while True:
+            time.sleep(min(60.0, max(1.0, self.idle_timeout / 4)))
+            with self._lock:
+                evicted = self._evict()
+            self._release(evicted)
+
+    def clear(self):
+        """
+        Releases every handler not in use.
+        """
+        with self._lock:
+            evicted = [entry[0] for entry in self.entries.values() if not entry[2]]
+            self.entries = OrderedDict(
+                (key, entry) for key, entry in self.entries.items() if entry[2]
+            )
+        self._release(evicted)
@@ -0,0 +1,180 @@
+import logging
+import threading
+from collections import deque
+from queue import Queue
+from time import perf_counter
+
+import numpy as np
+
+from utils.envelope import Control, Envelope
+from utils.session import SessionMessage
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ("block", "drop_oldest", "coalesce")
+
+
+class Handoff:
+    """
+    Control item asking the handler reading the queue to hand its stage over to `successor`, a handler already
+    set up on the same queues, once the items queued before it are processed. `done` is set when `successor`
+    has taken over.
+    """
+
+    def __init__(self, successor):
+        self.successor = successor
+        self.done = threading.Event()
+
+
+def is_control(item):
+    return isinstance(item, (Control, Handoff)) or (isinstance(item, bytes) and item == b"END")
+
+
+def is_urgent(item):
+    # "cancel" and "flush" overtake the queued items
+    return isinstance(item, Control) and item.urgent
+
+
+def coalesce(older, newer):
+    """
+    Merges two consecutive items of the same kind (audio chunks, sentences) into one, or returns None when they
+    cannot be merged.
+    """
+    if isinstance(older, SessionMessage) or isinstance(newer, SessionMessage):
+        if not (
+            isinstance(older, SessionMessage)
+            and isinstance(newer, SessionMessage)
+            and older.session_id == newer.session_id
+        ):
+            return None
+        merged = coalesce(older.payload, newer.payload)
+        return None if merged is None else SessionMessage(older.session_id, merged)
+    if isinstance(older, Envelope) or isinstance(newer, Envelope):
+        # only the items of the same utterance are merged
+        if not (
+            isinstance(older, Envelope)
+            and isinstance(newer, Envelope)
+            and older.utterance == newer.utterance
+        ):
+            return None
+        merged = coalesce(older.payload, newer.payload)
+        return None if merged is None else older.derive(merged)
+    if is_control(older) or is_control(newer):
+        return None
+    if isinstance(older, bytes) and isinstance(newer, bytes):
+        return older + newer
+    if isinstance(older, np.ndarray) and isinstance(newer, np.ndarray) and older.dtype == newer.dtype:
+        return np.concatenate([older, newer])
+    if isinstance(older, str) and isinstance(newer, str):
+        return f"{older} {newer}"
+    if isinstance(older, tuple) and isinstance(newer, tuple) and len(older) == len(newer) == 2:
+        # (text, language_code)
+        if isinstance(older[0], str) and isinstance(newer[0], str) and older[1] == newer[1]:
+            return (f"{older[0]} {newer[0]}", newer[1])
+    return None
+
+
+class PipelineQueue(Queue):
+    """
+    Queue used between the pipeline stages. Items are timestamped when put, so that the consumer can tell how
+    long the item it just got waited in the queue (`last_wait`).
+    With a `maxsize`, the `policy` decides what happens when the queue is full:
+    - "block": the producer waits for room, which propagates the backpressure upstream;
+    - "drop_oldest": the oldest item is dropped, for live audio where only the latest chunks matter;
+    - "coalesce": the new item is merged into the newest queued one (audio chunks, sentences), falling back to
+      blocking when they cannot be merged.
+    Control items (`Control`, `Handoff`) are never dropped and never wait for room; "cancel" and "flush" are
+    queued ahead of the items.
+    """
+
+    def __init__(self, maxsize=0, policy="block", name=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Queue policy should be one of {POLICIES}, got {policy}")
+        super().__init__(maxsize)
+        self.policy = policy
+        self.name = name
+        self.dropped = 0
+        self.coalesced = 0
+
+    def _init(self, maxsize):
+        self.queue = deque()
+        self._local = threading.local()
+
+    def _qsize(self):
+        return len(self.queue)
+
+    def _put(self, item):
+        self.queue.append((perf_counter(), item))
+
+    def _get(self):
+        put_time, item = self.queue.popleft()
+        self._local.wait = perf_counter() - put_time
+        return item
+
+    def put(self, item, block=True, timeout=None):
+        if is_control(item):
+            with self.not_full:
+                if is_urgent(item):
+                    self.queue.appendleft((perf_counter(), item))
+                else:
+                    self._put(item)
+                self.unfinished_tasks += 1
+                self.not_empty.notify()
+            return
+        if self.maxsize > 0 and self.policy != "block":
+            with self.not_full:
+                if self._qsize() >= self.maxsize:
+                    if self.policy == "drop_oldest" and self._drop_oldest():
+                        self._put(item)
+                        self.not_empty.notify()
+                        return
+                    if self.policy == "coalesce" and self._coalesce_newest(item):
+                        return
+        super().put(item, block, timeout)
+
+    def _drop_oldest(self):
+        for index, (_, queued) in enumerate(self.queue):
+            if not is_control(queued):
+                del self.queue[index]
+                self.unfinished_tasks -= 1
+                self.dropped += 1
+                if self.dropped == 1 or self.dropped % 100 == 0:
+                    logger.warning(f"{self.name or 'queue'} full, {self.dropped} items dropped so far")
+                return True
+        return False
+
+    def _coalesce_newest(self, item):
+        if not self.queue:
+            return False
+        put_time, newest = self.queue[-1]
+        merged = coalesce(newest, item)
+        if merged is None:
+            return False
+        # keep the timestamp of the older item, its content has been waiting since then
+        self.queue[-1] = (put_time, merged)
+        self.coalesced += 1
+        return True
+
+    def flush(self, predicate=lambda item: True):
+        """
+        Removes the queued items matching `predicate`, keeping the control items. Returns how many were removed.
+        """
+        with self.mutex:
+            kept = deque(
+                (put_time, item)
+                for put_time, item in self.queue
+                if is_control(item) or not predicate(item)
+            )
+            removed = len(self.queue) - len(kept)
+            self.queue = kept
+            self.unfinished_tasks -= removed
+            if removed:
+                self.not_full.notify_all()
+            return removed
+
+    @property
+    def last_wait(self):
+        """
+        Time spent in the queue by the last item got by the calling thread.
+        """
+        return getattr(self._local, "wait", None)
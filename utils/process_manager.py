@@ -0,0 +1,186 @@
+import inspect
+import logging
+import multiprocessing
+import multiprocessing.queues
+import threading
+from multiprocessing.synchronize import SEM_VALUE_MAX
+from queue import Empty, Full
+from time import monotonic
+
+from utils.envelope import END
+
+logger = logging.getLogger(__name__)
+
+# spawn rather than fork: CUDA and the tokenizers' thread pools do not survive a fork
+MP_CONTEXT = multiprocessing.get_context("spawn")
+
+# seconds between two reports of the latency histograms of a handler process
+METRICS_INTERVAL = 1.0
+
+
+class ProcessQueue(multiprocessing.queues.Queue):
+    """
+    Process-safe counterpart of `PipelineQueue`: items are timestamped when put so that the consumer can tell
+    how long they waited (`last_wait`). Items are pickled by a feeder thread, so `put` does not wait for the
+    consumer. Full queues always block: the drop and coalesce policies need a view of the queued items that
+    a pipe does not give.
+    """
+
+    def __init__(self, maxsize=0, name=None):
+        super().__init__(maxsize, ctx=MP_CONTEXT)
+        self.name = name
+        self.dropped = 0
+        self.coalesced = 0
+        self._local = threading.local()
+
+    def __getstate__(self):
+        return super().__getstate__() + (self.name,)
+
+    def __setstate__(self, state):
+        super().__setstate__(state[:-1])
+        self.name = state[-1]
+        self.dropped = 0
+        self.coalesced = 0
+        self._local = threading.local()
+
+    @property
+    def maxsize(self):
+        return 0 if self._maxsize == SEM_VALUE_MAX else self._maxsize
+
+    def put(self, item, block=True, timeout=None):
+        # monotonic() is system-wide, so the timestamp is meaningful in the consumer process
+        super().put((monotonic(), item), block, timeout)
+
+    def get(self, block=True, timeout=None):
+        put_time, item = super().get(block, timeout)
+        self._local.wait = monotonic() - put_time
+        return item
+
+    def qsize(self):
+        try:
+            return super().qsize()
+        except NotImplementedError:
+            # sem_getvalue() is not implemented on macOS
+            return 0
+
+    @property
+    def last_wait(self):
+        return getattr(self._local, "wait", None)
+
+
+class HandlerSpec:
+    """
+    Deferred construction of a handler: takes the same arguments as the handler class and builds it on
+    `build()`, so that the models are loaded in the process that runs the handler, after applying its
+    `cpu_budget`, if any.
+    """
+
+    cpu_budget = None
+
+    def __init__(self, handler_class, *args, **kwargs):
+        self.handler_class = handler_class
+        self.args = args
+        self.kwargs = kwargs
+
+    @property
+    def name(self):
+        return self.handler_class.__name__
+
+    def argument(self, name):
+        """
+        The value given to the argument `name` of the handler class, positionally or not, if any.
+        """
+        try:
+            arguments = inspect.signature(self.handler_class).bind_partial(*self.args, **self.kwargs).arguments
+        except TypeError:
+            return None
+        return arguments.get(name)
+
+    def build(self):
+        return self.handler_class(*self.args, **self.kwargs)
+
+
+def report_metrics(name, handler, metrics_queue, stop_event):
+    # the queue must not keep the process alive once the handler is done, reported or not
+    metrics_queue.cancel_join_thread()
+    while True:
+        metrics_queue.put((name, handler.get_metrics()))
+        if stop_event.wait(METRICS_INTERVAL):
+            break
+
+
+def run_handler(spec, log_level, metrics_queue=None):
+    logging.basicConfig(
+        level=log_level.upper(),
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    if spec.cpu_budget is not None:
+        spec.cpu_budget.apply(spec.name)
+    handler = spec.build()
+    done = threading.Event()
+    if metrics_queue is not None and hasattr(handler, "get_metrics"):
+        threading.Thread(
+            target=report_metrics, args=(spec.name, handler, metrics_queue, done), daemon=True
+        ).start()
+    try:
+        handler.run()
+    finally:
+        done.set()
+
+
+class ProcessManager:
+    """
+    Runs each handler in its own process, so that the Python-heavy stages do not contend on a single GIL.
+    Same interface as `ThreadManager`, but takes `HandlerSpec`s, and the stages must be connected with
+    `ProcessQueue`s and `MP_CONTEXT` events. Handlers are stopped the same way, through their stop_event and
+    `END` in their input queue. Each process reports the latency histograms of its handler every
+    `METRICS_INTERVAL` seconds, and `get_metrics` returns the last reports.
+    """
+
+    def __init__(self, handler_specs, log_level="info"):
+        self.handlers = handler_specs
+        self.log_level = log_level
+        self.processes = []
+        self.metrics_queue = MP_CONTEXT.Queue()
+        self.metrics = {}
+
+    def start(self):
+        for spec in self.handlers:
+            process = MP_CONTEXT.Process(
+                target=run_handler, args=(spec, self.log_level, self.metrics_queue), name=spec.name
+            )
+            self.processes.append(process)
+            process.start()
+
+    def stop(self, timeout=10):
+        for spec in self.handlers:
+            stop_event = spec.argument("stop_event")
+            if stop_event is not None:
+                stop_event.set()
+        for spec in self.handlers:
+            # wakes up the handlers waiting for an input
+            queue_in = spec.argument("queue_in")
+            if queue_in is not None:
+                try:
+                    queue_in.put(END, timeout=timeout)
+                except Full:
+                    pass
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning(f"{process.name} did not stop within {timeout} s, terminating it")
+                process.terminate()
+                process.join()
+
+    def get_metrics(self):
+        """
+        Latency histograms of every handler exposing some, keyed by handler class name, as last reported by
+        their process.
+        """
+        while True:
+            try:
+                name, metrics = self.metrics_queue.get_nowait()
+            except Empty:
+                break
+            self.metrics[name] = metrics
+        return dict(self.metrics)
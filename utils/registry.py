@@ -0,0 +1,59 @@
+import importlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# where each backend selectable with --vad, --stt, --llm and --tts lives: the module is only imported once the backend
+# is selected, so that the CLI does not pay for the dependencies of the backends it does not use
+STT_HANDLERS = {
+    "whisper": "STT.whisper_stt_handler.WhisperSTTHandler",
+    "whisper-mlx": "STT.lightning_whisper_mlx_handler.LightningWhisperSTTHandler",
+    "faster-whisper": "STT.faster_whisper_handler.FasterWhisperSTTHandler",
+    "paraformer": "STT.paraformer_handler.ParaformerSTTHandler",
+    "moonshine": "STT.moonshine_handler.MoonshineSTTHandler",
+    "stub": "STT.stub_stt_handler.StubSTTHandler",
+}
+LLM_HANDLERS = {
+    "transformers": "LLM.language_model.LanguageModelHandler",
+    "open_api": "LLM.openai_api_language_model.OpenApiModelHandler",
+    "mlx-lm": "LLM.mlx_language_model.MLXLanguageModelHandler",
+    "stub": "LLM.stub_language_model.StubLanguageModelHandler",
+}
+TTS_HANDLERS = {
+    "parler": "TTS.parler_handler.ParlerTTSHandler",
+    "melo": "TTS.melo_handler.MeloTTSHandler",
+    "chatTTS": "TTS.chatTTS_handler.ChatTTSHandler",
+    "facebookMMS": "TTS.facebookmms_handler.FacebookMMSTTSHandler",
+    "stub": "TTS.stub_tts_handler.StubTTSHandler",
+}
+VAD_HANDLERS = {
+    "silero": "VAD.vad_handler.VADHandler",
+    "silero-onnx": "VAD.silero_onnx.SileroOnnxVADHandler",
+}
+REGISTRIES = {
+    "vad": VAD_HANDLERS,
+    "stt": STT_HANDLERS,
+    "llm": LLM_HANDLERS,
+    "tts": TTS_HANDLERS,
+}
+
+# logged along with the error when a backend cannot be imported
+IMPORT_HINTS = {
+    "TTS.melo_handler.MeloTTSHandler": "You might need to run: python -m unidic download",
+}
+
+
+def load_handler(kind, name):
+    """
+    Imports and returns the handler class of backend `name` of pipeline part `kind` ("vad", "stt", "llm" or "tts").
+    """
+    registry = REGISTRIES[kind]
+    if name not in registry:
+        raise ValueError(f"The {kind.upper()} should be one of {', '.join(registry)}, got {name}.")
+    module_name, _, class_name = registry[name].rpartition(".")
+    try:
+        module = importlib.import_module(module_name)
+    except (ImportError, RuntimeError):
+        logger.error(f"Error importing {class_name}. {IMPORT_HINTS.get(registry[name], '')}".strip())
+        raise
+    return getattr(module, class_name)
@@ -0,0 +1,133 @@
+import json
+import logging
+import threading
+from functools import partial
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+
+from utils.envelope import Envelope
+from utils.session import SessionMessage
+
+logger = logging.getLogger(__name__)
+
+LATENCIES = ("transcript", "first_token", "first_sentence", "first_audio", "last_audio")
+
+
+def payload_text(payload):
+    if isinstance(payload, (Envelope, SessionMessage)):
+        payload = payload.payload
+    if isinstance(payload, tuple):
+        payload = payload[0]
+    return payload if isinstance(payload, str) else None
+
+
+class TurnTracker:
+    """
+    Timestamps each conversation turn as it goes through the pipeline, from the events of the VAD, STT, LM and
+    TTS handlers: end of speech (VAD output), transcript (STT output), first LLM token, first sentence (LM
+    output) and first and last audio chunks (TTS output).
+    Turns go through the stages in order, so each event belongs to the oldest turn that has reached the
+    previous stage but not this one.
+    """
+
+    def __init__(self, queues=(), should_listen=None):
+        self.queues = list(queues)
+        self.should_listen = should_listen
+        self.turns = []
+        self.busy = {}
+        self.label = None
+        self._lock = threading.Lock()
+
+    def attach(self, vad, stt, lm, tts):
+        for role, handler in (("vad", vad), ("stt", stt), ("lm", lm), ("tts", tts)):
+            self.busy[role] = False
+            handler.add_listener(partial(self.on_event, role))
+
+    def start_file(self, index, path):
+        # the turns detected from now on are labelled with the replayed file
+        self.label = Path(path).name
+
+    def _next(self, after, stage):
+        for turn in self.turns:
+            if after in turn and stage not in turn:
+                return turn
+        return None
+
+    def on_event(self, role, event, payload=None):
+        now = perf_counter()
+        with self._lock:
+            if event in ("batch_start", "batch_end"):
+                self.busy[role] = event == "batch_start"
+            elif role == "vad" and event == "output":
+                self.turns.append({"label": self.label, "end_of_speech": now})
+            elif role == "stt" and event == "output":
+                turn = self._next("end_of_speech", "transcript")
+                if turn is not None:
+                    turn["transcript"] = now
+                    turn["transcript_text"] = payload_text(payload)
+            elif role == "lm" and event == "first_token":
+                turn = self._next("transcript", "first_token")
+                if turn is not None:
+                    turn["first_token"] = now
+            elif role == "lm" and event == "output":
+                turn = self._next("first_token", "first_sentence")
+                if turn is not None:
+                    turn["first_sentence"] = now
+                    turn["answer"] = []
+                answering = [turn for turn in self.turns if "first_sentence" in turn]
+                if answering and payload_text(payload):
+                    answering[-1]["answer"].append(payload_text(payload))
+            elif role == "tts" and event == "output":
+                turn = self._next("first_sentence", "first_audio")
+                if turn is not None:
+                    turn["first_audio"] = now
+                speaking = [turn for turn in self.turns if "first_audio" in turn]
+                if speaking:
+                    speaking[-1]["last_audio"] = now
+
+    def idle(self):
+        """
+        True when no handler is processing, every queue is empty and the pipeline listens again, i.e. the last
+        turn got its full answer.
+        """
+        if self.should_listen is not None and not self.should_listen.is_set():
+            return False
+        with self._lock:
+            if any(self.busy.values()):
+                return False
+        return all(queue.empty() for queue in self.queues)
+
+    def report(self):
+        turns = []
+        for turn in self.turns:
+            start = turn["end_of_speech"]
+            entry = {"label": turn["label"]}
+            for stage in LATENCIES:
+                entry[f"{stage}_ms"] = round((turn[stage] - start) * 1000, 1) if stage in turn else None
+            entry["transcript"] = turn.get("transcript_text")
+            entry["answer"] = " ".join(turn.get("answer", []))
+            turns.append(entry)
+
+        summary = {}
+        for stage in LATENCIES:
+            values = [turn[f"{stage}_ms"] for turn in turns if turn[f"{stage}_ms"] is not None]
+            if values:
+                summary[f"{stage}_ms"] = {
+                    "count": len(values),
+                    "mean": round(float(np.mean(values)), 1),
+                    "p50": round(float(np.percentile(values, 50)), 1),
+                    "p95": round(float(np.percentile(values, 95)), 1),
+                    "max": round(float(np.max(values)), 1),
+                }
+        return {"turns": turns, "summary": summary}
+
+    def write_report(self, path, config=None):
+        report = self.report()
+        if config is not None:
+            report = {"config": config, **report}
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        logger.info(f"Latency report of {len(report['turns'])} turns written to {path}")
+        return report
@@ -0,0 +1,103 @@
+import logging
+import threading
+import uuid
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SESSION_ID = "default"
+
+# Items placed on the pipeline queues on behalf of a given conversation.
+# Untagged items belong to the default session.
+SessionMessage = namedtuple("SessionMessage", ["session_id", "payload"])
+
+
+def session_id_of(item):
+    # SessionMessage, Envelope and Control
+    return getattr(item, "session_id", None) or DEFAULT_SESSION_ID
+
+
+class Session:
+    """
+    Per-conversation state. Handlers keep everything they need between two turns of the same conversation
+    (VAD iterator, chat history, TTS speaker, ...) in `state`, so that the models themselves are loaded once
+    and shared by all the sessions.
+    """
+
+    def __init__(self, session_id, should_listen=None):
+        self.session_id = session_id
+        self.should_listen = should_listen if should_listen is not None else threading.Event()
+        self.state = {}
+        # incremented each time the user barges in: work started during an older turn is no longer wanted
+        self.turn = 0
+
+
+class SessionManager:
+    """
+    Registry of the conversations served by a pipeline. The default session is always present and uses
+    the pipeline-wide `should_listen` event, so that a single-user pipeline behaves as before.
+    """
+
+    def __init__(self, should_listen=None):
+        self._lock = threading.Lock()
+        self.default = Session(DEFAULT_SESSION_ID, should_listen)
+        self._sessions = {DEFAULT_SESSION_ID: self.default}
+        self._interrupt_listeners = []
+
+    def open(self, session_id=None):
+        session_id = session_id or uuid.uuid4().hex
+        with self._lock:
+            if session_id not in self._sessions:
+                session = Session(session_id)
+                session.should_listen.set()
+                self._sessions[session_id] = session
+            return self._sessions[session_id]
+
+    def get(self, session_id=None):
+        if session_id is None or session_id == DEFAULT_SESSION_ID:
+            return self.default
+        session = self._sessions.get(session_id)
+        if session is None:
+            # in-flight messages can outlive the session that produced them: serve them with a throwaway
+            # state rather than resurrecting the closed session
+            session = Session(session_id)
+        return session
+
+    def close(self, session_id):
+        if session_id == DEFAULT_SESSION_ID:
+            return
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def add_interrupt_listener(self, listener):
+        """
+        `listener(session)` is called whenever a session is interrupted, e.g. to flush the queues or to tell the
+        client to stop playing the answer.
+        """
+        self._interrupt_listeners.append(listener)
+
+    def interrupt(self, session_id=None):
+        """
+        Cancels the turn in progress of a session: handlers drop the outputs of older turns and stop the
+        generations running on their behalf.
+        """
+        session = self.get(session_id)
+        with self._lock:
+            session.turn += 1
+        for listener in self._interrupt_listeners:
+            try:
+                listener(session)
+            except Exception:
+                logger.exception("Interrupt listener failed")
+        return session
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
+
+    def __len__(self):
+        """Number of sessions opened on top of the default one."""
+        return len(self._sessions) - 1
+
+    def __bool__(self):
+        # a manager without any session opened yet still serves the default one
+        return True
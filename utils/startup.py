@@ -0,0 +1,46 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+logger = logging.getLogger(__name__)
+
+
+def build_stages(builders, parallel=True):
+    """
+    Calls the zero-argument `builders` ({stage name: builder}), which construct the handlers and so load and
+    warm up their models, concurrently in threads when `parallel`: model loading and warmup mostly run outside
+    the GIL (file reads, native kernels), so the startup takes about as long as the slowest stage instead of
+    the sum of all. The first failure is raised once every stage is done.
+    Returns the handlers and the timeline, {stage name: (start, end)} in seconds since the first start.
+    """
+    timeline = {}
+    origin = perf_counter()
+
+    def build(name):
+        start = perf_counter() - origin
+        try:
+            return builders[name]()
+        finally:
+            timeline[name] = (start, perf_counter() - origin)
+
+    if not parallel:
+        return {name: build(name) for name in builders}, timeline
+    with ThreadPoolExecutor(max_workers=len(builders), thread_name_prefix="startup") as executor:
+        futures = {name: executor.submit(build, name) for name in builders}
+    return {name: future.result() for name, future in futures.items()}, timeline
+
+
+def format_timeline(timeline, width=40):
+    """
+    One line per stage with its start, end and duration, and a bar showing when it was loading.
+    """
+    total = max((end for _, end in timeline.values()), default=0.0)
+    sequential = sum(end - start for start, end in timeline.values())
+    lines = [f"Startup timeline: {total:.1f} s (stages sum up to {sequential:.1f} s)"]
+    name_width = max((len(name) for name in timeline), default=0)
+    for name, (start, end) in sorted(timeline.items(), key=lambda item: item[1]):
+        first = int(start / total * width) if total else 0
+        last = max(first + 1, int(end / total * width)) if total else 1
+        bar = " " * first + "#" * (last - first) + " " * (width - last)
+        lines.append(f"  {name:<{name_width}} |{bar}| {start:6.1f} -> {end:6.1f} s ({end - start:.1f} s)")
+    return "\n".join(lines)
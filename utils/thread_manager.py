@@ -1,5 +1,8 @@
 import threading
 
+from utils.envelope import END
+from utils.pipeline_queue import Handoff
+
 
 class ThreadManager:
     """
@@ -11,13 +14,59 @@ class ThreadManager:
         self.threads = []
 
     def start(self):
-        for handler in self.handlers:
-            thread = threading.Thread(target=handler.run)
+        for index in range(len(self.handlers)):
+            thread = threading.Thread(target=self.run_handler, args=(index,))
             self.threads.append(thread)
             thread.start()
 
+    def run_handler(self, index):
+        # a handler returns its successor when it hands its stage over (see `replace`), which then runs in
+        # the same thread
+        handler = self.handlers[index]
+        if getattr(handler, "cpu_budget", None) is not None:
+            handler.cpu_budget.apply(handler.__class__.__name__)
+        while handler is not None:
+            self.handlers[index] = handler
+            handler = handler.run()
+
+    def replace(self, old, new):
+        """
+        Hot-swaps the handler `old` for `new`, which must be set up already and read the same input queue:
+        `old` processes the items queued before the switch, then `new` takes over in the same thread, without
+        any item being lost or processed twice. Returns the `Handoff`, whose `done` event is set once `new` runs.
+        """
+        if new.queue_in is not old.queue_in:
+            raise ValueError("The replacement handler should read the same input queue")
+        handoff = Handoff(new)
+        old.queue_in.put(handoff)
+        return handoff
+
+    def find(self, queue_in):
+        """
+        The handler currently reading `queue_in`, if any.
+        """
+        for handler in self.handlers:
+            if getattr(handler, "queue_in", None) is queue_in:
+                return handler
+        return None
+
     def stop(self):
         for handler in self.handlers:
             handler.stop_event.set()
+        for handler in self.handlers:
+            # wakes up the handlers waiting for an input
+            queue_in = getattr(handler, "queue_in", None)
+            if queue_in is not None:
+                queue_in.put(END)
         for thread in self.threads:
             thread.join()
+
+    def get_metrics(self):
+        """
+        Latency histograms of every handler exposing some, keyed by handler class name.
+        """
+        return {
+            handler.__class__.__name__: handler.get_metrics()
+            for handler in self.handlers
+            if hasattr(handler, "get_metrics")
+        }
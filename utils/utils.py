@@ -5,6 +5,47 @@ def next_power_of_2(x):
     return 1 if x == 0 else 2 ** (x - 1).bit_length()
 
 
+def batch_buckets(max_batch_size):
+    """
+    The batch sizes a compiled model is run with: the powers of two below `max_batch_size`, and `max_batch_size`.
+    """
+    buckets = [1]
+    while buckets[-1] * 2 < max_batch_size:
+        buckets.append(buckets[-1] * 2)
+    if max_batch_size > 1:
+        buckets.append(max_batch_size)
+    return buckets
+
+
+def batch_bucket(batch_size, max_batch_size):
+    """
+    The smallest of the `batch_buckets` holding `batch_size` items.
+    """
+    return min(next_power_of_2(batch_size), max_batch_size)
+
+
+def audio_duration(audio, sample_rate=16000):
+    """
+    Duration in seconds of a mono audio array, 0 for anything else.
+    """
+    if isinstance(audio, np.ndarray):
+        return audio.shape[-1] / sample_rate
+    return 0.0
+
+
+def ensure_nltk_data(*resources):
+    """
+    Downloads the NLTK resources (e.g. "tokenizers/punkt_tab") that are not available yet.
+    """
+    import nltk
+
+    for resource in resources:
+        try:
+            nltk.data.find(resource)
+        except (LookupError, OSError):
+            nltk.download(resource.rpartition("/")[2])
+
+
 def int2float(sound):
     """
     Taken from https://github.com/snakers4/silero-vad